@@ -1,19 +1,31 @@
 from django.contrib import admin
+from django.core.urlresolvers import reverse
+from django.utils.formats import date_format
+from django.utils.html import format_html, format_html_join
+from django.utils.timezone import localtime
 # Register your models here.
-from .models import Author, Genre, Book, BookInstance, Language
+from .models import Author, Genre, Book, BookInstance, Language, Hold, Task, \
+    ArchivedBookInstance, Branch
+from .archive import restore_copies
+from .holds import copy_status_changed
+from .paginators import EstimatedCountPaginator
+from .inlines import LazyInlineAdminMixin, LazyTabularInline
 
 #admin.site.register(Book)
 #admin.site.register(Author)
 admin.site.register(Genre)
+admin.site.register(Branch)
 #admin.site.register(BookInstance)
 admin.site.register(Language)
 #define the admin class
 
-class BookInline(admin.TabularInline):
+class BookInline(LazyTabularInline):
     model = Book
     extra = 0
+    # keep every inline row from rendering all genres and languages
+    raw_id_fields = ('genre', 'publication_language')
 
-class AuthorAdmin(admin.ModelAdmin):
+class AuthorAdmin(LazyInlineAdminMixin, admin.ModelAdmin):
     list_display = ('last_name', 'first_name', 'date_of_birth',
                     'date_of_death')
     fields = ['first_name', 'last_name', ('date_of_birth', 'date_of_death')]
@@ -22,26 +34,120 @@ class AuthorAdmin(admin.ModelAdmin):
 #register the admin class with the associated model
 admin.site.register(Author, AuthorAdmin)
 
-class BooksInstanceInline(admin.TabularInline):
+class BooksInstanceInline(LazyTabularInline):
     model = BookInstance
     extra = 0
+    # keep every inline row from rendering all users
+    raw_id_fields = ('borrower',)
+
+    def get_queryset(self, request):
+        # BookInstance.__str__ is shown for every row
+        return super(BooksInstanceInline, self).get_queryset(
+            request).select_related('book')
 
 #register the Admin classes for Book using the decorator
 @admin.register(Book)
-class BookAdmin(admin.ModelAdmin):
+class BookAdmin(LazyInlineAdminMixin, admin.ModelAdmin):
     list_display = ('title', 'author', 'display_genre')
+    list_select_related = ('author',)
+    # plain selects would render every author, genre and language
+    raw_id_fields = ('author', 'genre', 'publication_language')
     inlines = [BooksInstanceInline]
+    paginator = EstimatedCountPaginator
+    # skip the second, unfiltered COUNT(*) of the changelist
+    show_full_result_count = False
+    readonly_fields = ('archived_copies',)
+    # archived copies listed on the change page; the rest are linked
+    archived_copies_shown = 20
+
+    def get_queryset(self, request):
+        # display_genre reads the first three genres of every row
+        return super(BookAdmin, self).get_queryset(request).prefetch_related(
+            'genre')
+
+    def archived_copies(self, obj):
+        '''
+        The copies of the book moved out of the BookInstance inline by
+        "manage.py archive_copies", most recently archived first
+        '''
+        if obj.pk is None:
+            return '-'
+        copies = obj.bookinstance_set.include_archived().archived.order_by(
+            '-archived')
+        shown = list(copies[:self.archived_copies_shown])
+        if not shown:
+            return '-'
+        links = format_html_join(', ', '<a href="{}">{}</a> ({}, {})', (
+            (reverse('admin:catalog_archivedbookinstance_change',
+                     args=[copy.pk]),
+             copy.barcode or copy.pk, copy.get_status_display(),
+             date_format(localtime(copy.archived))) for copy in shown))
+        if len(shown) == self.archived_copies_shown:
+            links = format_html('{} <a href="{}?book__id__exact={}">all</a>',
+                                links, reverse(
+                                    'admin:catalog_archivedbookinstance_'
+                                    'changelist'), obj.pk)
+        return links
 
 #register the Admin classes for BookInstance using the decorator
 @admin.register(BookInstance)
 class BookInstanceAdmin(admin.ModelAdmin):
-    list_display = ('book', 'status', 'due_back', 'id')
-    list_filter = ('status', 'due_back')
+    list_display = ('book', 'status', 'due_back', 'barcode', 'id')
+    list_filter = ('branch', 'status', 'due_back')
+    # an exact match on the unique index
+    search_fields = ('=barcode',)
+    readonly_fields = ('barcode',)
+    # BookInstance.__str__ dereferences the book of every row
+    list_select_related = ('book',)
+    raw_id_fields = ('book', 'borrower')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     fieldsets = (
         (None, {
-            'fields': ('book', 'imprint', 'id')
+            'fields': ('book', 'branch', 'imprint', 'barcode', 'id')
         }),
         ('Availability', {
             'fields': ('status', 'due_back', 'borrower',)
         }),
     )
+
+    def save_model(self, request, obj, form, change):
+        super(BookInstanceAdmin, self).save_model(request, obj, form, change)
+        if 'status' in form.changed_data:
+            # a returned copy goes to the next patron in the hold queue
+            copy_status_changed(obj)
+
+@admin.register(ArchivedBookInstance)
+class ArchivedBookInstanceAdmin(admin.ModelAdmin):
+    list_display = ('id', 'barcode', 'book', 'status', 'archived')
+    list_filter = ('status',)
+    search_fields = ('=barcode',)
+    list_select_related = ('book',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = ['restore']
+
+    def has_add_permission(self, request):
+        # copies are archived by "manage.py archive_copies"
+        return False
+
+    def restore(self, request, queryset):
+        restored = restore_copies(queryset.values_list('pk', flat=True))
+        self.message_user(request, '%d copies restored' % restored)
+    restore.short_description = 'Restore selected copies'
+
+@admin.register(Hold)
+class HoldAdmin(admin.ModelAdmin):
+    list_display = ('book', 'patron', 'status', 'placed', 'expires')
+    list_filter = ('status',)
+    list_select_related = ('book', 'patron')
+    raw_id_fields = ('book', 'patron', 'copy')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ('name', 'status', 'attempts', 'run_after', 'created')
+    list_filter = ('status', 'name')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
@@ -1,5 +1,15 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class CatalogConfig(AppConfig):
     name = 'catalog'
+
+    def ready(self):
+        from .sqlite import configure_connection
+        from .usercache import check_shared_cache
+        check_shared_cache()
+        # registers the background tasks and signal receivers
+        from . import tasks, signals
+        connection_created.connect(configure_connection,
+                                   dispatch_uid='catalog_sqlite_tuning')
@@ -0,0 +1,106 @@
+'''
+Archival of dead copies.
+
+Copies in maintenance (withdrawn from circulation) and copies whose book
+was deleted (BookInstance.book is SET_NULL) stay in the BookInstance table
+forever, and every loan list, admin changelist and count reads past them.
+archive_copies() moves them to ArchivedBookInstance in batches, one
+transaction each, so the hot table only grows with the live collection;
+restore_copies() brings copies back, giving the available ones to waiting
+holds. Copies on loan or reserved for a hold are never archived. Both
+update the availability of books and the loan caches once per batch.
+
+BookInstance.objects.include_archived() reads both tables. Loan events have
+their own archive (ledger.archive_loan_events()).
+'''
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Q
+
+from . import usercache
+from .facets import sync_availability
+from .holds import allocate_copy
+from .models import ArchivedBookInstance, Book, BookInstance, Branch, Hold
+from .signals import batched_copy_deletes
+
+# statuses of the copies archive_copies() moves, besides orphaned ones
+ARCHIVED_STATUSES = ('m',)
+
+_FIELDS = ('id', 'barcode', 'book_id', 'imprint', 'due_back', 'status',
+           'borrower_id', 'branch_id')
+
+
+def archivable_copies(statuses=ARCHIVED_STATUSES):
+    '''
+    :param statuses:
+    :return: queryset of the copies archive_copies() moves
+    '''
+    return BookInstance.objects.filter(
+        Q(status__in=statuses) | Q(book__isnull=True)).exclude(
+        status__in=('o', 'r'))
+
+
+def archive_copies(statuses=ARCHIVED_STATUSES, batch_size=1000):
+    '''
+    Moves withdrawn and orphaned copies to ArchivedBookInstance,
+    batch_size copies per transaction
+    :param statuses: statuses of the copies to archive
+    :param batch_size:
+    :return: number of copies archived
+    '''
+    archived = 0
+    while True:
+        with transaction.atomic():
+            copies = list(archivable_copies(statuses).select_for_update()
+                          .order_by('pk').values(*_FIELDS)[:batch_size])
+            if not copies:
+                return archived
+            ArchivedBookInstance.objects.bulk_create(
+                ArchivedBookInstance(**copy) for copy in copies)
+            with batched_copy_deletes():
+                BookInstance.objects.filter(
+                    pk__in=[copy['id'] for copy in copies]).delete()
+            sync_availability(copy['book_id'] for copy in copies)
+            usercache.invalidate_loans(copy['borrower_id'] for copy in copies)
+        archived += len(copies)
+
+
+def restore_copies(ids):
+    '''
+    Moves archived copies back to BookInstance. A book, borrower or branch
+    deleted in the meantime is left unset. Available copies are set aside
+    for the next waiting hold of their book.
+    :param ids: ids of ArchivedBookInstances
+    :return: number of copies restored
+    '''
+    with transaction.atomic():
+        copies = list(ArchivedBookInstance.objects.select_for_update()
+                      .filter(pk__in=ids).values(*_FIELDS))
+        books = set(Book.objects.filter(pk__in={
+            copy['book_id'] for copy in copies}).values_list('pk', flat=True))
+        borrowers = set(User.objects.filter(pk__in={
+            copy['borrower_id'] for copy in copies}).values_list(
+            'pk', flat=True))
+        branches = set(Branch.objects.filter(pk__in={
+            copy['branch_id'] for copy in copies}).values_list(
+            'pk', flat=True))
+        for copy in copies:
+            if copy['branch_id'] not in branches:
+                copy['branch_id'] = None
+            if copy['book_id'] not in books:
+                copy['book_id'] = None
+            if copy['borrower_id'] not in borrowers:
+                copy['borrower_id'] = None
+        restored = BookInstance.objects.bulk_create(
+            BookInstance(**copy) for copy in copies)
+        ArchivedBookInstance.objects.filter(
+            pk__in=[copy['id'] for copy in copies]).delete()
+        sync_availability(copy['book_id'] for copy in copies)
+        usercache.invalidate_loans(copy['borrower_id'] for copy in copies)
+        waiting = set(Hold.objects.filter(
+            book_id__in={copy.book_id for copy in restored},
+            status='w').values_list('book_id', flat=True))
+        for copy in restored:
+            if copy.status == 'a' and copy.book_id in waiting:
+                allocate_copy(copy)
+    return len(copies)
@@ -0,0 +1,309 @@
+'''
+Prefix search ("autocomplete") over author names and book titles.
+
+Every process keeps a PrefixIndex per kind: a sorted list of (lowercased
+key, label, pk) searched with bisect. It is built on first use and kept
+current by the post_save/post_delete receivers in signals.py, which insert
+or remove the entries of a single object once its transaction commits.
+Changes made by other processes are noticed through a version number in
+the database (catalog/versions.py), within VERSION_CHECK_INTERVAL seconds:
+every change increments it and records the changed object under the new
+version (IndexChange), so an index that finds it moved reloads only the
+objects changed since its own version. It rebuilds when a version has no
+recorded change (invalidate(), or changes older than CHANGE_LOG_SIZE).
+
+Catalogues with more than AUTOCOMPLETE_INDEX_LIMIT rows are not held in
+memory: search() then asks the database, one range query per field on its
+lowercased, indexed copy (e.g. Book.title_key), so each query reads only
+the index entries of the matching prefix. Such a catalogue is counted
+again at most every SIZE_CHECK_INTERVAL seconds, with a query that stops
+after INDEX_LIMIT + 1 index entries, rather than loaded on every change.
+
+Writes that bypass signals and save() (queryset.update(), seed_library)
+must set the key columns and call invalidate().
+'''
+import bisect
+import sys
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import Author, Book, IndexChange, search_key
+from .versions import SharedVersion
+
+# most rows of a kind kept in memory by a process
+INDEX_LIMIT = getattr(settings, 'AUTOCOMPLETE_INDEX_LIMIT', 200000)
+# most results returned by search()
+MAX_RESULTS = getattr(settings, 'AUTOCOMPLETE_MAX_RESULTS', 20)
+# seconds between two counts of a catalogue too big to hold in memory
+SIZE_CHECK_INTERVAL = getattr(settings, 'AUTOCOMPLETE_SIZE_CHECK_INTERVAL',
+                              300)
+# recorded changes kept per index; a process further behind rebuilds
+CHANGE_LOG_SIZE = 10000
+
+
+def prefix_successor(prefix):
+    '''
+    :param prefix:
+    :return: the smallest string greater than every string starting with
+    prefix, None when there is none
+    '''
+    prefix = prefix.rstrip(chr(sys.maxunicode))
+    if not prefix:
+        return None
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+class PrefixIndex(object):
+    '''
+    In-memory prefix index of the objects of a model
+    '''
+
+    def __init__(self, name, model, fields, label):
+        '''
+        :param name: also names the shared version
+        :param model:
+        :param fields: the fields a prefix is matched against
+        :param label: format string of the label, filled with the values of
+        fields
+        '''
+        self.name = name
+        self.model = model
+        self.fields = fields
+        self.label = label
+        self.lock = threading.Lock()
+        self.shared_version = SharedVersion('autocomplete:' + name)
+        # sorted (key, label, pk) tuples, None when not held in memory
+        self.entries = None
+        # pk -> its entries
+        self.keys = {}
+        # version of the data in entries, None when it has to be rebuilt
+        self.version = None
+        # time.monotonic() of the last count that found more than
+        # INDEX_LIMIT objects, None when the objects are held in memory
+        self.too_big = None
+
+    def _entries_of(self, pk, values):
+        label = self.label % tuple(values)
+        return sorted({(search_key(value), label, pk) for value in values
+                       if value})
+
+    def _is_too_big(self):
+        '''
+        :return: whether there are more than INDEX_LIMIT objects, read from
+        the primary key index without counting every row
+        '''
+        return self.model.objects.order_by('pk').values_list(
+            'pk', flat=True)[INDEX_LIMIT:INDEX_LIMIT + 1].exists()
+
+    def rebuild(self, version):
+        '''
+        Loads every object, or drops the entries when there are more than
+        INDEX_LIMIT
+        :param version: the version of the data about to be read
+        :return:
+        '''
+        entries, keys, too_big = None, {}, None
+        if self._is_too_big():
+            too_big = time.monotonic()
+        else:
+            entries = []
+            for row in self.model.objects.values_list('pk', *self.fields):
+                keys[row[0]] = self._entries_of(row[0], row[1:])
+                entries.extend(keys[row[0]])
+            entries.sort()
+        with self.lock:
+            self.entries, self.keys, self.version = entries, keys, version
+            self.too_big = too_big
+
+    def catch_up(self, version):
+        '''
+        Applies the changes recorded since self.version, rebuilding when
+        some of them are not recorded
+        :param version: the stored version
+        :return:
+        '''
+        start = self.version
+        if start is None or not 0 < version - start <= CHANGE_LOG_SIZE:
+            self.rebuild(version)
+            return
+        pks = list(IndexChange.objects.filter(
+            index=self.name, version__gt=start,
+            version__lte=version).values_list('object_id', flat=True))
+        if len(pks) != version - start:
+            # some versions were not given to a change (invalidate())
+            self.rebuild(version)
+            return
+        pks = set(pks)
+        rows = {row[0]: row[1:] for row in self.model.objects.filter(
+            pk__in=pks).values_list('pk', *self.fields)}
+        with self.lock:
+            if self.version != start:
+                # caught up meanwhile by another thread
+                return
+            for pk in pks:
+                self._replace(pk, rows.get(pk))
+            self.version = version
+
+    def _remove(self, pk):
+        for entry in self.keys.pop(pk, ()):
+            position = bisect.bisect_left(self.entries, entry)
+            if (position < len(self.entries) and
+                    self.entries[position] == entry):
+                del self.entries[position]
+
+    def _replace(self, pk, values):
+        if self.entries is None:
+            return
+        self._remove(pk)
+        if values is not None:
+            self.keys[pk] = self._entries_of(pk, values)
+            for entry in self.keys[pk]:
+                bisect.insort(self.entries, entry)
+
+    def update(self, pk, values=None):
+        '''
+        Replaces (or with values None removes) the entries of an object,
+        called once its change is committed, and records the change for
+        the other processes
+        :param pk:
+        :param values: the values of fields
+        :return:
+        '''
+        with transaction.atomic():
+            version = self.shared_version.bump()
+            IndexChange.objects.create(index=self.name, version=version,
+                                       object_id=pk)
+        if version % 1000 == 0:
+            IndexChange.objects.filter(
+                index=self.name,
+                version__lte=version - CHANGE_LOG_SIZE).delete()
+        with self.lock:
+            self._replace(pk, values)
+            if self.entries is not None and self.version is not None and \
+                    version == self.version + 1:
+                self.version = version
+            # otherwise changed elsewhere as well, and the next search
+            # catches up reloading this object again, or not held in memory
+            # and the next search may count the objects again
+
+    def search(self, prefix, limit=MAX_RESULTS):
+        '''
+        :param prefix: matched case-insensitively against the start of
+        each of fields
+        :param limit:
+        :return: list of (pk, label), ordered by the matching value and
+        the label
+        '''
+        version = self.shared_version.current()
+        if version != self.version:
+            if self.too_big is None:
+                self.catch_up(version)
+            elif time.monotonic() - self.too_big >= SIZE_CHECK_INTERVAL:
+                self.rebuild(version)
+        entries = self.entries
+        if entries is None:
+            return self.search_database(prefix, limit)
+        prefix = search_key(prefix)
+        results, seen = [], set()
+        with self.lock:
+            position = bisect.bisect_left(entries, (prefix,))
+            while position < len(entries) and len(results) < limit:
+                key, label, pk = entries[position]
+                if not key.startswith(prefix):
+                    break
+                if pk not in seen:
+                    seen.add(pk)
+                    results.append((pk, label))
+                position += 1
+        return results
+
+    def database_queries(self, prefix, limit=MAX_RESULTS):
+        '''
+        :param prefix:
+        :param limit:
+        :return: a query per field, reading the first limit objects whose
+        key column is in the range of prefix
+        '''
+        prefix = search_key(prefix)
+        successor = prefix_successor(prefix)
+        queries = []
+        for field in self.fields:
+            key = field + '_key'
+            condition = {key + '__gte': prefix}
+            if successor is not None:
+                condition[key + '__lt'] = successor
+            queries.append(self.model.objects.filter(**condition).order_by(
+                key, 'pk').values_list(key, 'pk', *self.fields)[:limit])
+        return queries
+
+    def search_database(self, prefix, limit=MAX_RESULTS):
+        '''
+        Like search(), without the in-memory entries. The per-field results
+        are merged here: SQLite does not allow LIMIT in the parts of a
+        UNION.
+        :param prefix:
+        :param limit:
+        :return:
+        '''
+        prefix = search_key(prefix)
+        found = []
+        for query in self.database_queries(prefix, limit):
+            # a range of a collation other than the binary one may hold
+            # keys that do not start with the prefix
+            found.extend((key, self.label % tuple(row), pk)
+                         for key, pk, *row in query if key.startswith(prefix))
+        results, seen = [], set()
+        for _, label, pk in sorted(found):
+            if pk not in seen and len(results) < limit:
+                seen.add(pk)
+                results.append((pk, label))
+        return results
+
+
+INDEXES = {
+    'author': PrefixIndex('author', Author, ('last_name', 'first_name'),
+                          '%s, %s'),
+    'book': PrefixIndex('book', Book, ('title',), '%s'),
+}
+# model -> kind
+KINDS = {index.model: kind for kind, index in INDEXES.items()}
+
+
+def search(kind, prefix, limit=MAX_RESULTS):
+    '''
+    :param kind: 'author' or 'book'
+    :param prefix:
+    :param limit:
+    :return: list of (pk, label)
+    '''
+    return INDEXES[kind].search(prefix, min(limit, MAX_RESULTS))
+
+
+def object_changed(instance, deleted=False, using=None):
+    '''
+    post_save/post_delete handler of Author and Book
+    :param instance:
+    :param deleted:
+    :param using:
+    :return:
+    '''
+    index = INDEXES[KINDS[type(instance)]]
+    pk = instance.pk
+    values = None if deleted else [getattr(instance, field)
+                                   for field in index.fields]
+    transaction.on_commit(lambda: index.update(pk, values), using=using)
+
+
+def invalidate(kind=None):
+    '''
+    Makes every process rebuild its index(es) before the next search
+    :param kind: None for all
+    :return:
+    '''
+    for name in [kind] if kind else INDEXES:
+        index = INDEXES[name]
+        index.shared_version.bump()
+        index.version = index.too_big = None
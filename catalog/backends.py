@@ -0,0 +1,24 @@
+'''
+Authentication backends of the catalog
+'''
+from django.contrib.auth.backends import ModelBackend
+
+from .usercache import get_permissions
+
+
+class CachedPermissionsBackend(ModelBackend):
+    '''
+    ModelBackend that keeps each user's permission set in the cache, so
+    checks such as perms.catalog.can_mark_returned in base_generic.html do
+    not query the user and group permission tables on every request
+    '''
+
+    def get_all_permissions(self, user_obj, obj=None):
+        if not user_obj.is_active or user_obj.is_anonymous or \
+                obj is not None:
+            return set()
+        if not hasattr(user_obj, '_perm_cache'):
+            user_obj._perm_cache = get_permissions(
+                user_obj, lambda: super(CachedPermissionsBackend, self)
+                .get_all_permissions(user_obj))
+        return user_obj._perm_cache
@@ -0,0 +1,198 @@
+'''
+Copy barcodes and bulk scanning.
+
+Every BookInstance gets a short barcode when it is first saved: the next
+number of the "barcode" Sequence, zero-padded to nine digits, plus a Luhn
+check digit that catches misreads and typos. Numbers are handed out in
+blocks, so bulk loads take one counter update per batch. Copies created
+before barcodes existed get theirs from "manage.py backfill_barcodes".
+
+scan() applies a whole pile of scanned copies at once ("in": returned,
+"out": checked out to a patron) in one transaction: one locking SELECT,
+one UPDATE per action and batched bookkeeping (loan ledger, availability
+facets, patron loan caches, holds) instead of a save() per copy.
+'''
+import datetime
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from . import ledger, usercache
+from .facets import sync_availability
+from .holds import allocate_copy
+from .models import ArchivedBookInstance, BookInstance, Hold, Sequence
+
+BARCODE_LENGTH = 10
+# loan period of copies checked out by scan()
+LOAN_DAYS = getattr(settings, 'LOAN_DAYS', 21)
+# most barcodes handled by one scan()
+SCAN_BATCH_SIZE = getattr(settings, 'SCAN_BATCH_SIZE', 500)
+
+
+class InvalidBarcode(ValueError):
+    pass
+
+
+def next_values(name, count=1):
+    '''
+    Takes the next count numbers of a Sequence, creating it if needed
+    :param name:
+    :param count:
+    :return: range of the numbers
+    '''
+    with transaction.atomic():
+        if not Sequence.objects.filter(name=name).update(
+                value=F('value') + count):
+            try:
+                with transaction.atomic():
+                    Sequence.objects.create(name=name, value=count)
+            except IntegrityError:
+                # created concurrently
+                Sequence.objects.filter(name=name).update(
+                    value=F('value') + count)
+        last = Sequence.objects.get(name=name).value
+    return range(last - count + 1, last + 1)
+
+
+def luhn_check_digit(digits):
+    '''
+    :param digits: string of digits
+    :return:
+    '''
+    total = 0
+    for position, digit in enumerate(reversed(digits)):
+        value = int(digit) * (1 if position % 2 else 2)
+        total += value - 9 if value > 9 else value
+    return str(-total % 10)
+
+
+def format_barcode(number):
+    '''
+    :param number: a number of the "barcode" Sequence
+    :return: e.g. "0000000125"
+    '''
+    digits = '%09d' % number
+    return digits + luhn_check_digit(digits)
+
+
+def new_barcodes(count=1):
+    '''
+    Allocates barcodes for new copies
+    :param count:
+    :return: list of barcodes
+    '''
+    return [format_barcode(number)
+            for number in next_values('barcode', count)]
+
+
+def parse_barcode(value):
+    '''
+    Validates a scanned barcode
+    :param value:
+    :return: the barcode, without surrounding whitespace
+    :raises InvalidBarcode: on a value that is not a string, a wrong length
+    or check digit
+    '''
+    if not isinstance(value, str):
+        raise InvalidBarcode('Invalid barcode: %r' % (value,))
+    barcode = value.strip()
+    if (len(barcode) != BARCODE_LENGTH or not barcode.isdigit() or
+            luhn_check_digit(barcode[:-1]) != barcode[-1]):
+        raise InvalidBarcode('Invalid barcode: %s' % value)
+    return barcode
+
+
+def scan(action, barcodes, borrower=None, today=None, branch=None):
+    '''
+    Checks copies in or out by barcode in a single transaction
+    :param action: 'in' (returned: available again, or reserved for the
+    next hold) or 'out' (on loan to borrower)
+    :param barcodes: scanned barcodes
+    :param borrower: User, for 'out'
+    :param today: defaults to today
+    :param branch: the Branch scanning; copies of other branches are not
+    checked out. Returns are accepted at any branch.
+    :return: list of dicts (barcode, status or error), in scan order
+    '''
+    if action not in ('in', 'out'):
+        raise ValueError('Unknown scan action: %s' % action)
+    if action == 'out' and borrower is None:
+        raise ValueError('Checking out needs a borrower')
+    today = today or datetime.date.today()
+    due_back = today + datetime.timedelta(days=LOAN_DAYS)
+    results, valid = [], []
+    for value in barcodes:
+        try:
+            results.append({'barcode': parse_barcode(value)})
+            valid.append(results[-1]['barcode'])
+        except InvalidBarcode as error:
+            results.append({'barcode': value, 'error': str(error)})
+
+    with transaction.atomic():
+        copies = {copy.barcode: copy for copy in BookInstance.objects
+                  .select_for_update().filter(barcode__in=valid)}
+        missing = [barcode for barcode in valid if barcode not in copies]
+        archived = set(ArchivedBookInstance.objects.filter(
+            barcode__in=missing).values_list('barcode', flat=True)) \
+            if missing else set()
+        changed = {}
+        for result in results:
+            copy = copies.get(result['barcode'])
+            if 'error' in result:
+                continue
+            if copy is None:
+                result['error'] = 'Archived copy' \
+                    if result['barcode'] in archived else 'Unknown barcode'
+            elif action == 'in' and copy.status in ('a', 'r'):
+                # already back (reserved copies wait on the hold shelf)
+                result['status'] = copy.status
+            elif (action == 'out' and branch is not None and
+                  copy.branch_id != branch.pk):
+                result['error'] = 'Copy belongs to another branch'
+            elif action == 'out' and copy.status == 'o':
+                result['error'] = 'Already on loan'
+            elif (action == 'out' and copy.status == 'r' and
+                  copy.borrower_id != borrower.pk):
+                result['error'] = 'Reserved for another patron'
+            else:
+                changed[copy.pk] = copy
+                result['status'] = 'a' if action == 'in' else 'o'
+
+        if changed:
+            old_borrowers = [copy.borrower_id for copy in changed.values()]
+            if action == 'in':
+                fields = {'status': 'a', 'borrower': None, 'due_back': None}
+            else:
+                fields = {'status': 'o', 'borrower': borrower,
+                          'due_back': due_back}
+            BookInstance.objects.filter(pk__in=changed).update(**fields)
+            events = []
+            for copy in changed.values():
+                old_state = copy._loan_state
+                copy.status = fields['status']
+                copy.due_back = fields['due_back']
+                copy.borrower_id = borrower.pk if action == 'out' else None
+                event = ledger.classify(old_state, copy)
+                if event:
+                    events.append(ledger.make_event(copy, event))
+                copy._loan_state = ledger.loan_state(copy)
+            ledger.record(events)
+            sync_availability(copy.book_id for copy in changed.values())
+            usercache.invalidate_loans(
+                old_borrowers + [borrower.pk if borrower else None])
+            if action == 'out':
+                Hold.objects.filter(copy_id__in=changed, status='r').update(
+                    status='f')
+            else:
+                # returned copies go to the next patron in the queue
+                waiting = set(Hold.objects.filter(
+                    book_id__in={copy.book_id for copy in changed.values()},
+                    status='w').values_list('book_id', flat=True))
+                reserved = {copy.barcode for copy in changed.values()
+                            if copy.book_id in waiting and
+                            allocate_copy(copy, today=today)}
+                for result in results:
+                    if result['barcode'] in reserved:
+                        result['status'] = 'r'
+    return results
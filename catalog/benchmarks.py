@@ -0,0 +1,292 @@
+'''
+Benchmarks run through "manage.py benchmark <scenario>".
+
+Every scenario is a function taking the command's stdout, a duration in
+seconds and a scale (the size of the generated data set) and writing its
+results as plain text.
+'''
+import contextlib
+import datetime
+import http.client
+import os
+import random
+import socketserver
+import sqlite3
+import tempfile
+import threading
+import time
+from wsgiref.simple_server import WSGIServer, WSGIRequestHandler
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.wsgi import get_wsgi_application
+from django.db import connection
+from django.test import RequestFactory
+from django.utils import timezone
+
+from .facets import rebuild_facets
+from .holds import allocate_copy, expire_holds
+from .models import Book, BookInstance, Genre, Hold
+from .seed import seed_library
+from .sqlite import apply_pragmas
+
+SCENARIOS = {}
+
+
+def scenario(func):
+    '''
+    Registers a benchmark function under its name without the "bench_" prefix
+    :param func:
+    :return:
+    '''
+    SCENARIOS[func.__name__[len('bench_'):]] = func
+    return func
+
+
+def _run_threads(workers, duration):
+    '''
+    Runs every callable of workers in its own thread until duration elapses
+    :param workers: callables taking a threading.Event and returning a
+    (operations, errors) tuple
+    :param duration: seconds
+    :return: list of (operations, errors) tuples in the order of workers
+    '''
+    stop = threading.Event()
+    results = [None] * len(workers)
+
+    def run(index, worker):
+        results[index] = worker(stop)
+
+    threads = [threading.Thread(target=run, args=(index, worker))
+               for index, worker in enumerate(workers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+@contextlib.contextmanager
+def _scratch_database():
+    '''
+    Points the default connection at a throwaway test database (in memory
+    for SQLite) with the catalog tables, for scenarios that write data
+    '''
+    old_name = connection.creation.create_test_db(
+        verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+@scenario
+def bench_sqlite(stdout, duration=3.0, scale=20000, readers=4, writers=2):
+    '''
+    Concurrent point reads and single-row update transactions against a
+    SQLite file, with the SQLite defaults and with settings.SQLITE_PRAGMAS
+    '''
+    profiles = (('default', {}), ('tuned', settings.SQLITE_PRAGMAS))
+    stdout.write('%d readers, %d writers, %d rows, %.1fs per profile'
+                 % (readers, writers, scale, duration))
+    for label, pragmas in profiles:
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'bench.sqlite3')
+            setup = sqlite3.connect(path)
+            setup.execute('CREATE TABLE copy (id INTEGER PRIMARY KEY, '
+                          'imprint TEXT, due_back TEXT)')
+            setup.executemany(
+                'INSERT INTO copy (id, imprint, due_back) VALUES (?, ?, ?)',
+                ((i, 'Imprint %d' % i, '2017-01-01') for i in range(scale)))
+            setup.commit()
+            setup.close()
+
+            def connect():
+                # same 5s timeout that Django's sqlite3 backend uses
+                conn = sqlite3.connect(path, timeout=5,
+                                       check_same_thread=False)
+                apply_pragmas(conn.cursor(), pragmas)
+                return conn
+
+            def reader(stop):
+                conn, rand, ops = connect(), random.Random(), 0
+                while not stop.is_set():
+                    conn.execute('SELECT imprint, due_back FROM copy '
+                                 'WHERE id = ?',
+                                 (rand.randrange(scale),)).fetchone()
+                    ops += 1
+                conn.close()
+                return ops, 0
+
+            def writer(stop):
+                conn, rand, ops, errors = connect(), random.Random(), 0, 0
+                while not stop.is_set():
+                    try:
+                        with conn:
+                            conn.execute('UPDATE copy SET due_back = ? '
+                                         'WHERE id = ?',
+                                         ('2017-02-%02d' % rand.randint(1, 28),
+                                          rand.randrange(scale)))
+                        ops += 1
+                    except sqlite3.OperationalError:
+                        # "database is locked"
+                        errors += 1
+                conn.close()
+                return ops, errors
+
+            results = _run_threads([reader] * readers + [writer] * writers,
+                                   duration)
+        reads = sum(ops for ops, _ in results[:readers])
+        writes = sum(ops for ops, _ in results[readers:])
+        errors = sum(errors for _, errors in results)
+        stdout.write('%-8s reads/s: %10.0f  writes/s: %8.0f  locked: %d'
+                     % (label, reads / duration, writes / duration, errors))
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class _ThreadingWSGIServer(socketserver.ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+@scenario
+def bench_serving(stdout, duration=3.0, scale=16,
+                  paths=('/catalog/', '/catalog/books/', '/catalog/authors/')):
+    '''
+    Concurrent-client throughput of the WSGI application served by one
+    synchronous worker and by one threaded worker (what gunicorn's gthread
+    worker class does), with scale clients
+    '''
+    application = get_wsgi_application()
+    stdout.write('%d clients, %.1fs per server, paths: %s'
+                 % (scale, duration, ', '.join(paths)))
+    for label, server_class in (('sync', WSGIServer),
+                                ('threaded', _ThreadingWSGIServer)):
+        server = server_class(('127.0.0.1', 0), _QuietHandler)
+        server.request_queue_size = scale * 2
+        server.set_app(application)
+        port = server.server_address[1]
+        serve = threading.Thread(target=server.serve_forever)
+        serve.start()
+
+        def client(stop):
+            ops, errors, index = 0, 0, 0
+            while not stop.is_set():
+                conn = http.client.HTTPConnection('127.0.0.1', port,
+                                                  timeout=30)
+                try:
+                    conn.request('GET', paths[index % len(paths)])
+                    if conn.getresponse().status == 200:
+                        ops += 1
+                    else:
+                        errors += 1
+                except OSError:
+                    errors += 1
+                finally:
+                    conn.close()
+                index += 1
+            return ops, errors
+
+        results = _run_threads([client] * scale, duration)
+        server.shutdown()
+        serve.join()
+        server.server_close()
+        stdout.write('%-8s requests/s: %8.1f  errors: %d'
+                     % (label, sum(ops for ops, _ in results) / duration,
+                        sum(errors for _, errors in results)))
+
+
+@scenario
+def bench_holds(stdout, duration=None, scale=5000, returns=200):
+    '''
+    Cost of handing returned copies to the head of a hold queue, and of
+    expiring the resulting holds, for a queue of scale / 10 and of scale
+    holds on one title. duration is not used: the number of returns is
+    fixed so that both queue sizes do the same work.
+    '''
+    stdout.write('%d returns per queue size' % returns)
+    with _scratch_database():
+        for size in (scale // 10, scale):
+            Hold.objects.all().delete()
+            BookInstance.objects.all().delete()
+            User.objects.all().delete()
+            book = Book.objects.create(title='Benchmark', summary='',
+                                       isbn='')
+            User.objects.bulk_create(User(username='patron%d' % num)
+                                     for num in range(size))
+            placed = timezone.now()
+            Hold.objects.bulk_create(
+                Hold(book=book, patron_id=patron_id,
+                     placed=placed + datetime.timedelta(seconds=num))
+                for num, patron_id in enumerate(
+                    User.objects.order_by('id').values_list('id',
+                                                            flat=True)))
+            BookInstance.objects.bulk_create(
+                BookInstance(book=book, imprint='Benchmark', status='a')
+                for _ in range(returns))
+            copies = list(BookInstance.objects.all())
+
+            start = time.time()
+            for copy in copies:
+                allocate_copy(copy)
+            allocation = time.time() - start
+
+            start = time.time()
+            expire_holds(today=datetime.date.today() + datetime.timedelta(
+                days=365))
+            expiry = time.time() - start
+            stdout.write('%6d holds  allocate: %6.2f ms/copy  '
+                         'expire + reallocate: %6.2f ms/copy'
+                         % (size, allocation * 1000 / returns,
+                            expiry * 1000 / returns))
+
+
+@scenario
+def bench_facets(stdout, duration=3.0, scale=100000):
+    '''
+    Latency of the faceted book list (view and template) for single
+    facets and facet combinations over scale books
+    '''
+    from .views import BookListView
+    with _scratch_database():
+        start = time.time()
+        seed_library(scale, copies_per_book=2, users=1000)
+        genres = list(Genre.objects.order_by('pk'))
+        facet_rows = rebuild_facets()
+        stdout.write('%d books, %d facet counts, generated in %.1fs'
+                     % (scale, facet_rows, time.time() - start))
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+        view = BookListView.as_view()
+        factory = RequestFactory()
+        combinations = (
+            ('no filter', {}),
+            ('genre', {'genre': genres[0].pk}),
+            ('rare genre', {'genre': genres[-1].pk}),
+            ('available', {'available': 1}),
+            ('genre + language', {'genre': genres[1].pk, 'language': 2}),
+            ('genre + language + available',
+             {'genre': genres[1].pk, 'language': 2, 'available': 1}),
+            ('genre + language, page 50',
+             {'genre': genres[1].pk, 'language': 2, 'page': 50}),
+        )
+        for label, params in combinations:
+            timings = []
+            deadline = time.time() + duration / len(combinations)
+            while time.time() < deadline or not timings:
+                request = factory.get('/catalog/books/', params)
+                request.session = {}
+                request.user = AnonymousUser()
+                begin = time.time()
+                view(request).render()
+                timings.append(time.time() - begin)
+            timings.sort()
+            stdout.write('%-32s median: %7.2f ms  max: %7.2f ms'
+                         % (label, timings[len(timings) // 2] * 1000,
+                            timings[-1] * 1000))
@@ -0,0 +1,103 @@
+'''
+Per-branch scoping of copies.
+
+BranchMiddleware picks the branch of a request: ?branch=<code> (remembered
+in the session), else the branch chosen earlier in the session, else
+settings.DEFAULT_BRANCH. It sets request.branch and makes the branch
+current for the thread handling the request, which restricts
+BookInstance.scoped (the manager of the index page and the copy lists) to
+it. Without a branch, e.g. in management commands, nothing is filtered.
+
+Copy counts and lists, the availability facet of the book list and
+checkouts by scanning follow the branch. The hold queues and the rankings
+are network-wide: a hold is for a title, filled by a copy of any branch.
+
+Every process keeps the branches in memory, reloaded when their version
+(catalog/versions.py) changes, so picking one costs no query.
+'''
+import contextlib
+import threading
+
+from django.conf import settings
+
+from .models import Branch
+from .versions import SharedVersion
+
+# code of the branch of requests that did not choose one
+DEFAULT_BRANCH = getattr(settings, 'DEFAULT_BRANCH', None)
+
+_state = threading.local()
+_version = SharedVersion('branches')
+# the branches by code, as of version
+_branches = {'version': None, 'by_code': {}}
+
+
+def get_current_branch():
+    '''
+    :return: the Branch of the current request, or None
+    '''
+    return getattr(_state, 'branch', None)
+
+
+@contextlib.contextmanager
+def use_branch(branch):
+    '''
+    Makes branch current in the enclosed block
+    :param branch: a Branch, or None for every branch
+    '''
+    previous = get_current_branch()
+    _state.branch = branch
+    try:
+        yield branch
+    finally:
+        _state.branch = previous
+
+
+def _load_branches():
+    version = _version.current()
+    if version != _branches['version']:
+        _branches.update(by_code={branch.code: branch
+                                  for branch in Branch.objects.all()},
+                         version=version)
+    return _branches['by_code']
+
+
+def get_branch(code):
+    '''
+    :param code:
+    :return: the Branch with this code, or None
+    '''
+    return _load_branches().get(code)
+
+
+def invalidate_branches():
+    '''
+    Called when a branch is saved or deleted
+    :return:
+    '''
+    _version.bump()
+    _branches['version'] = None
+
+
+class BranchMiddleware(object):
+    '''
+    Sets request.branch and the current branch of a request; comes after
+    SessionMiddleware
+    '''
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        code = request.GET.get('branch')
+        if code == '':
+            # ?branch= goes back to every branch
+            request.session.pop('branch', None)
+        elif code is not None and get_branch(code) is not None:
+            request.session['branch'] = code
+        else:
+            # unknown codes are ignored
+            code = request.session.get('branch', DEFAULT_BRANCH)
+        request.branch = get_branch(code) if code else None
+        with use_branch(request.branch):
+            return self.get_response(request)
@@ -0,0 +1,333 @@
+'''
+Faceted browsing of the book list.
+
+FacetCount holds the number of books per genre, language, author and
+availability. It is maintained incrementally: Book saves and deletes,
+changes to the Book.genre many-to-many relation (m2m_changed) and copy
+status changes (through Book.is_available) adjust single rows with
+UPDATE ... SET count = count + n, so rendering the facets never groups
+over the books table. "manage.py rebuild_facets" recomputes everything,
+e.g. after bulk loads that bypass signals.
+
+Book.is_available and its counts cover every branch. When a request has a
+branch (catalog/branches.py), the availability filter and counts are
+computed from the copies of that branch instead, through the
+(branch, book, status) index of BookInstance.
+'''
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Exists, F, OuterRef
+
+from .models import Author, Book, BookInstance, FacetCount, Genre, Language
+
+# GET parameter -> (facet, Book lookup)
+FILTERS = (
+    ('genre', ('genre', 'genre')),
+    ('language', ('language', 'publication_language')),
+    ('author', ('author', 'author')),
+    ('available', ('available', 'is_available')),
+)
+
+# number of values listed per facet
+FACET_SIZE = 20
+
+
+def adjust(changes):
+    '''
+    Applies count deltas to FacetCount rows, creating missing rows
+    :param changes: mapping of (facet, value) to delta
+    :return:
+    '''
+    for (facet, value), delta in changes.items():
+        if not delta or value is None:
+            continue
+        updated = FacetCount.objects.filter(facet=facet, value=value).update(
+            count=F('count') + delta)
+        if updated:
+            continue
+        try:
+            with transaction.atomic():
+                FacetCount.objects.create(facet=facet, value=value,
+                                          count=delta)
+        except IntegrityError:
+            # created concurrently
+            FacetCount.objects.filter(facet=facet, value=value).update(
+                count=F('count') + delta)
+
+
+def facet_state(book):
+    '''
+    Returns the single-valued facets of a book, without loading deferred
+    fields
+    :param book:
+    :return: (author_id, publication_language_id) tuple
+    '''
+    fields = book.__dict__
+    return fields.get('author_id'), fields.get('publication_language_id')
+
+
+def book_saved(book, created, old_state):
+    '''
+    Moves a saved book between author and language facet values
+    :param book:
+    :param created:
+    :param old_state: facet_state() before the save
+    :return:
+    '''
+    changes = Counter()
+    author_id, language_id = facet_state(book)
+    if created:
+        changes['available', int(book.is_available)] += 1
+    else:
+        old_author_id, old_language_id = old_state
+        if old_author_id == author_id and old_language_id == language_id:
+            return
+        changes['author', old_author_id] -= 1
+        changes['language', old_language_id] -= 1
+    changes['author', author_id] += 1
+    changes['language', language_id] += 1
+    adjust(changes)
+
+
+def book_deleting(book):
+    '''
+    Remembers the genres of a book about to be deleted: the through rows
+    are removed without m2m_changed signals
+    :param book:
+    :return:
+    '''
+    book._facet_genres = list(Book.genre.through.objects.filter(
+        book_id=book.pk).values_list('genre_id', flat=True))
+
+
+def book_deleted(book):
+    changes = Counter()
+    author_id, language_id = facet_state(book)
+    changes['author', author_id] -= 1
+    changes['language', language_id] -= 1
+    changes['available', int(book.is_available)] -= 1
+    for genre_id in getattr(book, '_facet_genres', ()):
+        changes['genre', genre_id] -= 1
+    adjust(changes)
+
+
+def genres_changed(instance, action, reverse, pk_set):
+    '''
+    m2m_changed handler for Book.genre, from either side of the relation
+    :param instance: the Book (or the Genre when reverse)
+    :param action:
+    :param reverse:
+    :param pk_set: genre ids (or book ids when reverse)
+    :return:
+    '''
+    through = Book.genre.through
+    if reverse:
+        links = through.objects.filter(genre_id=instance.pk)
+        if action == 'pre_remove':
+            links = links.filter(book_id__in=pk_set)
+        if action in ('pre_remove', 'pre_clear'):
+            instance._facet_removed = Counter({instance.pk: links.count()})
+    else:
+        links = through.objects.filter(book_id=instance.pk)
+        if action == 'pre_remove':
+            links = links.filter(genre_id__in=pk_set)
+        if action in ('pre_remove', 'pre_clear'):
+            instance._facet_removed = Counter(
+                links.values_list('genre_id', flat=True))
+    if action == 'post_add' and pk_set:
+        added = Counter({instance.pk: len(pk_set)}) if reverse \
+            else Counter(pk_set)
+        adjust({('genre', genre_id): count
+                for genre_id, count in added.items()})
+    elif action in ('post_remove', 'post_clear'):
+        removed = getattr(instance, '_facet_removed', Counter())
+        adjust({('genre', genre_id): -count
+                for genre_id, count in removed.items()})
+        instance._facet_removed = Counter()
+
+
+def sync_availability(book_ids):
+    '''
+    Re-checks whether the given books have an available copy, updating
+    Book.is_available and the availability facet where it changed. Call it
+    after bulk status updates that bypass signals.
+    :param book_ids: iterable of Book ids
+    :return:
+    '''
+    book_ids = [book_id for book_id in set(book_ids) if book_id is not None]
+    if not book_ids:
+        return
+    books = Book.objects.filter(pk__in=book_ids).annotate(
+        has_available=Exists(BookInstance.objects.filter(
+            book=OuterRef('pk'), status='a'))).values_list(
+        'pk', 'is_available', 'has_available')
+    changes = Counter()
+    for pk, stored, actual in books:
+        actual = bool(actual)
+        if stored == actual:
+            continue
+        # only the save that actually flips the flag moves the count, when
+        # two of them race
+        if not Book.objects.filter(pk=pk, is_available=stored).update(
+                is_available=actual):
+            continue
+        changes['available', int(stored)] -= 1
+        changes['available', int(actual)] += 1
+    adjust(changes)
+
+
+def rebuild_facets():
+    '''
+    Recomputes Book.is_available and every FacetCount from scratch
+    :return: number of FacetCount rows written
+    '''
+    with transaction.atomic():
+        available = BookInstance.objects.filter(
+            status='a', book__isnull=False).values('book_id')
+        Book.objects.filter(pk__in=available).update(is_available=True)
+        Book.objects.exclude(pk__in=available).update(is_available=False)
+        rows = []
+        for facet, field, queryset in (
+                ('genre', 'genre_id', Book.genre.through.objects),
+                ('language', 'publication_language_id', Book.objects),
+                ('author', 'author_id', Book.objects),
+                ('available', 'is_available', Book.objects)):
+            rows.extend(FacetCount(facet=facet, value=int(value), count=count)
+                        for value, count in queryset.order_by().values_list(
+                            field).annotate(count=Count('pk'))
+                        if value is not None)
+        FacetCount.objects.all().delete()
+        FacetCount.objects.bulk_create(rows, batch_size=500)
+    return len(rows)
+
+
+def selected_filters(params):
+    '''
+    Reads the facet filters of a request
+    :param params: request.GET
+    :return: dict of GET parameter to int value (0 or 1 for available,
+    the value of its facet)
+    '''
+    selected = {}
+    for param, _ in FILTERS:
+        try:
+            selected[param] = int(params[param])
+        except (KeyError, ValueError):
+            continue
+        if param == 'available':
+            selected[param] = int(bool(selected[param]))
+    return selected
+
+
+def available_at(branch):
+    '''
+    :param branch:
+    :return: values queryset of the ids of the books with an available copy
+    at branch
+    '''
+    return BookInstance.objects.filter(
+        branch=branch, status='a', book__isnull=False).values('book_id')
+
+
+def filter_books(queryset, selected, branch=None):
+    '''
+    Applies selected_filters() to a Book queryset
+    :param queryset:
+    :param selected:
+    :param branch: the Branch availability is checked at, None for any
+    :return:
+    '''
+    lookups = dict(FILTERS)
+    for param, value in selected.items():
+        if param == 'available' and branch is not None:
+            method = queryset.filter if value else queryset.exclude
+            queryset = method(pk__in=available_at(branch))
+            continue
+        field = lookups[param][1]
+        queryset = queryset.filter(**{field: bool(value)
+                                      if param == 'available' else value})
+    return queryset
+
+
+def _branch_availability(branch):
+    '''
+    :param branch:
+    :return: dict of 1 and 0 to the number of books available and not
+    available at branch
+    '''
+    total = sum(FacetCount.objects.filter(facet='available').values_list(
+        'count', flat=True))
+    available = Book.objects.filter(pk__in=available_at(branch)).count()
+    return {1: available, 0: total - available}
+
+
+def known_count(selected, branch=None):
+    '''
+    Number of books matching selected, when it can be read from the facet
+    counts (no filter or a single one)
+    :param selected:
+    :param branch: the Branch availability is checked at, None for any
+    :return: the count, or None when an exact COUNT is needed
+    '''
+    if len(selected) > 1:
+        return None
+    if not selected:
+        return sum(FacetCount.objects.filter(facet='available').values_list(
+            'count', flat=True))
+    (param, value), = selected.items()
+    if param == 'available' and branch is not None:
+        return _branch_availability(branch)[value]
+    facet = dict(FILTERS)[param][0]
+    row = FacetCount.objects.filter(facet=facet, value=value).first()
+    return row.count if row else 0
+
+
+def facet_values(selected, params, branch=None):
+    '''
+    Builds the facet lists shown next to the book list
+    :param selected: selected_filters() of the request
+    :param params: request.GET, used to build the links
+    :param branch: the Branch availability is counted at, None for any
+    :return: list of (title, [dict(label, count, url, active)]) tuples
+    '''
+    counts = {}
+    for facet, _ in FacetCount.FACETS:
+        if facet == 'available' and branch is not None:
+            counts[facet] = sorted(
+                ((value, count) for value, count
+                 in _branch_availability(branch).items() if count > 0),
+                key=lambda item: (-item[1], item[0]))
+            continue
+        counts[facet] = list(FacetCount.objects.filter(
+            facet=facet, count__gt=0).order_by('-count', 'value').values_list(
+            'value', 'count')[:FACET_SIZE])
+    labels = {
+        'genre': dict(Genre.objects.filter(pk__in=[
+            value for value, _ in counts['genre']
+        ]).values_list('pk', 'name')),
+        'language': dict(Language.objects.filter(pk__in=[
+            value for value, _ in counts['language']
+        ]).values_list('pk', 'language')),
+        'author': {author.pk: str(author) for author in Author.objects.filter(
+            pk__in=[value for value, _ in counts['author']])},
+        'available': {1: 'Available', 0: 'Not available'},
+    }
+    facets = []
+    for param, (facet, _) in FILTERS:
+        values = []
+        for value, count in counts[facet]:
+            if value not in labels[facet]:
+                continue
+            query = params.copy()
+            query.pop('page', None)
+            active = selected.get(param) == value
+            if active:
+                query.pop(param, None)
+            else:
+                query[param] = value
+            values.append({'label': labels[facet][value], 'count': count,
+                           'url': '?' + query.urlencode(), 'active': active})
+        if values:
+            facets.append((dict(FacetCount.FACETS)[facet], values))
+    return facets
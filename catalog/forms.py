@@ -1,7 +1,9 @@
 from django import forms
 from django.core.exceptions import ValidationError
+from django.core.urlresolvers import reverse
 from django.utils.translation import ugettext_lazy as _
 import datetime # to check the renewal date range
+from .models import Book
 
 
 class RenewBookForm(forms.Form):
@@ -21,3 +23,55 @@ class RenewBookForm(forms.Form):
                                     '4 weeks in the future'))
         # remember to always return cleaned data
         return data
+
+
+class AutocompleteSelect(forms.Select):
+    '''
+    Select of a ModelChoiceField that only renders the selected object:
+    catalog/js/autocomplete.js loads the other choices from the
+    autocomplete endpoint as the user types, so the page stays the same
+    size however many objects there are
+    '''
+
+    class Media:
+        js = ('catalog/js/autocomplete.js',)
+
+    def __init__(self, kind, attrs=None):
+        '''
+        :param kind: 'author' or 'book' (see catalog/autocomplete.py)
+        :param attrs:
+        '''
+        super(AutocompleteSelect, self).__init__(attrs)
+        self.kind = kind
+
+    def build_attrs(self, base_attrs, extra_attrs=None):
+        attrs = super(AutocompleteSelect, self).build_attrs(base_attrs,
+                                                            extra_attrs)
+        attrs['class'] = (attrs.get('class', '') + ' autocomplete').strip()
+        attrs['data-url'] = reverse('autocomplete', args=[self.kind])
+        return attrs
+
+    def optgroups(self, name, value, attrs=None):
+        iterator = self.choices
+        choices = []
+        if iterator.field.empty_label is not None:
+            choices.append(('', iterator.field.empty_label))
+        selected = [item for item in value if item]
+        if selected:
+            try:
+                choices.extend(iterator.choice(obj) for obj in
+                               iterator.queryset.filter(pk__in=selected))
+            except (ValueError, ValidationError):
+                # an invalid submitted value, reported by the field
+                pass
+        return [(None, [self.create_option(
+            name, option_value, label, str(option_value) in value, index,
+            attrs=attrs)], index)
+            for index, (option_value, label) in enumerate(choices)]
+
+
+class BookForm(forms.ModelForm):
+    class Meta:
+        model = Book
+        fields = '__all__'
+        widgets = {'author': AutocompleteSelect('author')}
@@ -0,0 +1,141 @@
+'''
+Reservation queue engine.
+
+Every Book has a first come, first served queue of waiting Holds. When a
+copy becomes available it is set aside ('r', Reserved) for the patron at
+the head of the queue. The head is found with one seek on the
+(book, status, placed) index, and the hold row is taken with
+SELECT ... FOR UPDATE SKIP LOCKED, so concurrent returns of copies of the
+same book are given to different patrons without waiting on each other.
+'''
+import datetime
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from . import ledger
+from .facets import sync_availability
+from .models import BookInstance, Hold
+
+# days a patron has to pick up a reserved copy
+HOLD_PICKUP_DAYS = getattr(settings, 'HOLD_PICKUP_DAYS', 7)
+
+
+def place_hold(book, patron):
+    '''
+    Queues patron for book, unless they already have a live hold on it
+    :param book:
+    :param patron:
+    :return: the Hold
+    '''
+    with transaction.atomic():
+        # concurrent requests of the same patron wait here, so the check
+        # below sees a hold created by the other one
+        list(User.objects.select_for_update().filter(
+            pk=patron.pk).values_list('pk'))
+        hold = Hold.objects.filter(book=book, patron=patron,
+                                   status__in=('w', 'r')).first()
+        if hold is None:
+            hold = Hold.objects.create(book=book, patron=patron)
+    return hold
+
+
+def _next_hold(book_id):
+    '''
+    Locks and returns the first waiting hold of a book whose patron can
+    still borrow, cancelling the holds of deactivated patrons first.
+    Must be called inside a transaction.
+    :param book_id:
+    :return: a Hold or None
+    '''
+    inactive = User.objects.filter(is_active=False).values('pk')
+    Hold.objects.filter(book_id=book_id, status='w',
+                        patron__in=inactive).update(status='c')
+    # a subquery rather than a join, which would lock the patron rows too
+    return Hold.objects.select_for_update(skip_locked=True).filter(
+        book_id=book_id, status='w').exclude(
+        patron__in=inactive).order_by('placed', 'id').first()
+
+
+def allocate_copy(copy, today=None):
+    '''
+    Sets an available copy aside for the next patron in its book's queue
+    :param copy: a BookInstance that was just returned
+    :param today: date the pick-up period starts on (defaults to today)
+    :return: the Hold the copy was given to, or None if nobody is waiting
+    '''
+    today = today or datetime.date.today()
+    with transaction.atomic():
+        # re-read the copy under lock: a concurrent return may have
+        # allocated it already
+        copy = BookInstance.objects.select_for_update().filter(
+            pk=copy.pk, status='a').first()
+        if copy is None or copy.book_id is None:
+            return None
+        hold = _next_hold(copy.book_id)
+        if hold is None:
+            return None
+        hold.status = 'r'
+        hold.copy = copy
+        hold.expires = today + datetime.timedelta(days=HOLD_PICKUP_DAYS)
+        hold.save(update_fields=['status', 'copy', 'expires'])
+        copy.status = 'r'
+        copy.borrower_id = hold.patron_id
+        copy.save(update_fields=['status', 'borrower'])
+    return hold
+
+
+def copy_status_changed(copy):
+    '''
+    Keeps the holds of a copy in step with its new status: an available
+    copy goes to the next patron in the queue, a checked out copy fulfils
+    the hold it was set aside for
+    :param copy: BookInstance whose status was just changed
+    :return:
+    '''
+    if copy.status == 'a':
+        allocate_copy(copy)
+    elif copy.status == 'o':
+        Hold.objects.filter(copy=copy, status='r').update(status='f')
+
+
+def expire_holds(today=None, batch_size=500):
+    '''
+    Expires the ready holds that were not picked up in time and passes
+    their copies on to the next patron in the queue
+    :param today: holds expiring before this date are expired
+    :param batch_size: number of holds handled per transaction
+    :return: number of holds expired
+    '''
+    today = today or datetime.date.today()
+    expired = 0
+    while True:
+        with transaction.atomic():
+            holds = list(Hold.objects.select_for_update(
+                skip_locked=True).filter(
+                status='r', expires__lt=today).order_by(
+                'expires', 'id')[:batch_size])
+            if not holds:
+                return expired
+            Hold.objects.filter(pk__in=[hold.pk for hold in holds]).update(
+                status='x')
+            copies = list(BookInstance.objects.select_for_update().filter(
+                pk__in=[hold.copy_id for hold in holds if hold.copy_id],
+                status='r'))
+            BookInstance.objects.filter(
+                pk__in=[copy.pk for copy in copies]).update(
+                status='a', borrower=None)
+            events = []
+            for copy in copies:
+                old_state = copy._loan_state
+                copy.status, copy.borrower_id = 'a', None
+                event = ledger.classify(old_state, copy)
+                if event:
+                    events.append(ledger.make_event(copy, event))
+                copy._loan_state = ledger.loan_state(copy)
+            ledger.record(events)
+            sync_availability(copy.book_id for copy in copies)
+            for copy in copies:
+                allocate_copy(copy, today=today)
+        expired += len(holds)
@@ -0,0 +1,152 @@
+'''
+Admin inlines that only load the first page of related objects.
+
+The rest is paged in on demand, in primary key order, through a JSON
+endpoint added to the parent ModelAdmin by LazyInlineAdminMixin, so an
+edit page renders in constant time however many related rows exist.
+'''
+from django.conf.urls import url
+from django.contrib import admin
+from django.contrib.admin.utils import quote, unquote
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.core.urlresolvers import reverse
+from django.forms.models import BaseInlineFormSet, _get_foreign_key
+from django.http import Http404, JsonResponse
+
+
+class PaginatedInlineFormSet(BaseInlineFormSet):
+    '''
+    Inline formset restricted to the first per_page related objects
+    (ordered by primary key)
+    '''
+    per_page = 20
+    # URL of the endpoint serving the following pages, set by
+    # LazyTabularInline.get_formset
+    lazy_url = None
+
+    def __init__(self, *args, **kwargs):
+        super(PaginatedInlineFormSet, self).__init__(*args, **kwargs)
+        self.queryset = self.queryset.order_by('pk')
+        self.total_count = self.queryset.count()
+        if self.is_bound:
+            # only the objects that were rendered on the submitted page
+            self.queryset = self.queryset.filter(pk__in=self.submitted_pks())
+        else:
+            self.queryset = self.queryset[:self.per_page]
+
+    def submitted_pks(self):
+        pk_field = self.model._meta.pk
+        try:
+            initial = int(self.data.get(
+                '%s-INITIAL_FORMS' % self.prefix, 0))
+        except ValueError:
+            initial = 0
+        pks = []
+        for i in range(min(initial, self.per_page)):
+            value = self.data.get('%s-%s-%s' % (self.prefix, i,
+                                                pk_field.name))
+            try:
+                pks.append(pk_field.to_python(value))
+            except ValidationError:
+                pass
+        return [pk for pk in pks if pk is not None]
+
+    @property
+    def has_more(self):
+        return self.total_count > self.per_page
+
+    @property
+    def cursor(self):
+        '''
+        Primary key of the last object of the first page, where the lazy
+        endpoint carries on from
+        '''
+        objects = list(self.get_queryset())
+        return objects[-1].pk if objects else ''
+
+
+class LazyTabularInline(admin.TabularInline):
+    '''
+    TabularInline that renders the first page of related objects as forms
+    and pages in the rest as links to their change pages
+    '''
+    formset = PaginatedInlineFormSet
+    template = 'admin/catalog/lazy_tabular.html'
+    per_page = 20
+
+    class Media:
+        js = ('catalog/js/lazy_inline.js',)
+
+    def get_formset(self, request, obj=None, **kwargs):
+        formset = super(LazyTabularInline, self).get_formset(
+            request, obj, **kwargs)
+        formset.per_page = self.per_page
+        if obj is not None and obj.pk is not None:
+            opts = self.parent_model._meta
+            formset.lazy_url = reverse(
+                'admin:%s_%s_inline' % (opts.app_label, opts.model_name),
+                args=[quote(obj.pk), self.model._meta.model_name],
+                current_app=self.admin_site.name)
+        return formset
+
+
+class LazyInlineAdminMixin(object):
+    '''
+    ModelAdmin mixin adding the endpoint that pages in the objects of its
+    LazyTabularInlines: <object_id>/inline/<model_name>/?after=<pk>
+    '''
+
+    def get_urls(self):
+        info = self.model._meta.app_label, self.model._meta.model_name
+        urlpatterns = [
+            url(r'^(.+)/inline/(\w+)/$',
+                self.admin_site.admin_view(self.inline_page_view),
+                name='%s_%s_inline' % info),
+        ]
+        return urlpatterns + super(LazyInlineAdminMixin, self).get_urls()
+
+    def inline_page_view(self, request, object_id, model_name):
+        '''
+        Returns the next page of an inline's objects as JSON
+        :param request:
+        :param object_id: primary key of the parent object
+        :param model_name: model name of the inline
+        :return:
+        '''
+        obj = self.get_object(request, unquote(object_id))
+        if obj is None:
+            raise Http404
+        if not self.has_change_permission(request, obj):
+            raise PermissionDenied
+        for inline in self.get_inline_instances(request, obj):
+            if (isinstance(inline, LazyTabularInline) and
+                    inline.model._meta.model_name == model_name):
+                break
+        else:
+            raise Http404
+        fk = _get_foreign_key(self.model, inline.model,
+                              fk_name=inline.fk_name)
+        queryset = inline.get_queryset(request).filter(
+            **{fk.name: obj}).order_by('pk')
+        after = request.GET.get('after')
+        if after:
+            try:
+                after = inline.model._meta.pk.to_python(after)
+            except ValidationError:
+                raise Http404
+            queryset = queryset.filter(pk__gt=after)
+        rows = list(queryset[:inline.per_page + 1])
+        has_more = len(rows) > inline.per_page
+        rows = rows[:inline.per_page]
+        opts = inline.model._meta
+        return JsonResponse({
+            'rows': [{
+                'pk': str(row.pk),
+                'text': str(row),
+                'url': reverse('admin:%s_%s_change' % (opts.app_label,
+                                                       opts.model_name),
+                               args=[quote(row.pk)],
+                               current_app=self.admin_site.name),
+            } for row in rows],
+            'next': str(rows[-1].pk) if has_more else None,
+        })
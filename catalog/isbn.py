@@ -0,0 +1,67 @@
+'''
+ISBN normalization.
+
+Books are looked up by their canonical ISBN: the ISBN-13 form, digits
+only. ISBN-10s are converted (978 prefix, new check digit), hyphens and
+spaces are ignored and check digits are validated.
+'''
+import re
+
+_SEPARATORS = re.compile(r'[\s-]')
+
+
+class InvalidISBN(ValueError):
+    pass
+
+
+def isbn13_check_digit(digits):
+    '''
+    :param digits: the first 12 digits
+    :return:
+    '''
+    total = sum(int(digit) * (3 if position % 2 else 1)
+                for position, digit in enumerate(digits))
+    return str((10 - total % 10) % 10)
+
+
+def isbn10_check_digit(digits):
+    '''
+    :param digits: the first 9 digits
+    :return:
+    '''
+    total = sum(int(digit) * (10 - position)
+                for position, digit in enumerate(digits))
+    check = (11 - total % 11) % 11
+    return 'X' if check == 10 else str(check)
+
+
+def normalize(value):
+    '''
+    Returns the canonical ISBN-13 of an ISBN-10 or ISBN-13
+    :param value: e.g. "0-306-40615-2" or "978-0-306-40615-7"
+    :return: e.g. "9780306406157"
+    :raises InvalidISBN: if value is not a valid ISBN
+    '''
+    isbn = _SEPARATORS.sub('', value or '').upper()
+    if len(isbn) == 10 and isbn[:9].isdigit():
+        if isbn10_check_digit(isbn[:9]) != isbn[9]:
+            raise InvalidISBN('Invalid ISBN-10 check digit: %s' % value)
+        isbn = '978' + isbn[:9]
+        return isbn + isbn13_check_digit(isbn)
+    if len(isbn) == 13 and isbn.isdigit() and isbn[:3] in ('978', '979'):
+        if isbn13_check_digit(isbn[:12]) != isbn[12]:
+            raise InvalidISBN('Invalid ISBN-13 check digit: %s' % value)
+        return isbn
+    raise InvalidISBN('Not an ISBN: %s' % value)
+
+
+def normalize_or_none(value):
+    '''
+    Like normalize(), but returns None for invalid ISBNs
+    :param value:
+    :return:
+    '''
+    try:
+        return normalize(value)
+    except InvalidISBN:
+        return None
@@ -0,0 +1,172 @@
+'''
+Append-only loan ledger and circulation rollups.
+
+Every checkout, renewal, return and status change of a BookInstance is
+appended to LoanEvent instead of only overwriting due_back, status and
+borrower. Events are written in the transaction of the change they record,
+so they commit and roll back (savepoints included) with it; batch
+operations (barcodes.scan(), holds.expire_holds()) record theirs with a
+single bulk INSERT. Daily LoanRollup rows (loans
+per book, genre, language and borrower) are computed from the events so
+circulation reports read a few rows per day instead of scanning the
+ledger, and whole months of old events are moved to ArchivedLoanEvent.
+'''
+import datetime
+from collections import Counter
+
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from .models import ArchivedLoanEvent, LoanEvent, LoanRollup
+
+# dimension -> LoanEvent field the rollup groups on
+ROLLUP_FIELDS = {
+    'book': 'book_id',
+    'genre': 'book__genre',
+    'language': 'book__publication_language',
+    'borrower': 'borrower_id',
+}
+
+
+def loan_state(copy):
+    '''
+    Returns the loan fields of a copy that the ledger tracks, without
+    loading deferred fields
+    :param copy: BookInstance
+    :return: (status, due_back, borrower_id) tuple
+    '''
+    fields = copy.__dict__
+    return (fields.get('status'), fields.get('due_back'),
+            fields.get('borrower_id'))
+
+
+def classify(old_state, copy):
+    '''
+    Works out which event turned old_state into the current state of copy
+    :param old_state: loan_state() before the change, None for a new copy
+    :param copy:
+    :return: a LoanEvent.EVENT_TYPE code, or None if nothing changed
+    '''
+    status, due_back, borrower_id = loan_state(copy)
+    if old_state is None:
+        return 'o' if status == 'o' else None
+    old_status, old_due_back, old_borrower_id = old_state
+    if status == 'o':
+        if old_status != 'o' or borrower_id != old_borrower_id:
+            return 'o'
+        if due_back != old_due_back:
+            return 'n'
+        return None
+    if old_status == 'o':
+        return 'a'
+    if status != old_status:
+        return 's'
+    return None
+
+
+def make_event(copy, event, when=None):
+    '''
+    Builds (without saving) the LoanEvent for event on copy
+    :param copy: BookInstance, in its state after the event
+    :param event: LoanEvent.EVENT_TYPE code
+    :param when: defaults to now
+    :return:
+    '''
+    when = when or timezone.now()
+    return LoanEvent(copy_id=copy.pk, book_id=copy.book_id,
+                     borrower_id=copy.borrower_id, event=event,
+                     status=copy.status or '', due_back=copy.due_back,
+                     created=when, month=month_of(when))
+
+
+def month_of(when):
+    return timezone.localtime(when).date().replace(day=1)
+
+
+def record(events, using=DEFAULT_DB_ALIAS):
+    '''
+    Appends events to the ledger with one bulk INSERT, in the current
+    transaction if any
+    :param events: list of unsaved LoanEvents
+    :param using: database alias
+    :return:
+    '''
+    if events:
+        LoanEvent.objects.using(using).bulk_create(events)
+
+
+def _day_bounds(day):
+    start = timezone.make_aware(datetime.datetime.combine(day,
+                                                          datetime.time()))
+    return start, start + datetime.timedelta(days=1)
+
+
+def rollup_day(day):
+    '''
+    (Re)computes the LoanRollup rows of one day from the checkouts in the
+    ledger, archived months included
+    :param day: date
+    :return: number of rollup rows written
+    '''
+    start, end = _day_bounds(day)
+    counts = Counter()
+    for model in (LoanEvent, ArchivedLoanEvent):
+        checkouts = model.objects.filter(month=month_of(start),
+                                         created__gte=start,
+                                         created__lt=end, event='o')
+        for dimension, field in ROLLUP_FIELDS.items():
+            rows = checkouts.order_by().values_list(field).annotate(
+                loans=Count('id'))
+            for key, loans in rows:
+                if key is not None:
+                    counts[dimension, key] += loans
+    rollups = [LoanRollup(day=day, dimension=dimension, key=key, loans=loans)
+               for (dimension, key), loans in sorted(counts.items())]
+    with transaction.atomic():
+        LoanRollup.objects.filter(day=day).delete()
+        LoanRollup.objects.bulk_create(rollups, batch_size=500)
+    return len(rollups)
+
+
+def circulation_report(dimension, start, end, limit=None):
+    '''
+    Checkouts per book, genre, language or borrower between two dates
+    (inclusive), read from the daily rollups
+    :param dimension: one of LoanRollup.DIMENSIONS
+    :param start: date
+    :param end: date
+    :param limit: only return the top limit keys
+    :return: list of (key, loans) tuples, most loans first
+    '''
+    rows = LoanRollup.objects.filter(
+        dimension=dimension, day__gte=start, day__lte=end).values_list(
+        'key').annotate(total=Sum('loans')).order_by('-total', 'key')
+    if limit:
+        rows = rows[:limit]
+    return list(rows)
+
+
+def archive_loan_events(before_month, batch_size=5000):
+    '''
+    Moves the events of the months before before_month to
+    ArchivedLoanEvent, batch_size events per transaction
+    :param before_month: first day of the oldest month to keep
+    :param batch_size:
+    :return: number of events archived
+    '''
+    fields = [field.attname for field in LoanEvent._meta.concrete_fields]
+    archived = 0
+    while True:
+        with transaction.atomic():
+            events = list(LoanEvent.objects.filter(
+                month__lt=before_month).order_by('id')[:batch_size])
+            if not events:
+                return archived
+            ArchivedLoanEvent.objects.bulk_create(
+                ArchivedLoanEvent(**{name: getattr(event, name)
+                                     for name in fields})
+                for event in events)
+            LoanEvent.objects.filter(
+                pk__in=[event.pk for event in events]).delete()
+        archived += len(events)
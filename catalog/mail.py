@@ -0,0 +1,17 @@
+from django.core.mail.backends.base import BaseEmailBackend
+
+from .taskqueue import enqueue
+from .tasks import serialize_email
+
+
+class QueuedEmailBackend(BaseEmailBackend):
+    '''
+    Email backend that queues every message as a send_email task instead
+    of talking to the mail server in the request thread. The worker
+    delivers it through settings.TASKS_EMAIL_BACKEND.
+    '''
+
+    def send_messages(self, email_messages):
+        for message in email_messages:
+            enqueue('send_email', serialize_email(message))
+        return len(email_messages)
@@ -0,0 +1,33 @@
+import uuid
+from django.core.management.base import BaseCommand, CommandError
+from catalog.archive import ARCHIVED_STATUSES, archive_copies, restore_copies
+
+
+class Command(BaseCommand):
+    help = 'Moves withdrawn (in maintenance) copies and copies of deleted ' \
+           'books to the archive table, keeping the hot BookInstance ' \
+           'table small, or restores archived copies'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--status', action='append', dest='statuses',
+                            help='Status of the copies to archive, besides '
+                                 'orphaned ones (default: %s); repeatable'
+                                 % ', '.join(ARCHIVED_STATUSES))
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--restore', nargs='+', metavar='ID',
+                            help='Restore the archived copies with these ids '
+                                 'instead')
+
+    def handle(self, *args, **options):
+        if options['restore']:
+            try:
+                ids = [uuid.UUID(value) for value in options['restore']]
+            except ValueError as error:
+                raise CommandError('Invalid copy id: %s' % error)
+            restored = restore_copies(ids)
+            self.stdout.write('Restored %d copies' % restored)
+            return
+        archived = archive_copies(
+            tuple(options['statuses'] or ARCHIVED_STATUSES),
+            batch_size=options['batch_size'])
+        self.stdout.write('Archived %d copies' % archived)
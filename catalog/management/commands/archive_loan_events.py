@@ -0,0 +1,24 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+from catalog.ledger import archive_loan_events
+
+
+class Command(BaseCommand):
+    help = 'Moves the loan events of old months from the ledger to the ' \
+           'archive table, keeping the hot LoanEvent table small'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep-months', type=int, default=24,
+                            help='Number of months, including the current '
+                                 'one, to keep in the ledger')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        month = datetime.date.today().replace(day=1)
+        for _ in range(options['keep_months'] - 1):
+            month = (month - datetime.timedelta(days=1)).replace(day=1)
+        archived = archive_loan_events(month,
+                                       batch_size=options['batch_size'])
+        self.stdout.write('Archived %d loan events from before %s'
+                          % (archived, month))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from catalog.barcodes import new_barcodes
+from catalog.models import ArchivedBookInstance, BookInstance
+
+
+class Command(BaseCommand):
+    help = 'Gives a barcode to the copies, live and archived, saved before ' \
+           'barcodes existed (or created with bulk inserts), so that they ' \
+           'can be scanned.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        updated = 0
+        for model in (BookInstance, ArchivedBookInstance):
+            while True:
+                with transaction.atomic():
+                    ids = list(model.objects.select_for_update().filter(
+                        barcode__isnull=True).order_by('pk').values_list(
+                        'pk', flat=True)[:options['batch_size']])
+                    if not ids:
+                        break
+                    for pk, barcode in zip(ids, new_barcodes(len(ids))):
+                        model.objects.filter(pk=pk).update(barcode=barcode)
+                    updated += len(ids)
+        self.stdout.write('Gave barcodes to %d copies' % updated)
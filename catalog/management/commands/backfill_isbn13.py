@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from catalog.isbn import normalize_or_none
+from catalog.models import Book
+
+
+class Command(BaseCommand):
+    help = 'Fills Book.isbn13, the canonical ISBN scanners look books up ' \
+           'by, for books saved before it existed (or edited with bulk ' \
+           'updates). Invalid and duplicate ISBNs are reported and left empty.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        updated, invalid, duplicates = 0, [], []
+        last_pk = 0
+        while True:
+            with transaction.atomic():
+                books = list(Book.objects.filter(pk__gt=last_pk).order_by(
+                    'pk').values_list('pk', 'isbn', 'isbn13')[
+                    :options['batch_size']])
+                if not books:
+                    break
+                last_pk = books[-1][0]
+                changes = {}
+                for pk, isbn, isbn13 in books:
+                    canonical = normalize_or_none(isbn)
+                    if canonical is None and isbn:
+                        invalid.append(pk)
+                    if canonical != isbn13:
+                        changes[pk] = canonical
+                taken = set(Book.objects.filter(
+                    isbn13__in=set(changes.values()) - {None}).exclude(
+                    pk__in=changes).values_list('isbn13', flat=True))
+                for pk, canonical in sorted(changes.items()):
+                    if canonical in taken:
+                        duplicates.append(pk)
+                        canonical = None
+                    elif canonical:
+                        taken.add(canonical)
+                    Book.objects.filter(pk=pk).update(isbn13=canonical)
+                    updated += 1
+        self.stdout.write('Updated %d books' % updated)
+        if invalid:
+            self.stdout.write('Invalid ISBNs (books %s)'
+                              % ', '.join(map(str, invalid)))
+        if duplicates:
+            self.stdout.write('ISBNs already used by another book (books %s)'
+                              % ', '.join(map(str, duplicates)))
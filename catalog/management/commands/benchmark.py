@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from catalog.benchmarks import SCENARIOS
+
+
+class Command(BaseCommand):
+    help = 'Runs one of the catalog performance benchmarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenario', choices=sorted(SCENARIOS))
+        parser.add_argument('--duration', type=float, default=3.0,
+                            help='Seconds to run each measured phase for')
+        parser.add_argument('--scale', type=int,
+                            help='Size of the generated data set')
+
+    def handle(self, *args, **options):
+        kwargs = {'duration': options['duration']}
+        if options['scale']:
+            kwargs['scale'] = options['scale']
+        SCENARIOS[options['scenario']](self.stdout, **kwargs)
@@ -0,0 +1,40 @@
+import datetime
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from catalog.ledger import circulation_report
+from catalog.models import Book, Genre, Language, LoanRollup
+
+
+class Command(BaseCommand):
+    help = 'Prints the checkouts per book, genre, language or borrower ' \
+           'over a date range, read from the daily loan rollups'
+
+    labels = {
+        'book': (Book, 'title'),
+        'genre': (Genre, 'name'),
+        'language': (Language, 'language'),
+        'borrower': (User, 'username'),
+    }
+
+    def add_arguments(self, parser):
+        parser.add_argument('dimension', choices=[
+            dimension for dimension, _ in LoanRollup.DIMENSIONS])
+        parser.add_argument('--start', required=True, help='YYYY-MM-DD')
+        parser.add_argument('--end', help='YYYY-MM-DD, default today')
+        parser.add_argument('--limit', type=int, default=20)
+
+    def handle(self, *args, **options):
+        start = datetime.datetime.strptime(options['start'],
+                                           '%Y-%m-%d').date()
+        end = datetime.date.today()
+        if options['end']:
+            end = datetime.datetime.strptime(options['end'],
+                                             '%Y-%m-%d').date()
+        rows = circulation_report(options['dimension'], start, end,
+                                  limit=options['limit'])
+        model, field = self.labels[options['dimension']]
+        names = dict(model.objects.filter(
+            pk__in=[key for key, _ in rows]).values_list('pk', field))
+        for key, loans in rows:
+            self.stdout.write('%8d  %s' % (loans, names.get(key, key)))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from catalog.rankings import RANKING_WINDOWS, refresh_rankings
+from catalog.taskqueue import enqueue
+
+
+class Command(BaseCommand):
+    help = 'Refreshes the "most borrowed" book and genre rankings from ' \
+           'the loan rollups. Run it periodically (e.g. hourly).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--windows', type=int, nargs='+',
+                            default=list(RANKING_WINDOWS),
+                            help='Sliding windows in days')
+        parser.add_argument('--enqueue', action='store_true',
+                            help='Queue the job for "manage.py run_tasks" '
+                                 'instead of running it now')
+
+    def handle(self, *args, **options):
+        if options['enqueue']:
+            queued = enqueue('compute_rankings', windows=options['windows'])
+            self.stdout.write('Queued task #%d' % queued.pk)
+            return
+        refresh_rankings(windows=options['windows'])
+        self.stdout.write('Rankings refreshed for windows: %s' % ', '.join(
+            str(window) for window in options['windows']))
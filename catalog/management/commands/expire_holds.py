@@ -0,0 +1,32 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+from catalog.holds import expire_holds
+from catalog.taskqueue import enqueue
+
+
+class Command(BaseCommand):
+    help = 'Expires ready holds that were not picked up in time and passes ' \
+           'their copies on to the next patron in the queue'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Expire holds whose pick-up '
+                                           'period ended before this date '
+                                           '(YYYY-MM-DD, default today)')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--enqueue', action='store_true',
+                            help='Queue the job for "manage.py run_tasks" '
+                                 'instead of running it now')
+
+    def handle(self, *args, **options):
+        if options['enqueue']:
+            queued = enqueue('expire_holds', date=options['date'])
+            self.stdout.write('Queued task #%d' % queued.pk)
+            return
+        today = None
+        if options['date']:
+            today = datetime.datetime.strptime(options['date'],
+                                               '%Y-%m-%d').date()
+        expired = expire_holds(today=today,
+                               batch_size=options['batch_size'])
+        self.stdout.write('Expired %d holds' % expired)
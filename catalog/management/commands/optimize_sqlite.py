@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, DEFAULT_DB_ALIAS
+from catalog.sqlite import optimize
+
+
+class Command(BaseCommand):
+    help = 'Refreshes SQLite query planner statistics and checkpoints the ' \
+           'WAL. Schedule it periodically (e.g. nightly from cron).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS,
+                            help='Database alias to optimize')
+        parser.add_argument('--analyze', action='store_true',
+                            help='Run a full ANALYZE instead of '
+                                 '"PRAGMA optimize"')
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        if connection.vendor != 'sqlite':
+            raise CommandError('Database "%s" is not a SQLite database'
+                               % options['database'])
+        for statement in optimize(connection, analyze=options['analyze']):
+            self.stdout.write('Ran %s' % statement)
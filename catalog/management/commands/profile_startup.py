@@ -0,0 +1,74 @@
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'Boots the project in a fresh interpreter the way a web worker ' \
+           'does and reports the import cost per module and per app, and ' \
+           'the time of each start-up and warm-up step'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=20,
+                            help='Number of modules to list')
+        parser.add_argument('--no-warm-up', action='store_true',
+                            help='Stop after loading the WSGI application')
+
+    def group_of(self, module, app_names):
+        '''
+        :param module:
+        :param app_names: installed app packages, longest first
+        :return: the installed app of module, or its top-level package
+        '''
+        for name in app_names:
+            if module == name or module.startswith(name + '.'):
+                return name
+        return module.split('.')[0]
+
+    def handle(self, *args, **options):
+        command = [sys.executable, '-m', 'catalog.startup']
+        if options['no_warm_up']:
+            command.append('--no-warm-up')
+        env = dict(os.environ,
+                   DJANGO_SETTINGS_MODULE=os.environ.get(
+                       'DJANGO_SETTINGS_MODULE', 'locallibrary.settings'))
+        try:
+            output = subprocess.check_output(command, env=env,
+                                             cwd=settings.BASE_DIR)
+        except subprocess.CalledProcessError as error:
+            raise CommandError('Start-up failed with exit status %d'
+                               % error.returncode)
+        report = json.loads(output.decode())
+
+        self.stdout.write('Start-up')
+        for name, seconds in report['phases']:
+            self.stdout.write('  %-32s %8.1f ms' % (name, seconds * 1000))
+        for name, count, seconds in report['warmup']:
+            self.stdout.write('    %-30s %8.1f ms (%d)'
+                              % (name, seconds * 1000, count))
+
+        imports = report['imports']
+        app_names = sorted((config.name for config in apps.get_app_configs()),
+                           key=len, reverse=True)
+        groups = defaultdict(float)
+        for module, (cumulative, own) in imports.items():
+            groups[self.group_of(module, app_names)] += own
+        self.stdout.write('\nImport time per app or package (%d modules, '
+                          '%.1f ms)' % (len(imports), sum(groups.values())
+                                        * 1000))
+        groups = sorted(groups.items(), key=lambda item: -item[1])
+        for name, seconds in groups[:options['limit']]:
+            self.stdout.write('  %-40s %8.1f ms' % (name, seconds * 1000))
+
+        self.stdout.write('\nSlowest modules (cumulative, self)')
+        for module, (cumulative, own) in sorted(
+                imports.items(), key=lambda item: -item[1][0])[
+                :options['limit']]:
+            self.stdout.write('  %-40s %8.1f ms %8.1f ms'
+                              % (module, cumulative * 1000, own * 1000))
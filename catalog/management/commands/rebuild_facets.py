@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from catalog.facets import rebuild_facets
+
+
+class Command(BaseCommand):
+    help = 'Recomputes book availability and the facet counts of the ' \
+           'book list from scratch (after bulk loads or to repair drift)'
+
+    def handle(self, *args, **options):
+        self.stdout.write('Wrote %d facet counts' % rebuild_facets())
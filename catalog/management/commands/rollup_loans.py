@@ -0,0 +1,34 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+from catalog.ledger import rollup_day
+from catalog.taskqueue import enqueue
+
+
+class Command(BaseCommand):
+    help = 'Computes the daily loan rollups (loans per book, genre, ' \
+           'language and borrower) from the loan ledger. Run it at least ' \
+           'daily; by default it refreshes yesterday and today.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Last day to roll up '
+                                           '(YYYY-MM-DD, default today)')
+        parser.add_argument('--days', type=int, default=2,
+                            help='Number of days up to --date to roll up')
+        parser.add_argument('--enqueue', action='store_true',
+                            help='Queue the job for "manage.py run_tasks" '
+                                 'instead of running it now')
+
+    def handle(self, *args, **options):
+        if options['enqueue']:
+            queued = enqueue('rollup_loans', date=options['date'],
+                             days=options['days'])
+            self.stdout.write('Queued task #%d' % queued.pk)
+            return
+        last_day = datetime.date.today()
+        if options['date']:
+            last_day = datetime.datetime.strptime(options['date'],
+                                                  '%Y-%m-%d').date()
+        for offset in range(options['days'] - 1, -1, -1):
+            day = last_day - datetime.timedelta(days=offset)
+            self.stdout.write('%s: %d rollup rows' % (day, rollup_day(day)))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from catalog.taskqueue import run_tasks
+
+
+class Command(BaseCommand):
+    help = 'Runs queued background tasks (emails, batch jobs)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=4,
+                            help='Number of tasks run at the same time')
+        parser.add_argument('--timeout', type=int, default=60,
+                            help='Seconds a task may run before it is '
+                                 'killed and retried')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds to wait when the queue is empty')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit when the queue is empty')
+
+    def handle(self, *args, **options):
+        processed = run_tasks(concurrency=options['concurrency'],
+                              timeout=options['timeout'],
+                              poll_interval=options['poll_interval'],
+                              once=options['once'],
+                              log=self.stdout.write)
+        self.stdout.write('Ran %d tasks' % processed)
@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from catalog.facets import rebuild_facets
+from catalog.seed import seed_library
+
+
+class Command(BaseCommand):
+    help = 'Fills the database with a reproducible synthetic library ' \
+           '(authors, genres, languages, books, copies, readers and loans)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=10000)
+        parser.add_argument('--copies-per-book', type=int, default=3,
+                            help='Average number of copies of a book')
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--loan-ratio', type=float, default=0.3,
+                            help='Share of the copies that are on loan')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        for name in ('books', 'copies_per_book', 'users'):
+            if options[name] < 0:
+                raise CommandError('--%s cannot be negative'
+                                   % name.replace('_', '-'))
+        start = time.time()
+        written = seed_library(options['books'], options['copies_per_book'],
+                               options['users'], options['loan_ratio'],
+                               seed=options['seed'])
+        elapsed = time.time() - start
+        for name, count in sorted(written.items()):
+            self.stdout.write('%-32s %9d' % (name, count))
+        total = sum(written.values())
+        self.stdout.write('Wrote %d rows in %.1fs (%d rows/s)'
+                          % (total, elapsed, total / max(elapsed, 0.001)))
+        start = time.time()
+        rebuild_facets()
+        self.stdout.write('Rebuilt the facet counts in %.1fs'
+                          % (time.time() - start))
@@ -1,8 +1,22 @@
 from django.db import models
 from django.core.urlresolvers import reverse
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.exceptions import NON_FIELD_ERRORS, ValidationError
+from django.utils import timezone
 from datetime import date
+import os
+import time
 import uuid
+from .isbn import normalize_or_none
+
+
+def search_key(value):
+    '''
+    :param value: a name or title
+    :return: the case-folded form prefixes are matched against
+    '''
+    return (value or '').lower()
 
 
 # Create your models here.
@@ -39,6 +53,10 @@ class Book(models.Model):
     Model representing a book (but not a specific copy of a book)
     '''
     title = models.CharField(max_length=200)
+    # lowercased title, set by save(): the database search of
+    # catalog/autocomplete.py matches prefixes against it with an index
+    title_key = models.CharField(max_length=200, db_index=True,
+                                 editable=False, default='')
     author = models.ForeignKey('Author', on_delete=models.SET_NULL, null=True)
     # Foreign Key used because book can only have one author, but authors can have multiple books
     # Author as a string rather than object because it hasn't been declared yet in the file.
@@ -49,12 +67,20 @@ class Book(models.Model):
                             help_text='13 Character <a href='
                                       '"https://www.isbn-international.org'
                                       '/content/what-isbn">ISBN number</a>')
+    # canonical ISBN-13 of isbn, None when it is not a valid ISBN; what
+    # scanners look books up by (see catalog/isbn.py)
+    isbn13 = models.CharField('ISBN-13', max_length=13, unique=True,
+                              null=True, blank=True, editable=False)
     genre = models.ManyToManyField(Genre, help_text="Select a genre for this "
                                                     "book")
     # ManyToManyField used because genre can contain many books. Books can cover many genres.
     # Genre class has already been defined so we can specify the object above.
     publication_language = models.ForeignKey(
         'Language', on_delete=models.SET_NULL, null=True)
+    # whether at least one copy is available, kept up to date by
+    # catalog/facets.py so the book list can filter on it with an index
+    is_available = models.BooleanField(default=False, db_index=True,
+                                       editable=False)
 
     def __str__(self):
         '''
@@ -63,6 +89,34 @@ class Book(models.Model):
         '''
         return self.title
 
+    def validate_unique(self, exclude=None):
+        '''
+        Also rejects an ISBN that is canonically the same as another book's.
+        The error goes to the isbn field, or to the whole form when the
+        form does not edit it (exclude).
+        :param exclude: fields left out of validation
+        :return:
+        '''
+        super(Book, self).validate_unique(exclude=exclude)
+        isbn13 = normalize_or_none(self.isbn)
+        if isbn13 and Book.objects.filter(isbn13=isbn13).exclude(
+                pk=self.pk).exists():
+            field = NON_FIELD_ERRORS if exclude and 'isbn' in exclude \
+                else 'isbn'
+            raise ValidationError({field: 'Another book has the ISBN %s.'
+                                          % self.isbn})
+
+    def save(self, *args, **kwargs):
+        isbn13 = normalize_or_none(self.isbn)
+        if isbn13 and isbn13 != self.isbn13 and Book.objects.filter(
+                isbn13=isbn13).exclude(pk=self.pk).exists():
+            # a duplicate left by "manage.py backfill_isbn13" keeps no
+            # canonical ISBN rather than break the unique constraint
+            isbn13 = None
+        self.isbn13 = isbn13
+        self.title_key = search_key(self.title)
+        super(Book, self).save(*args, **kwargs)
+
     def get_absolute_url(self):
         '''
         Returns the url to access a particular book instance
@@ -79,14 +133,166 @@ class Book(models.Model):
     display_genre.short_description = 'Genre'
 
 
+def new_copy_id():
+    '''
+    Default primary key of a BookInstance: a random UUID, or with
+    settings.TIME_ORDERED_COPY_IDS a time-ordered one (the UUIDv7 layout:
+    creation time in milliseconds in the first 48 bits, then random bits),
+    so new rows are appended to the primary key index rather than
+    scattered over it
+    :return:
+    '''
+    if not getattr(settings, 'TIME_ORDERED_COPY_IDS', False):
+        return uuid.uuid4()
+    value = int(time.time() * 1000) << 80 | \
+        int.from_bytes(os.urandom(10), 'big')
+    # version 7, RFC 4122 variant
+    value = value & ~(0xf << 76) | 7 << 76
+    value = value & ~(0x3 << 62) | 0x2 << 62
+    return uuid.UUID(int=value)
+
+
+class Branch(models.Model):
+    '''
+    Model representing a library branch, the site a copy is shelved at
+    '''
+    name = models.CharField(max_length=100)
+    # identifies the branch in URLs (?branch=) and settings.DEFAULT_BRANCH
+    code = models.SlugField(max_length=20, unique=True)
+
+    class Meta:
+        ordering = ['name']
+
+    def __str__(self):
+        '''
+        String for representing the Model object
+        :return:
+        '''
+        return self.name
+
+
+class BookInstanceQuerySet(models.QuerySet):
+    '''
+    Remembers its filter() and exclude() calls, which include_archived()
+    applies to the archive table as well
+    '''
+
+    def __init__(self, *args, **kwargs):
+        super(BookInstanceQuerySet, self).__init__(*args, **kwargs)
+        # (method, args, kwargs) of the filter() and exclude() calls
+        self._filter_calls = ()
+
+    def _clone(self, **kwargs):
+        clone = super(BookInstanceQuerySet, self)._clone(**kwargs)
+        clone._filter_calls = self._filter_calls
+        return clone
+
+    def _filter_or_exclude(self, negate, *args, **kwargs):
+        clone = super(BookInstanceQuerySet, self)._filter_or_exclude(
+            negate, *args, **kwargs)
+        clone._filter_calls = self._filter_calls + (
+            ('exclude' if negate else 'filter', args, kwargs),)
+        return clone
+
+    def include_archived(self):
+        '''
+        Extends the queryset to the copies moved to ArchivedBookInstance
+        (see catalog/archive.py), with the same filters: those of a
+        related manager (book.bookinstance_set) or of BookInstance.scoped
+        included
+        :return: an ArchiveInclusiveQuerySet
+        '''
+        archived = ArchivedBookInstance.objects.all()
+        for method, args, kwargs in self._filter_calls:
+            archived = getattr(archived, method)(*args, **kwargs)
+        return ArchiveInclusiveQuerySet(self, archived)
+
+
+class BranchScopedManager(models.Manager.from_queryset(BookInstanceQuerySet)):
+    '''
+    Manager restricted to the copies of the branch of the current request
+    (see catalog/branches.py), or every copy outside of one
+    '''
+
+    def get_queryset(self):
+        from .branches import get_current_branch
+        queryset = super(BranchScopedManager, self).get_queryset()
+        branch = get_current_branch()
+        if branch is not None:
+            queryset = queryset.filter(branch=branch)
+        return queryset
+
+
+class ArchiveInclusiveQuerySet(object):
+    '''
+    The live copies of a queryset followed by the matching archived ones
+    (ArchivedBookInstance objects, whose is_archived is True). filter(),
+    exclude(), order_by() and select_related() apply to both tables;
+    ordering is per table.
+    '''
+
+    def __init__(self, live, archived):
+        self.live = live
+        self.archived = archived
+
+    def _apply(self, method, *args, **kwargs):
+        return ArchiveInclusiveQuerySet(
+            getattr(self.live, method)(*args, **kwargs),
+            getattr(self.archived, method)(*args, **kwargs))
+
+    def filter(self, *args, **kwargs):
+        return self._apply('filter', *args, **kwargs)
+
+    def exclude(self, *args, **kwargs):
+        return self._apply('exclude', *args, **kwargs)
+
+    def order_by(self, *fields):
+        return self._apply('order_by', *fields)
+
+    def select_related(self, *fields):
+        return self._apply('select_related', *fields)
+
+    def count(self):
+        return self.live.count() + self.archived.count()
+
+    def exists(self):
+        return self.live.exists() or self.archived.exists()
+
+    def get(self, *args, **kwargs):
+        '''
+        Like QuerySet.get(), looking in the archive when no live copy
+        matches
+        '''
+        try:
+            return self.live.get(*args, **kwargs)
+        except BookInstance.DoesNotExist:
+            try:
+                return self.archived.get(*args, **kwargs)
+            except ArchivedBookInstance.DoesNotExist:
+                raise BookInstance.DoesNotExist(
+                    'BookInstance matching query does not exist.')
+
+    def __iter__(self):
+        for copy in self.live:
+            yield copy
+        for copy in self.archived:
+            yield copy
+
+    def __len__(self):
+        return len(list(iter(self)))
+
+
 class BookInstance(models.Model):
     '''
     Model representing a specific copy of a book (i.e., one that can be
     borrowed from the library)
     '''
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4,
+    id = models.UUIDField(primary_key=True, default=new_copy_id,
                           help_text="Unique ID for this particular book "
                           "across the whole library")
+    # short, sequential and printed on the copy (see catalog/barcodes.py)
+    barcode = models.CharField(max_length=10, unique=True, null=True,
+                               blank=True, editable=False)
     book = models.ForeignKey('Book', on_delete=models.SET_NULL, null=True)
     imprint = models.CharField(max_length=200)
     due_back = models.DateField(null=True, blank=True)
@@ -104,6 +310,15 @@ class BookInstance(models.Model):
 
     borrower = models.ForeignKey(User, on_delete=models.SET_NULL, null=True,
                                  blank=True)
+    # indexed by the composite indexes below, which all lead on it
+    branch = models.ForeignKey(Branch, on_delete=models.SET_NULL, null=True,
+                               blank=True, db_index=False)
+
+    objects = BookInstanceQuerySet.as_manager()
+    # what pages showing copies use: per-branch queries read per-branch
+    # index ranges
+    scoped = BranchScopedManager()
+    is_archived = False
 
     @property
     def is_overdue(self):
@@ -114,6 +329,16 @@ class BookInstance(models.Model):
     class Meta:
         ordering = ["due_back"]
         permissions = (("can_mark_returned", "Set book as returned"),)
+        # loan lists and the admin changelist filter on status/borrower and
+        # order by due_back
+        indexes = [
+            models.Index(fields=['due_back']),
+            models.Index(fields=['status', 'due_back']),
+            models.Index(fields=['borrower', 'status', 'due_back']),
+            # the same, within a branch
+            models.Index(fields=['branch', 'status', 'due_back']),
+            models.Index(fields=['branch', 'book', 'status']),
+        ]
 
     def __str__(self):
         '''
@@ -122,6 +347,42 @@ class BookInstance(models.Model):
         return '%s (%s)' % (self.id, self.book.title)
 
 
+class ArchivedBookInstance(models.Model):
+    '''
+    Model representing a withdrawn or orphaned copy moved out of the
+    BookInstance table ("manage.py archive_copies"). Plain ids rather than
+    constrained foreign keys are kept so it outlives its book and borrower.
+    '''
+    id = models.UUIDField(primary_key=True)
+    barcode = models.CharField(max_length=10, unique=True, null=True,
+                               blank=True)
+    book = models.ForeignKey('Book', on_delete=models.DO_NOTHING, null=True,
+                             db_constraint=False, related_name='+')
+    imprint = models.CharField(max_length=200)
+    due_back = models.DateField(null=True, blank=True)
+    status = models.CharField(max_length=1,
+                              choices=BookInstance.LOAN_STATUS, blank=True)
+    borrower = models.ForeignKey(User, on_delete=models.DO_NOTHING,
+                                 null=True, blank=True, db_constraint=False,
+                                 related_name='+')
+    branch = models.ForeignKey(Branch, on_delete=models.DO_NOTHING,
+                               null=True, blank=True, db_constraint=False,
+                               related_name='+')
+    archived = models.DateTimeField(default=timezone.now, db_index=True)
+
+    is_archived = True
+
+    class Meta:
+        ordering = ['archived']
+
+    def __str__(self):
+        '''
+        String for representing the Model object
+        :return:
+        '''
+        return '%s (archived)' % self.id
+
+
 class Author(models.Model):
     '''
     Model representing an author
@@ -130,6 +391,16 @@ class Author(models.Model):
     last_name = models.CharField(max_length=100)
     date_of_birth = models.DateField(null=True, blank=True)
     date_of_death = models.DateField('died', null=True, blank=True)
+    # lowercased names, set by save() (see Book.title_key)
+    first_name_key = models.CharField(max_length=100, db_index=True,
+                                      editable=False, default='')
+    last_name_key = models.CharField(max_length=100, db_index=True,
+                                     editable=False, default='')
+
+    def save(self, *args, **kwargs):
+        self.first_name_key = search_key(self.first_name)
+        self.last_name_key = search_key(self.last_name)
+        super(Author, self).save(*args, **kwargs)
 
     def get_absolute_url(self):
         '''
@@ -145,3 +416,281 @@ class Author(models.Model):
         '''
         return '%s, %s' % (self.last_name, self.first_name)
 
+
+
+class Hold(models.Model):
+    '''
+    Model representing a patron's place in the reservation queue of a book
+    (see catalog/holds.py for the queue engine)
+    '''
+    HOLD_STATUS = (
+        ('w', 'Waiting'),
+        ('r', 'Ready for pickup'),
+        ('f', 'Fulfilled'),
+        ('x', 'Expired'),
+        ('c', 'Cancelled'),
+    )
+
+    book = models.ForeignKey('Book', on_delete=models.CASCADE)
+    patron = models.ForeignKey(User, on_delete=models.CASCADE)
+    status = models.CharField(max_length=1, choices=HOLD_STATUS, default='w')
+    # position in the queue: first come, first served
+    placed = models.DateTimeField(default=timezone.now)
+    # the copy set aside for the patron once the hold is ready
+    copy = models.ForeignKey('BookInstance', on_delete=models.SET_NULL,
+                             null=True, blank=True)
+    expires = models.DateField(null=True, blank=True,
+                               help_text='Last day to pick up the copy')
+
+    class Meta:
+        ordering = ['placed', 'id']
+        indexes = [
+            # the head of a book's queue is a single index seek
+            models.Index(fields=['book', 'status', 'placed']),
+            models.Index(fields=['status', 'expires']),
+        ]
+
+    def __str__(self):
+        '''
+        String for representing the Model object
+        :return:
+        '''
+        return '%s for %s (%s)' % (self.book_id, self.patron_id,
+                                   self.get_status_display())
+
+
+class Sequence(models.Model):
+    '''
+    Model representing a named counter handing out increasing numbers
+    (e.g. copy barcodes) on every database backend
+    '''
+    name = models.CharField(max_length=50, unique=True)
+    value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        '''
+        String for representing the Model object
+        :return:
+        '''
+        return '%s: %s' % (self.name, self.value)
+
+
+class IndexChange(models.Model):
+    '''
+    Model representing a change to one object of an in-memory index (see
+    catalog/autocomplete.py) and the version it was given, so that other
+    processes apply the changes they missed instead of rebuilding
+    '''
+    index = models.CharField(max_length=20)
+    version = models.BigIntegerField()
+    object_id = models.IntegerField()
+
+    class Meta:
+        unique_together = (('index', 'version'),)
+
+    def __str__(self):
+        '''
+        String for representing the Model object
+        :return:
+        '''
+        return '%s %s: %s' % (self.index, self.version, self.object_id)
+
+
+class Task(models.Model):
+    '''
+    Model representing a unit of background work (e.g. sending an email),
+    run outside the request cycle by "manage.py run_tasks" (see
+    catalog/taskqueue.py)
+    '''
+    TASK_STATUS = (
+        ('q', 'Queued'),
+        ('r', 'Running'),
+        ('d', 'Done'),
+        ('f', 'Failed'),
+    )
+
+    name = models.CharField(max_length=100)
+    # JSON encoded {"args": [...], "kwargs": {...}}
+    payload = models.TextField(default='{}')
+    status = models.CharField(max_length=1, choices=TASK_STATUS, default='q')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    # not picked up before this time (retries back off)
+    run_after = models.DateTimeField(default=timezone.now)
+    # a running task whose lease ran out is picked up again
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['run_after', 'id']
+        indexes = [
+            models.Index(fields=['status', 'run_after']),
+        ]
+
+    def __str__(self):
+        '''
+        String for representing the Model object
+        :return:
+        '''
+        return '%s (%s)' % (self.name, self.get_status_display())
+
+
+class LoanEventBase(models.Model):
+    '''
+    Fields of an entry of the append-only loan ledger (see
+    catalog/ledger.py). Plain ids rather than constrained foreign keys are
+    kept so the history outlives deleted copies, books and users.
+    '''
+    EVENT_TYPE = (
+        ('o', 'Checked out'),
+        ('n', 'Renewed'),
+        ('a', 'Returned'),
+        ('s', 'Status changed'),
+    )
+
+    copy_id = models.UUIDField()
+    book = models.ForeignKey('Book', on_delete=models.DO_NOTHING, null=True,
+                             db_constraint=False, related_name='+')
+    borrower = models.ForeignKey(User, on_delete=models.DO_NOTHING,
+                                 null=True, db_constraint=False,
+                                 related_name='+')
+    event = models.CharField(max_length=1, choices=EVENT_TYPE)
+    # state of the copy after the event
+    status = models.CharField(max_length=1,
+                              choices=BookInstance.LOAN_STATUS, blank=True)
+    due_back = models.DateField(null=True, blank=True)
+    created = models.DateTimeField(default=timezone.now)
+    # first day of the month of created: the unit events are archived in
+    month = models.DateField()
+
+    class Meta:
+        abstract = True
+        ordering = ['created', 'id']
+
+    def __str__(self):
+        '''
+        String for representing the Model object
+        :return:
+        '''
+        return '%s %s (%s)' % (self.copy_id, self.get_event_display(),
+                               self.created)
+
+
+class LoanEvent(LoanEventBase):
+    '''
+    Model representing a change to the loan state of a copy
+    '''
+
+    class Meta(LoanEventBase.Meta):
+        indexes = [
+            models.Index(fields=['month', 'created']),
+            models.Index(fields=['created', 'event']),
+            models.Index(fields=['copy_id', 'created']),
+        ]
+
+
+class ArchivedLoanEvent(LoanEventBase):
+    '''
+    Model representing a loan event of a month that was moved out of the
+    LoanEvent table ("manage.py archive_loan_events")
+    '''
+
+    class Meta(LoanEventBase.Meta):
+        indexes = [
+            models.Index(fields=['month', 'created']),
+        ]
+
+
+class LoanRollup(models.Model):
+    '''
+    Model representing the number of checkouts of one day for one book,
+    genre, language or borrower, precomputed from the loan ledger so that
+    circulation reports never scan LoanEvent
+    '''
+    DIMENSIONS = (
+        ('book', 'Book'),
+        ('genre', 'Genre'),
+        ('language', 'Language'),
+        ('borrower', 'Borrower'),
+    )
+
+    day = models.DateField()
+    dimension = models.CharField(max_length=10, choices=DIMENSIONS)
+    # id of the book, genre, language or user
+    key = models.IntegerField()
+    loans = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = (('dimension', 'day', 'key'),)
+
+    def __str__(self):
+        '''
+        String for representing the Model object
+        :return:
+        '''
+        return '%s %s #%s: %s' % (self.day, self.dimension, self.key,
+                                  self.loans)
+
+
+class Ranking(models.Model):
+    '''
+    Model representing the position of a book or genre in the "most
+    borrowed" ranking of a sliding window of days (see catalog/rankings.py)
+    '''
+    KINDS = (
+        ('book', 'Book'),
+        ('genre', 'Genre'),
+    )
+
+    kind = models.CharField(max_length=5, choices=KINDS)
+    # length of the sliding window in days
+    window = models.PositiveSmallIntegerField()
+    rank = models.PositiveSmallIntegerField()
+    # id of the book or genre
+    key = models.IntegerField()
+    # book title or genre name, so the ranking renders without joins
+    label = models.CharField(max_length=200)
+    loans = models.PositiveIntegerField()
+
+    class Meta:
+        ordering = ['kind', 'window', 'rank']
+        unique_together = (('kind', 'window', 'rank'),)
+
+    def __str__(self):
+        '''
+        String for representing the Model object
+        :return:
+        '''
+        return '%s. %s (%s days)' % (self.rank, self.label, self.window)
+
+
+class FacetCount(models.Model):
+    '''
+    Model representing the number of books with a given genre, language,
+    author or availability, kept up to date incrementally by signals (see
+    catalog/facets.py) so the book list never runs GROUP BY queries
+    '''
+    FACETS = (
+        ('genre', 'Genre'),
+        ('language', 'Language'),
+        ('author', 'Author'),
+        ('available', 'Availability'),
+    )
+
+    facet = models.CharField(max_length=10, choices=FACETS)
+    # id of the genre, language or author; 1/0 for availability
+    value = models.IntegerField()
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = (('facet', 'value'),)
+        # top values of a facet
+        indexes = [models.Index(fields=['facet', '-count'])]
+
+    def __str__(self):
+        '''
+        String for representing the Model object
+        :return:
+        '''
+        return '%s=%s: %s' % (self.facet, self.value, self.count)
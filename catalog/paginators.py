@@ -0,0 +1,70 @@
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+
+def estimate_count(queryset):
+    '''
+    Returns the row count the database keeps in its table statistics for the
+    model of an unfiltered queryset, or None when there is no usable
+    estimate (filtered queryset, unsupported backend, statistics not
+    gathered yet)
+    :param queryset:
+    :return:
+    '''
+    if queryset.query.where or queryset.query.distinct:
+        return None
+    table = queryset.model._meta.db_table
+    connection = connections[queryset.db]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            # maintained by autovacuum / ANALYZE
+            cursor.execute('SELECT reltuples::bigint FROM pg_class '
+                           'WHERE relname = %s', [table])
+        elif connection.vendor == 'sqlite':
+            # maintained by ANALYZE ("manage.py optimize_sqlite")
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' "
+                           "AND name = 'sqlite_stat1'")
+            if cursor.fetchone() is None:
+                return None
+            cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s',
+                           [table])
+        else:
+            return None
+        row = cursor.fetchone()
+    if row is None or row[0] is None:
+        return None
+    estimate = int(str(row[0]).split()[0])
+    return estimate if estimate >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    '''
+    Paginator that takes the row count of large unfiltered querysets from
+    the table statistics instead of running an exact COUNT(*)
+    '''
+    # below this many rows an exact count is cheap enough
+    estimate_threshold = 10000
+
+    @cached_property
+    def count(self):
+        estimate = None
+        if hasattr(self.object_list, 'query'):
+            estimate = estimate_count(self.object_list)
+        if estimate is None or estimate < self.estimate_threshold:
+            return super(EstimatedCountPaginator, self).count
+        return estimate
+
+
+class PrecountedPaginator(Paginator):
+    '''
+    Paginator for a queryset whose size is already known (e.g. from the
+    facet counts), which saves the COUNT(*) query
+    '''
+
+    def __init__(self, object_list, per_page, count=None, **kwargs):
+        super(PrecountedPaginator, self).__init__(object_list, per_page,
+                                                  **kwargs)
+        if count is not None:
+            # pre-fills the cached_property
+            self.__dict__['count'] = count
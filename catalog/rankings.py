@@ -0,0 +1,106 @@
+'''
+Materialized "most borrowed" rankings.
+
+"manage.py compute_rankings" refreshes the daily loan rollups of the last
+two days and sums them over each sliding window into the small Ranking
+table, usually in a command or task process. Every process keeps the
+rankings it read in memory until their version (catalog/versions.py)
+changes, so the home page and book list widgets cost no query most of the
+time and see new rankings within VERSION_CHECK_INTERVAL.
+'''
+import datetime
+
+from django.conf import settings
+from django.db import transaction
+
+from .ledger import circulation_report, rollup_day
+from .models import Book, Genre, Ranking
+from .versions import SharedVersion
+
+# sliding windows, in days, that rankings are computed for
+RANKING_WINDOWS = getattr(settings, 'RANKING_WINDOWS', (7, 30, 365))
+RANKING_SIZE = getattr(settings, 'RANKING_SIZE', 10)
+
+LABELS = {
+    'book': (Book, 'title'),
+    'genre': (Genre, 'name'),
+}
+
+_version = SharedVersion('rankings')
+# (kind, window) -> entries, as of version
+_rankings = {'version': None, 'entries': {}}
+
+
+def compute_ranking(kind, window, today=None, size=RANKING_SIZE):
+    '''
+    Recomputes one ranking from the loan rollups
+    :param kind: 'book' or 'genre'
+    :param window: length of the sliding window in days
+    :param today: last day of the window (defaults to today)
+    :param size: number of entries kept
+    :return: the ranking, as returned by get_ranking
+    '''
+    today = today or datetime.date.today()
+    start = today - datetime.timedelta(days=window - 1)
+    rows = circulation_report(kind, start, today, limit=size)
+    model, field = LABELS[kind]
+    labels = dict(model.objects.filter(
+        pk__in=[key for key, _ in rows]).values_list('pk', field))
+    rankings = [Ranking(kind=kind, window=window, rank=rank, key=key,
+                        label=labels[key], loans=loans)
+                for rank, (key, loans) in enumerate(
+                    [row for row in rows if row[0] in labels], 1)]
+    with transaction.atomic():
+        Ranking.objects.filter(kind=kind, window=window).delete()
+        Ranking.objects.bulk_create(rankings)
+        invalidate_rankings()
+    return [_entry(ranking) for ranking in rankings]
+
+
+def refresh_rankings(today=None, windows=RANKING_WINDOWS):
+    '''
+    Brings the rollups of yesterday and today up to date and recomputes
+    every ranking
+    :param today:
+    :param windows:
+    :return:
+    '''
+    today = today or datetime.date.today()
+    for day in (today - datetime.timedelta(days=1), today):
+        rollup_day(day)
+    for kind, _ in Ranking.KINDS:
+        for window in windows:
+            compute_ranking(kind, window, today=today)
+
+
+def _entry(ranking):
+    return {'rank': ranking.rank, 'key': ranking.key,
+            'label': ranking.label, 'loans': ranking.loans}
+
+
+def invalidate_rankings():
+    '''
+    Called when rankings are recomputed
+    :return:
+    '''
+    _version.bump()
+    _rankings['version'] = None
+
+
+def get_ranking(kind, window, limit=5):
+    '''
+    Returns the top entries of a ranking, from memory or with one query
+    :param kind: 'book' or 'genre'
+    :param window: length of the sliding window in days
+    :param limit:
+    :return: list of dicts with rank, key, label and loans
+    '''
+    version = _version.current()
+    if version != _rankings['version']:
+        _rankings.update(entries={}, version=version)
+    entries = _rankings['entries'].get((kind, window))
+    if entries is None:
+        entries = [_entry(ranking) for ranking in Ranking.objects.filter(
+            kind=kind, window=window).order_by('rank')[:RANKING_SIZE]]
+        _rankings['entries'][kind, window] = entries
+    return entries[:limit]
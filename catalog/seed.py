@@ -0,0 +1,312 @@
+'''
+Synthetic library data for benchmarks and profiling ("manage.py
+seed_library").
+
+The data is generated from a seeded random.Random, so the same arguments
+always produce the same rows. Popularity is skewed the way real catalogues
+are: a few authors write many of the books, a few genres and languages
+cover most of them and a few readers borrow most of the copies (Zipf
+weights). Rows get explicit ids, continuing after the existing ones, so
+nothing has to be read back and they are written as plain tuples with
+batched INSERTs (insert_rows()), many-to-many links included.
+
+Signals are bypassed: run facets.rebuild_facets() afterwards (the
+autocomplete indexes are invalidated here).
+'''
+import bisect
+import contextlib
+import datetime
+import functools
+import random
+import uuid
+from collections import Counter
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.color import no_style
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from . import autocomplete
+from .barcodes import new_barcodes
+from .isbn import isbn13_check_digit
+from .ledger import month_of
+from .models import (Author, Book, BookInstance, Genre, Language, LoanEvent,
+                     search_key)
+
+GENRES = (
+    'Fiction', 'Fantasy', 'Science Fiction', 'Mystery', 'Thriller',
+    'Romance', 'History', 'Biography', 'Children', 'Poetry', 'Horror',
+    'Philosophy', 'Science', 'Travel', 'Cookery', 'Art', 'Drama', 'Humour',
+    'Politics', 'Religion', 'Economics', 'Psychology', 'Graphic Novels',
+    'Short Stories',
+)
+
+LANGUAGES = (
+    'English', 'Spanish', 'French', 'German', 'Italian', 'Portuguese',
+    'Russian', 'Japanese', 'Chinese', 'Croatian', 'Dutch', 'Swedish',
+)
+
+FIRST_NAMES = (
+    'Anna', 'Boris', 'Clara', 'David', 'Elena', 'Frank', 'Grace', 'Hugo',
+    'Ivana', 'John', 'Karen', 'Luka', 'Maria', 'Nikola', 'Olga', 'Peter',
+    'Rosa', 'Stefan', 'Tara', 'Victor',
+)
+
+LAST_NAMES = (
+    'Smith', 'Horvat', 'Garcia', 'Muller', 'Rossi', 'Silva', 'Ivanov',
+    'Tanaka', 'Wang', 'Kovac', 'Jansen', 'Larsson', 'Dubois', 'Novak',
+    'Brown', 'Petrov', 'Lopez', 'Weber', 'Conti', 'Babic',
+)
+
+TITLE_WORDS = (
+    'Shadow', 'River', 'Winter', 'Garden', 'Silent', 'City', 'Last', 'Night',
+    'Stone', 'Empire', 'Secret', 'Summer', 'Glass', 'House', 'Lost', 'Sea',
+    'Iron', 'Light', 'Forgotten', 'Kingdom', 'Red', 'Road', 'Star', 'Wind',
+)
+
+IMPRINTS = ('Penguin', 'Vintage', 'Picador', 'Faber', 'Tor', 'Orbit',
+            'Harper', 'Bloomsbury')
+
+# password of every generated user, hashed once
+PASSWORD = 'library'
+
+
+def zipf_weights(count, exponent=1.0):
+    '''
+    Cumulative Zipf weights for random.choices(cum_weights=...): the item
+    of rank r is picked with a probability proportional to 1 / r**exponent
+    :param count:
+    :param exponent:
+    :return:
+    '''
+    weights, total = [], 0.0
+    for rank in range(1, count + 1):
+        total += 1.0 / rank ** exponent
+        weights.append(total)
+    return weights
+
+
+def _next_id(model):
+    return (model.objects.aggregate(Max('pk'))['pk__max'] or 0) + 1
+
+
+def _adapter(field):
+    '''
+    Returns the function turning a value of field into its database
+    representation, or None when the driver takes the value as it is
+    :param field:
+    :return:
+    '''
+    # the real connection rather than the django.db.connection proxy
+    def prepare(value, connection=connections[DEFAULT_DB_ALIAS]):
+        return field.get_db_prep_save(value, connection)
+    internal_type = field.get_internal_type()
+    if internal_type == 'UUIDField':
+        return prepare
+    if internal_type in ('DateField', 'DateTimeField'):
+        # few distinct values
+        return functools.lru_cache(maxsize=None)(prepare)
+    return None
+
+
+def insert_rows(model, fields, rows):
+    '''
+    Batched INSERT of plain value tuples. It does what bulk_create does for
+    models without signals or auto ids, minus building a model instance
+    and compiling an INSERT per batch, which cost ten times more than
+    SQLite spends writing the rows.
+    :param model:
+    :param fields: field names, in the order of the values of a row
+    :param rows: iterable of tuples
+    :return: number of rows written
+    '''
+    fields = [model._meta.get_field(name) for name in fields]
+    adapters = [(index, adapter) for index, adapter in enumerate(
+        map(_adapter, fields)) if adapter]
+    quote = connection.ops.quote_name
+    sql = 'INSERT INTO %s (%s) VALUES (%s)' % (
+        quote(model._meta.db_table),
+        ', '.join(quote(field.column) for field in fields),
+        ', '.join(['%s'] * len(fields)))
+    if adapters:
+        rows = [list(row) for row in rows]
+        for row in rows:
+            for index, adapter in adapters:
+                if row[index] is not None:
+                    row[index] = adapter(row[index])
+    else:
+        rows = list(rows)
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, rows)
+    return len(rows)
+
+
+@contextlib.contextmanager
+def deferred_indexes(*models):
+    '''
+    On SQLite, drops the secondary indexes of the tables of models and
+    recreates them on exit: building an index once costs a fraction of
+    updating it for every inserted row
+    :param models:
+    '''
+    if connection.vendor != 'sqlite':
+        yield
+        return
+    tables = [model._meta.db_table for model in models]
+    with connection.cursor() as cursor:
+        # indexes backing PRIMARY KEY and UNIQUE constraints have no sql
+        cursor.execute(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND "
+            "sql IS NOT NULL AND tbl_name IN (%s)"
+            % ', '.join(['%s'] * len(tables)), tables)
+        indexes = cursor.fetchall()
+        for name, _ in indexes:
+            cursor.execute('DROP INDEX %s' % connection.ops.quote_name(name))
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            for _, sql in indexes:
+                cursor.execute(sql)
+
+
+def seed_library(books, copies_per_book=3, users=1000, loan_ratio=0.3,
+                 seed=0, today=None):
+    '''
+    Generates and inserts a synthetic library in a single transaction
+    :param books: number of books
+    :param copies_per_book: average number of copies of a book
+    :param users: number of readers
+    :param loan_ratio: share of the copies that are on loan
+    :param seed: random seed
+    :param today: date the due dates are relative to, defaults to today
+    :return: dict of model name to number of rows written
+    '''
+    rand = random.Random(seed)
+    today = today or datetime.date.today()
+    written = Counter()
+
+    def insert(model, fields, rows):
+        written[model._meta.label] += insert_rows(model, fields, rows)
+
+    with transaction.atomic(), deferred_indexes(
+            Author, Book, Book.genre.through, BookInstance, LoanEvent):
+        first_genre = _next_id(Genre)
+        genre_ids = list(range(first_genre, first_genre + len(GENRES)))
+        insert(Genre, ('id', 'name'), zip(genre_ids, GENRES))
+        first_language = _next_id(Language)
+        language_ids = list(range(first_language,
+                                  first_language + len(LANGUAGES)))
+        insert(Language, ('id', 'language'), zip(language_ids, LANGUAGES))
+
+        # about eight books per author on average, most by a few authors
+        first_author = _next_id(Author)
+        author_ids = list(range(first_author,
+                                first_author + max(1, books // 8)))
+        names = [(rand.choice(FIRST_NAMES), rand.choice(LAST_NAMES))
+                 for _ in author_ids]
+        insert(Author, ('id', 'first_name', 'last_name', 'first_name_key',
+                        'last_name_key', 'date_of_birth'), (
+            (pk, first, last, search_key(first), search_key(last),
+             datetime.date(rand.randint(1850, 1990), rand.randint(1, 12),
+                           rand.randint(1, 28)))
+            for pk, (first, last) in zip(author_ids, names)))
+
+        first_user = _next_id(User)
+        user_ids = list(range(first_user, first_user + users))
+        password = make_password(PASSWORD)
+        joined = timezone.make_aware(datetime.datetime.combine(
+            today - datetime.timedelta(days=365), datetime.time(12)))
+        User.objects.bulk_create(
+            User(id=pk, username='reader%d' % pk, password=password,
+                 first_name=rand.choice(FIRST_NAMES),
+                 last_name=rand.choice(LAST_NAMES), date_joined=joined)
+            for pk in user_ids)
+        written[User._meta.label] += users
+
+        first_book = _next_id(Book)
+        book_authors = rand.choices(author_ids, k=books,
+                                    cum_weights=zipf_weights(len(author_ids)))
+        book_languages = rand.choices(
+            language_ids, k=books,
+            cum_weights=zipf_weights(len(language_ids), 2.0))
+        genre_weights = zipf_weights(len(genre_ids))
+        reader_weights = zipf_weights(len(user_ids))
+        # random.randint() and random.choice() cost more than inserting a
+        # row, so the hot loop picks from precomputed values with random()
+        uniform = rand.random
+        titles = [' '.join(rand.sample(TITLE_WORDS, rand.randint(1, 4)))
+                  for _ in range(1000)]
+        imprints = ['%s, %d' % (imprint, year) for imprint in IMPRINTS
+                    for year in range(1950, 2018)]
+        statuses = 'aaaaaaaaamr'
+        # a three week loan; some are overdue
+        loans = []
+        for days in range(-14, 22):
+            due_back = today + datetime.timedelta(days=days)
+            checkout = joined + datetime.timedelta(
+                days=(due_back - joined.date()).days - 21)
+            loans.append((due_back, checkout, month_of(checkout)))
+        # 1 to 2 * copies_per_book - 1 copies, none at all for 0
+        copy_counts = range(1, 2 * copies_per_book) if copies_per_book \
+            else range(1)
+        batch = 10000
+        for start in range(first_book, first_book + books, batch):
+            chunk = range(start, min(start + batch, first_book + books))
+            # valid ISBN-13s: 978, the book id and the check digit
+            isbns = ['978%09d' % pk for pk in chunk]
+            chunk_titles = [titles[int(uniform() * len(titles))]
+                            for _ in chunk]
+            insert(Book, ('id', 'title', 'title_key', 'summary', 'isbn',
+                          'isbn13', 'author', 'publication_language',
+                          'is_available'), (
+                (pk, title, search_key(title), '', isbn, isbn,
+                 book_authors[pk - first_book],
+                 book_languages[pk - first_book], False)
+                for pk, title, isbn in zip(chunk, chunk_titles, (
+                    isbn + isbn13_check_digit(isbn) for isbn in isbns))))
+            # one to three genres per book
+            genres = iter(rand.choices(genre_ids, k=3 * len(chunk),
+                                       cum_weights=genre_weights))
+            insert(Book.genre.through, ('book', 'genre'), (
+                (pk, genre_id) for pk in chunk
+                for genre_id in {next(genres)
+                                 for _ in range(1 + int(uniform() * 3))}))
+
+            copies, events = [], []
+            for pk in chunk:
+                for _ in range(copy_counts[int(uniform() * len(copy_counts))]):
+                    copy_id = uuid.UUID(int=rand.getrandbits(128), version=4)
+                    imprint = imprints[int(uniform() * len(imprints))]
+                    if users and uniform() < loan_ratio:
+                        borrower = user_ids[bisect.bisect(
+                            reader_weights, uniform() * reader_weights[-1])]
+                        due_back, checkout, month = loans[
+                            int(uniform() * len(loans))]
+                        copies.append((copy_id, pk, imprint, due_back, 'o',
+                                       borrower))
+                        events.append((copy_id, pk, borrower, 'o', 'o',
+                                       due_back, checkout, month))
+                    else:
+                        copies.append((copy_id, pk, imprint, None,
+                                       statuses[int(uniform() * 11)], None))
+            # in primary key order, appending to the index instead of
+            # inserting all over it
+            copies.sort(key=lambda row: row[0].int)
+            insert(BookInstance, ('id', 'book', 'imprint', 'due_back',
+                                  'status', 'borrower', 'barcode'), (
+                copy + (barcode,) for copy, barcode in zip(
+                    copies, new_barcodes(len(copies)))))
+            insert(LoanEvent, ('copy_id', 'book', 'borrower', 'event',
+                               'status', 'due_back', 'created', 'month'),
+                   events)
+
+        # explicit ids do not advance PostgreSQL sequences
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(
+                    no_style(), [Genre, Language, Author, User, Book]):
+                cursor.execute(sql)
+    autocomplete.invalidate()
+    return dict(written)
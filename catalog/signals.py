@@ -0,0 +1,134 @@
+'''
+Signal receivers of the catalog, connected in CatalogConfig.ready()
+'''
+import contextlib
+import threading
+
+from django.contrib.auth.models import Group, Permission, User
+from django.db.models.signals import m2m_changed, post_delete, post_init, \
+    post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import autocomplete, barcodes, branches, facets, ledger, usercache
+from .models import Author, Book, BookInstance, Branch
+
+_batched = threading.local()
+
+
+@contextlib.contextmanager
+def batched_copy_deletes():
+    '''
+    Skips the availability and loan cache updates of every copy deleted in
+    the enclosed block; the caller makes them once for the whole batch
+    '''
+    _batched.active = True
+    try:
+        yield
+    finally:
+        _batched.active = False
+
+
+@receiver(post_init, sender=BookInstance)
+def remember_loan_state(sender, instance, **kwargs):
+    # compared against in post_save to find out what changed
+    instance._loan_state = ledger.loan_state(instance)
+    instance._facet_book_id = instance.__dict__.get('book_id')
+
+
+@receiver(pre_save, sender=BookInstance)
+def assign_barcode(sender, instance, raw=False, **kwargs):
+    if not raw and not instance.barcode:
+        instance.barcode, = barcodes.new_barcodes()
+
+
+@receiver(post_save, sender=BookInstance)
+def record_loan_event(sender, instance, created, raw=False, using=None,
+                      **kwargs):
+    if raw:
+        return
+    old_state = None if created else instance._loan_state
+    event = ledger.classify(old_state, instance)
+    if event:
+        ledger.record([ledger.make_event(instance, event)], using=using)
+    if (created or old_state[0] != instance.status or
+            instance._facet_book_id != instance.book_id):
+        facets.sync_availability([instance._facet_book_id, instance.book_id])
+    if (created or old_state != ledger.loan_state(instance) or
+            instance._facet_book_id != instance.book_id):
+        usercache.invalidate_loans([old_state and old_state[2],
+                                    instance.borrower_id])
+    instance._loan_state = ledger.loan_state(instance)
+    instance._facet_book_id = instance.book_id
+
+
+@receiver(post_delete, sender=BookInstance)
+def update_availability_on_copy_delete(sender, instance, **kwargs):
+    if getattr(_batched, 'active', False):
+        return
+    facets.sync_availability([instance.book_id])
+    usercache.invalidate_loans([instance.borrower_id])
+
+
+@receiver(post_init, sender=Book)
+def remember_facet_state(sender, instance, **kwargs):
+    instance._facet_state = facets.facet_state(instance)
+
+
+@receiver(post_save, sender=Book)
+def update_book_facets(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    facets.book_saved(instance, created, instance._facet_state)
+    instance._facet_state = facets.facet_state(instance)
+    if not created:
+        usercache.invalidate_book_loans([instance.pk])
+
+
+@receiver(pre_delete, sender=Book)
+def remember_book_genres(sender, instance, **kwargs):
+    facets.book_deleting(instance)
+    # its copies lose their book without a signal
+    usercache.invalidate_book_loans([instance.pk])
+
+
+@receiver(post_delete, sender=Book)
+def update_facets_on_book_delete(sender, instance, **kwargs):
+    facets.book_deleted(instance)
+
+
+@receiver(m2m_changed, sender=Book.genre.through)
+def update_genre_facets(sender, instance, action, reverse, pk_set,
+                        **kwargs):
+    facets.genres_changed(instance, action, reverse, pk_set)
+
+
+@receiver(m2m_changed, sender=User.user_permissions.through)
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=Group.permissions.through)
+def invalidate_permissions(sender, action, **kwargs):
+    if action.startswith('post_'):
+        usercache.invalidate_permissions()
+
+
+@receiver(post_delete, sender=Group)
+@receiver(post_delete, sender=Permission)
+def invalidate_permissions_on_delete(sender, **kwargs):
+    usercache.invalidate_permissions()
+
+
+@receiver(post_save, sender=Author)
+@receiver(post_save, sender=Book)
+def update_autocomplete(sender, instance, using=None, **kwargs):
+    autocomplete.object_changed(instance, using=using)
+
+
+@receiver(post_delete, sender=Author)
+@receiver(post_delete, sender=Book)
+def update_autocomplete_on_delete(sender, instance, using=None, **kwargs):
+    autocomplete.object_changed(instance, deleted=True, using=using)
+
+
+@receiver(post_save, sender=Branch)
+@receiver(post_delete, sender=Branch)
+def invalidate_branches(sender, **kwargs):
+    branches.invalidate_branches()
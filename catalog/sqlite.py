@@ -0,0 +1,58 @@
+'''
+SQLite performance profile.
+
+Branch libraries that run on the default db.sqlite3 get WAL journaling,
+relaxed fsyncs, a memory-mapped read path, a bigger page cache and a busy
+timeout applied to every new connection, so concurrent gunicorn workers
+can read while another worker writes instead of failing with "database is
+locked".
+'''
+from django.conf import settings
+
+
+def apply_pragmas(cursor, pragmas):
+    '''
+    Runs "PRAGMA name = value" for every item of pragmas on the cursor
+    :param cursor: DB-API cursor of a SQLite connection
+    :param pragmas: dict of pragma names to values
+    :return:
+    '''
+    for name, value in pragmas.items():
+        cursor.execute('PRAGMA %s = %s' % (name, value))
+
+
+def configure_connection(sender, connection, **kwargs):
+    '''
+    connection_created receiver applying settings.SQLITE_PRAGMAS to new
+    SQLite connections
+    :param sender:
+    :param connection: the Django DatabaseWrapper that was just opened
+    :return:
+    '''
+    if connection.vendor != 'sqlite' or not getattr(
+            settings, 'SQLITE_TUNING', False):
+        return
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', {})
+    if connection.is_in_memory_db():
+        # WAL and mmap are meaningless for an in-memory database (tests)
+        pragmas = {name: value for name, value in pragmas.items()
+                   if name not in ('journal_mode', 'mmap_size')}
+    with connection.cursor() as cursor:
+        apply_pragmas(cursor, pragmas)
+
+
+def optimize(connection, analyze=False):
+    '''
+    Refreshes the query planner statistics of a SQLite database and
+    truncates the WAL file
+    :param connection: Django DatabaseWrapper
+    :param analyze: run a full ANALYZE instead of the cheaper
+    "PRAGMA optimize", which only analyzes tables that need it
+    :return: list of the statements that were run
+    '''
+    statements = ['ANALYZE' if analyze else 'PRAGMA optimize',
+                  'PRAGMA wal_checkpoint(TRUNCATE)']
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+    return statements
@@ -0,0 +1,122 @@
+'''
+Start-up profiler, run in a fresh interpreter by "manage.py
+profile_startup" (python -m catalog.startup).
+
+It times what a gunicorn worker goes through on boot: django.setup() (the
+settings and every app, admin autodiscovery included), the WSGI
+application (middleware) and then the warm-up steps of catalog/warmup.py,
+which would otherwise be paid by the first request. Every import is timed
+by an import hook (python -X importtime only exists from Python 3.7), and
+the report is written to stdout as JSON.
+'''
+import importlib.abc
+import json
+import os
+import sys
+import time
+
+
+class ImportTimer(importlib.abc.MetaPathFinder):
+    '''
+    Meta path finder timing how long every module takes to execute:
+    cumulative time (its own imports included) and self time
+    '''
+
+    def __init__(self):
+        self.cumulative = {}
+        self.own = {}
+        # time spent in the imports of the modules being executed
+        self.stack = []
+
+    def find_spec(self, fullname, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, 'find_spec'):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+        loader = spec.loader
+        if loader is None or not hasattr(loader, 'exec_module'):
+            return spec
+        exec_module = loader.exec_module
+
+        def timed_exec_module(module):
+            self.stack.append(0.0)
+            start = time.perf_counter()
+            try:
+                exec_module(module)
+            finally:
+                elapsed = time.perf_counter() - start
+                children = self.stack.pop()
+                if self.stack:
+                    self.stack[-1] += elapsed
+                self.cumulative[fullname] = elapsed
+                self.own[fullname] = elapsed - children
+        # the loader can be shared by several modules (e.g. built-ins)
+        spec.loader = _TimedLoader(loader, timed_exec_module)
+        return spec
+
+    def install(self):
+        sys.meta_path.insert(0, self)
+
+    def uninstall(self):
+        sys.meta_path.remove(self)
+
+
+class _TimedLoader(importlib.abc.Loader):
+
+    def __init__(self, loader, exec_module):
+        self.loader = loader
+        self.exec_module = exec_module
+
+    def create_module(self, spec):
+        return self.loader.create_module(spec)
+
+    def __getattr__(self, name):
+        # get_source(), get_resource_reader() etc. of the real loader
+        return getattr(self.loader, name)
+
+
+def profile_startup(warm_up=True):
+    '''
+    Boots Django in this process, which must not have imported it yet
+    :param warm_up: whether to time the warm-up steps too
+    :return: dict with "phases" [(name, seconds)], "warmup" [(step,
+    count, seconds)] and "imports" {module: [cumulative, self seconds]}
+    '''
+    timer = ImportTimer()
+    timer.install()
+    phases = []
+    start = time.perf_counter()
+    import django
+    django.setup()
+    phases.append(('django.setup', time.perf_counter() - start))
+    start = time.perf_counter()
+    from django.core.handlers.wsgi import WSGIHandler
+    WSGIHandler()
+    phases.append(('wsgi application', time.perf_counter() - start))
+    timings = []
+    if warm_up:
+        from catalog.warmup import warm_up as run_warm_up
+        start = time.perf_counter()
+        timings = run_warm_up()
+        phases.append(('warm-up', time.perf_counter() - start))
+    timer.uninstall()
+    return {
+        'phases': phases,
+        'warmup': timings,
+        'imports': {name: [timer.cumulative[name], timer.own[name]]
+                    for name in timer.cumulative},
+    }
+
+
+def main():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'locallibrary.settings')
+    json.dump(profile_startup(warm_up='--no-warm-up' not in sys.argv),
+              sys.stdout)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+/* loads the choices of AutocompleteSelect (catalog/forms.py) as the user types */
+(function() {
+    'use strict';
+
+    var DELAY = 200;
+
+    function load(select, input) {
+        var request = new XMLHttpRequest();
+        var query = input.value;
+        request.open('GET', select.getAttribute('data-url') + '?q=' +
+                     encodeURIComponent(query));
+        request.onload = function() {
+            if (request.status !== 200 || input.value !== query) {
+                return;
+            }
+            var data = JSON.parse(request.responseText);
+            // keep the empty and the selected option
+            Array.prototype.slice.call(select.options).forEach(
+                function(option) {
+                    if (option.value && !option.selected) {
+                        select.removeChild(option);
+                    }
+                });
+            data.results.forEach(function(result) {
+                if (String(result.id) === select.value) {
+                    return;
+                }
+                var option = document.createElement('option');
+                option.value = result.id;
+                option.textContent = result.text;
+                select.appendChild(option);
+            });
+        };
+        request.send();
+    }
+
+    document.addEventListener('DOMContentLoaded', function() {
+        var selects = document.querySelectorAll('select.autocomplete');
+        Array.prototype.forEach.call(selects, function(select) {
+            var input = document.createElement('input');
+            var timer = null;
+            input.type = 'search';
+            input.placeholder = 'Type to search';
+            input.setAttribute('autocomplete', 'off');
+            select.parentNode.insertBefore(input, select);
+            input.addEventListener('input', function() {
+                clearTimeout(timer);
+                if (input.value.trim()) {
+                    timer = setTimeout(function() {
+                        load(select, input);
+                    }, DELAY);
+                }
+            });
+        });
+    });
+})();
@@ -0,0 +1,41 @@
+/* pages in the related objects of LazyTabularInline (catalog/inlines.py) */
+(function() {
+    'use strict';
+
+    function loadMore(container, button) {
+        var request = new XMLHttpRequest();
+        request.open('GET', container.getAttribute('data-url') + '?after=' +
+                     encodeURIComponent(container.getAttribute('data-after')));
+        request.onload = function() {
+            if (request.status !== 200) {
+                return;
+            }
+            var data = JSON.parse(request.responseText);
+            var list = container.querySelector('.lazy-inline-rows');
+            data.rows.forEach(function(row) {
+                var item = document.createElement('li');
+                var link = document.createElement('a');
+                link.href = row.url;
+                link.textContent = row.text;
+                item.appendChild(link);
+                list.appendChild(item);
+            });
+            if (data.next) {
+                container.setAttribute('data-after', data.next);
+            } else {
+                button.parentNode.removeChild(button);
+            }
+        };
+        request.send();
+    }
+
+    document.addEventListener('DOMContentLoaded', function() {
+        var containers = document.querySelectorAll('.lazy-inline');
+        Array.prototype.forEach.call(containers, function(container) {
+            var button = container.querySelector('.lazy-inline-more');
+            button.addEventListener('click', function() {
+                loadMore(container, button);
+            });
+        });
+    });
+})();
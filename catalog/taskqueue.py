@@ -0,0 +1,239 @@
+'''
+Database-backed background task queue.
+
+Functions registered with @task are queued with enqueue() and run by
+"manage.py run_tasks" in child processes, so web requests never wait on
+SMTP or batch work. Failed tasks are retried with exponential backoff up
+to Task.max_attempts times.
+
+Each task runs in a process forked for it (the worker needs os.fork(), as
+on Linux), killed when it runs longer than the timeout: the task then
+counts as failed and is retried. A claimed task is leased to its worker
+until TASK_LEASE_MARGIN seconds past its timeout, so only the tasks of a
+worker that died are claimed again (tasks must therefore be safe to run
+again).
+'''
+import datetime
+import json
+import os
+import select
+import signal
+import sys
+import time
+import traceback
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Task
+
+# name -> function
+REGISTRY = {}
+
+# seconds before the first retry, doubled on every following attempt
+TASK_RETRY_BACKOFF = getattr(settings, 'TASK_RETRY_BACKOFF', 10)
+TASK_RETRY_BACKOFF_MAX = getattr(settings, 'TASK_RETRY_BACKOFF_MAX', 3600)
+# seconds a claimed task stays leased past its timeout, after which the
+# task of a worker that died is claimed again
+TASK_LEASE_MARGIN = getattr(settings, 'TASK_LEASE_MARGIN', 30)
+
+
+def task(func):
+    '''
+    Registers func as a task under its name
+    :param func:
+    :return:
+    '''
+    REGISTRY[func.__name__] = func
+    return func
+
+
+def enqueue(name, *args, **kwargs):
+    '''
+    Queues a call of the registered task name with JSON serializable
+    arguments
+    :param name:
+    :return: the Task
+    '''
+    if name not in REGISTRY:
+        raise KeyError('Unknown task "%s"' % name)
+    return Task.objects.create(name=name, payload=json.dumps(
+        {'args': args, 'kwargs': kwargs}))
+
+
+def claim_tasks(limit, timeout):
+    '''
+    Marks up to limit due tasks as running and returns them. Tasks whose
+    lease expired (their worker died) are claimed again.
+    :param limit:
+    :param timeout: lease length in seconds
+    :return: list of Tasks
+    '''
+    now = timezone.now()
+    with transaction.atomic():
+        tasks = list(Task.objects.select_for_update(skip_locked=True).filter(
+            Q(status='q', run_after__lte=now) |
+            Q(status='r', locked_until__lt=now)).order_by(
+            'run_after', 'id')[:limit])
+        for claimed in tasks:
+            claimed.status = 'r'
+            claimed.attempts += 1
+            claimed.locked_until = now + datetime.timedelta(seconds=timeout)
+            claimed.save(update_fields=['status', 'attempts',
+                                        'locked_until'])
+    return tasks
+
+
+def retry_delay(attempts):
+    '''
+    Seconds to wait before the next attempt of a task that failed attempts
+    times
+    :param attempts:
+    :return:
+    '''
+    return min(TASK_RETRY_BACKOFF * 2 ** (attempts - 1),
+               TASK_RETRY_BACKOFF_MAX)
+
+
+def _execute(name, payload):
+    '''
+    Runs a task
+    :param name:
+    :param payload: JSON arguments
+    :return: None, or the traceback of its failure
+    '''
+    try:
+        payload = json.loads(payload)
+        REGISTRY[name](*payload.get('args', ()), **payload.get('kwargs', {}))
+    except Exception:
+        return traceback.format_exc()
+    finally:
+        connections.close_all()
+
+
+class _Child(object):
+    '''
+    A process forked to run a claimed task. It writes "0" (success) or "1"
+    and the traceback of the failure to a pipe and exits.
+    '''
+
+    def __init__(self, claimed, timeout):
+        self.claimed = claimed
+        self.deadline = time.monotonic() + timeout
+        self.output = b''
+        # the child must not share the database connections of the worker
+        connections.close_all()
+        self.reader, writer = os.pipe()
+        # os.fork() rather than multiprocessing, which refuses to start
+        # children from daemonic processes (e.g. a worker run by a pool)
+        self.pid = os.fork()
+        if self.pid == 0:
+            os.close(self.reader)
+            status = 1
+            try:
+                error = _execute(claimed.name, claimed.payload)
+                with os.fdopen(writer, 'wb') as results:
+                    results.write(b'0' if error is None
+                                  else b'1' + error.encode('utf-8'))
+                status = 0
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(status)
+        os.close(writer)
+
+    def read(self):
+        '''
+        Reads what the child has written
+        :return: whether it is done (the pipe is closed)
+        '''
+        chunk = os.read(self.reader, 65536)
+        self.output += chunk
+        return not chunk
+
+    def result(self):
+        '''
+        Reaps the child, once read() returned True
+        :return: None when the task succeeded, the error otherwise
+        '''
+        os.close(self.reader)
+        _, status = os.waitpid(self.pid, 0)
+        if self.output[:1] == b'0':
+            return None
+        if self.output[:1] == b'1':
+            return self.output[1:].decode('utf-8', 'replace')
+        return 'Exited with status %s' % status
+
+    def kill(self):
+        os.kill(self.pid, signal.SIGKILL)
+        os.waitpid(self.pid, 0)
+        os.close(self.reader)
+
+
+def _finish(claimed, error=None):
+    if error is None:
+        claimed.status = 'd'
+        claimed.last_error = ''
+    elif claimed.attempts >= claimed.max_attempts:
+        claimed.status = 'f'
+        claimed.last_error = error
+    else:
+        claimed.status = 'q'
+        claimed.last_error = error
+        claimed.run_after = timezone.now() + datetime.timedelta(
+            seconds=retry_delay(claimed.attempts))
+    claimed.locked_until = None
+    claimed.save(update_fields=['status', 'last_error', 'run_after',
+                                'locked_until'])
+
+
+def run_tasks(concurrency=4, timeout=60, poll_interval=1.0, once=False,
+              log=None):
+    '''
+    Runs queued tasks, each in a child process, up to concurrency at the
+    same time
+    :param concurrency: number of tasks run at the same time
+    :param timeout: seconds a task may run before its process is killed
+    and the task counted as failed
+    :param poll_interval: seconds to sleep when the queue is empty
+    :param once: return as soon as the queue is empty and no task runs
+    :param log: optional callable taking a line of text
+    :return: number of tasks run
+    '''
+    processed = 0
+    # pipe -> _Child of the tasks being run
+    running = {}
+    while True:
+        free = concurrency - len(running)
+        for claimed in claim_tasks(free, timeout + TASK_LEASE_MARGIN) \
+                if free else ():
+            child = _Child(claimed, timeout)
+            running[child.reader] = child
+        if not running:
+            if once:
+                return processed
+            time.sleep(poll_interval)
+            continue
+        wait_for = min(child.deadline for child in running.values())
+        readable, _, _ = select.select(list(running), [], [], max(
+            0, min(poll_interval, wait_for - time.monotonic())))
+        finished = []
+        for reader in readable:
+            if running[reader].read():
+                child = running.pop(reader)
+                finished.append((child, child.result()))
+        now = time.monotonic()
+        for reader, child in list(running.items()):
+            if now >= child.deadline:
+                del running[reader]
+                child.kill()
+                finished.append((child, 'Timed out after %ss' % timeout))
+        for child, error in finished:
+            claimed = child.claimed
+            _finish(claimed, error)
+            processed += 1
+            if log:
+                log('%s #%s %s' % (claimed.name, claimed.pk,
+                                   claimed.get_status_display()))
@@ -0,0 +1,128 @@
+'''
+Background tasks of the catalog, run by "manage.py run_tasks"
+'''
+import base64
+import datetime
+import email
+from email.mime.base import MIMEBase
+from email.message import Message
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+
+from .holds import expire_holds as _expire_holds
+from .ledger import rollup_day
+from .rankings import refresh_rankings
+from .taskqueue import task
+
+
+class _MIMEAttachment(MIMEBase):
+    '''
+    MIMEBase the email parser can instantiate, so that parsed attachments
+    are recognised as such by EmailMessage
+    '''
+
+    def __init__(self, policy=None):
+        Message.__init__(self, **({'policy': policy} if policy else {}))
+
+
+def _serialize_attachment(attachment):
+    if isinstance(attachment, MIMEBase):
+        # a complete MIME part, as bytes
+        return {'mime': base64.b64encode(attachment.as_bytes()).decode(
+            'ascii')}
+    filename, content, mimetype = attachment
+    return (filename, base64.b64encode(
+        content if isinstance(content, bytes)
+        else content.encode('utf-8')).decode('ascii'), mimetype)
+
+
+def serialize_email(message):
+    '''
+    Turns an EmailMessage into a JSON serializable dict for send_email
+    :param message:
+    :return:
+    '''
+    return {
+        'subject': message.subject,
+        'body': message.body,
+        'from_email': message.from_email,
+        'to': message.to,
+        'cc': message.cc,
+        'bcc': message.bcc,
+        'reply_to': message.reply_to,
+        'headers': message.extra_headers,
+        'alternatives': getattr(message, 'alternatives', []),
+        # (filename, base64 content, mimetype) attachments, or
+        # {'mime': base64 MIME part} for MIMEBase ones
+        'attachments': [_serialize_attachment(attachment)
+                        for attachment in message.attachments],
+    }
+
+
+@task
+def send_email(message):
+    '''
+    Delivers an email queued by catalog.mail.QueuedEmailBackend through
+    settings.TASKS_EMAIL_BACKEND
+    :param message: dict made by serialize_email
+    :return:
+    '''
+    mail = EmailMultiAlternatives(
+        subject=message['subject'], body=message['body'],
+        from_email=message['from_email'], to=message['to'],
+        cc=message['cc'], bcc=message['bcc'],
+        reply_to=message['reply_to'], headers=message['headers'],
+        alternatives=[tuple(alternative)
+                      for alternative in message['alternatives']],
+        connection=get_connection(settings.TASKS_EMAIL_BACKEND))
+    for attachment in message['attachments']:
+        if isinstance(attachment, dict):
+            mail.attach(email.message_from_bytes(
+                base64.b64decode(attachment['mime']),
+                _class=_MIMEAttachment))
+        else:
+            filename, content, mimetype = attachment
+            mail.attach(filename, base64.b64decode(content), mimetype)
+    mail.send()
+
+
+@task
+def expire_holds(date=None):
+    '''
+    Background variant of "manage.py expire_holds"
+    :param date: ISO date string, defaults to today
+    :return:
+    '''
+    today = None
+    if date:
+        today = datetime.datetime.strptime(date, '%Y-%m-%d').date()
+    _expire_holds(today=today)
+
+
+@task
+def rollup_loans(date=None, days=2):
+    '''
+    Background variant of "manage.py rollup_loans"
+    :param date: ISO date string of the last day, defaults to today
+    :param days: number of days up to date to roll up
+    :return:
+    '''
+    last_day = datetime.date.today()
+    if date:
+        last_day = datetime.datetime.strptime(date, '%Y-%m-%d').date()
+    for offset in range(days):
+        rollup_day(last_day - datetime.timedelta(days=offset))
+
+
+@task
+def compute_rankings(windows=None):
+    '''
+    Background variant of "manage.py compute_rankings"
+    :param windows: sliding windows in days, defaults to RANKING_WINDOWS
+    :return:
+    '''
+    if windows:
+        refresh_rankings(windows=windows)
+    else:
+        refresh_rankings()
@@ -0,0 +1,125 @@
+'''
+Test data builders shared by the catalog tests.
+
+They insert rows with bulk_create (one query per model rather than one per
+object) and are meant to be called from setUpTestData, so a TestCase builds
+its data once for all of its tests. bulk_create bypasses model signals: no
+loan events are recorded for copies created here.
+
+CacheIsolationMixin gives each test a cache of its own, set up for a
+shared or a per-process cache.
+'''
+import uuid
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Permission, User
+from django.test import override_settings
+
+from catalog.facets import sync_availability
+from catalog.models import Author, Book, BookInstance, Genre, Language
+from catalog.usercache import (CACHED_PERMISSIONS_BACKEND,
+                               CACHED_SESSION_ENGINE)
+
+PASSWORD = '12345'
+
+
+def cache_settings(shared):
+    '''
+    Settings of a cache no other test uses (a unique KEY_PREFIX), with the
+    session engine and authentication backend settings.py picks for it
+    :param shared: whether it stands for a cache shared by every process
+    :return: keyword arguments of override_settings()
+    '''
+    return {
+        'CACHES': {'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'KEY_PREFIX': uuid.uuid4().hex,
+        }},
+        'SHARED_CACHE': shared,
+        'SESSION_ENGINE': CACHED_SESSION_ENGINE if shared
+        else 'django.contrib.sessions.backends.db',
+        'AUTHENTICATION_BACKENDS': [CACHED_PERMISSIONS_BACKEND] if shared
+        else ['django.contrib.auth.backends.ModelBackend'],
+    }
+
+
+class CacheIsolationMixin(object):
+    '''
+    TestCase mixin running every test with cache_settings(shared_cache):
+    entries cached by a test (permission sets, loan lists) never reach
+    another one, whose users may have the same primary keys
+    '''
+    shared_cache = False
+
+    def setUp(self):
+        isolated = override_settings(**cache_settings(self.shared_cache))
+        isolated.enable()
+        self.addCleanup(isolated.disable)
+        super(CacheIsolationMixin, self).setUp()
+
+
+def create_users(*usernames, password=PASSWORD, permissions=()):
+    '''
+    Creates users sharing a single password hash
+    :param usernames:
+    :param password:
+    :param permissions: names of the permissions granted to every user
+    :return: list of users, in the order of usernames
+    '''
+    hashed = make_password(password)
+    User.objects.bulk_create(User(username=username, password=hashed)
+                             for username in usernames)
+    # SQLite does not return the primary keys of bulk inserted rows
+    users = sorted(User.objects.filter(username__in=usernames),
+                   key=lambda user: usernames.index(user.username))
+    if permissions:
+        through = User.user_permissions.through
+        through.objects.bulk_create(
+            through(user_id=user.pk, permission_id=permission.pk)
+            for user in users
+            for permission in Permission.objects.filter(name__in=permissions))
+    return users
+
+
+def create_book(title='Book Title', author=('John', 'Smith'),
+                genres=('Fantasy',), language='English', **fields):
+    '''
+    Creates a book along with its author, genres and language
+    :param title:
+    :param author: (first name, last name) tuple, or None
+    :param genres: genre names
+    :param language: language name, or None
+    :param fields: other Book field values
+    :return:
+    '''
+    fields.setdefault('summary', 'My book summary')
+    fields.setdefault('isbn', 'ABCDEFG')
+    if author:
+        fields['author'] = Author.objects.create(first_name=author[0],
+                                                 last_name=author[1])
+    if language:
+        fields['publication_language'] = Language.objects.create(
+            language=language)
+    book = Book.objects.create(title=title, **fields)
+    if genres:
+        Genre.objects.bulk_create(Genre(name=name) for name in genres)
+        book.genre.add(*Genre.objects.filter(name__in=genres))
+    return book
+
+
+def create_copies(book, count=1, **fields):
+    '''
+    Creates copies of a book
+    :param book:
+    :param count:
+    :param fields: BookInstance field values; a callable is called with the
+    number of the copy (0 to count - 1) to get its value
+    :return: list of copies
+    '''
+    fields.setdefault('imprint', 'Unlikely Imprint, 2016')
+    copies = [BookInstance(book=book, **{
+        name: value(num) if callable(value) else value
+        for name, value in fields.items()}) for num in range(count)]
+    BookInstance.objects.bulk_create(copies)
+    sync_availability([book.pk])
+    return copies
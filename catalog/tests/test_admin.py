@@ -0,0 +1,145 @@
+from django.test import TestCase
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth.models import User
+from catalog.models import Author, Book, BookInstance, Genre
+from catalog.paginators import EstimatedCountPaginator, estimate_count
+
+
+class EstimatedCountPaginatorTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        for book_num in range(12):
+            Book.objects.create(title='Book %s' % book_num,
+                                summary='Summary', isbn='ABCDEFG')
+
+    def analyze(self):
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def test_no_estimate_for_filtered_queryset(self):
+        self.analyze()
+        self.assertIsNone(estimate_count(
+            Book.objects.filter(title__startswith='Book')))
+
+    def test_estimate_from_table_statistics(self):
+        self.analyze()
+        self.assertEqual(estimate_count(Book.objects.all()), 12)
+
+    def test_exact_count_below_threshold(self):
+        self.analyze()
+        Book.objects.create(title='Unanalyzed', summary='Summary',
+                            isbn='ABCDEFG')
+        paginator = EstimatedCountPaginator(Book.objects.order_by('id'), 5)
+        self.assertEqual(paginator.count, 13)
+
+    def test_estimated_count_above_threshold(self):
+        self.analyze()
+        Book.objects.create(title='Unanalyzed', summary='Summary',
+                            isbn='ABCDEFG')
+        paginator = EstimatedCountPaginator(Book.objects.order_by('id'), 5)
+        paginator.estimate_threshold = 10
+        self.assertEqual(paginator.count, 12)
+
+
+class ChangelistQueryCountTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.create_superuser('admin', 'admin@example.com', '12345')
+        author = Author.objects.create(first_name='John', last_name='Smith')
+        genres = [Genre.objects.create(name='Genre %s' % num)
+                  for num in range(3)]
+        for book_num in range(10):
+            book = Book.objects.create(title='Book %s' % book_num,
+                                       summary='Summary', isbn='ABCDEFG',
+                                       author=author)
+            book.genre = genres
+            BookInstance.objects.create(book=book, imprint='Imprint',
+                                        status='a')
+
+    def setUp(self):
+        self.client.login(username='admin', password='12345')
+
+    def get_num_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200)
+        return len(context)
+
+    def test_book_changelist_queries_do_not_grow_with_rows(self):
+        url = reverse('admin:catalog_book_changelist')
+        num_queries = self.get_num_queries(url)
+        Book.objects.create(title='Another', summary='Summary',
+                            isbn='ABCDEFG').genre = Genre.objects.all()
+        self.assertEqual(self.get_num_queries(url), num_queries)
+
+    def test_bookinstance_changelist_queries_do_not_grow_with_rows(self):
+        url = reverse('admin:catalog_bookinstance_changelist')
+        num_queries = self.get_num_queries(url)
+        BookInstance.objects.create(book=Book.objects.first(),
+                                    imprint='Imprint', status='a')
+        self.assertEqual(self.get_num_queries(url), num_queries)
+
+
+class LazyInlineTest(TestCase):
+    num_of_books = 45
+
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.create_superuser('admin', 'admin@example.com', '12345')
+        cls.author = Author.objects.create(first_name='John',
+                                           last_name='Smith')
+        for book_num in range(cls.num_of_books):
+            Book.objects.create(title='Book %s' % book_num,
+                                summary='Summary', isbn='ABCDEFG',
+                                author=cls.author)
+
+    def setUp(self):
+        self.client.login(username='admin', password='12345')
+
+    def get_inline_formset(self, resp):
+        for inline_admin_formset in resp.context['inline_admin_formsets']:
+            if inline_admin_formset.formset.model is Book:
+                return inline_admin_formset.formset
+
+    def test_change_page_renders_first_page_only(self):
+        resp = self.client.get(reverse('admin:catalog_author_change',
+                                       args=[self.author.pk]))
+        self.assertEqual(resp.status_code, 200)
+        formset = self.get_inline_formset(resp)
+        self.assertEqual(formset.initial_form_count(), formset.per_page)
+        self.assertEqual(formset.total_count, self.num_of_books)
+        self.assertContains(resp, 'Load more')
+
+    def test_endpoint_pages_in_remaining_objects(self):
+        resp = self.client.get(reverse('admin:catalog_author_change',
+                                       args=[self.author.pk]))
+        formset = self.get_inline_formset(resp)
+        seen = [form.instance.pk for form in formset.initial_forms]
+        after = formset.cursor
+        while after:
+            resp = self.client.get(formset.lazy_url, {'after': after})
+            self.assertEqual(resp.status_code, 200)
+            data = resp.json()
+            seen.extend(int(row['pk']) for row in data['rows'])
+            after = data['next']
+        self.assertEqual(sorted(seen), sorted(
+            Book.objects.values_list('pk', flat=True)))
+
+    def test_book_change_page_does_not_list_every_genre(self):
+        Genre.objects.bulk_create(Genre(name='Genre %s' % num)
+                                  for num in range(50))
+        book = Book.objects.first()
+        book.genre = Genre.objects.all()[:1]
+        resp = self.client.get(reverse('admin:catalog_book_change',
+                                       args=[book.pk]))
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotContains(resp, 'Genre 49')
+
+    def test_unknown_inline_returns_404(self):
+        resp = self.client.get(reverse('admin:catalog_author_inline',
+                                       args=[self.author.pk, 'genre']))
+        self.assertEqual(resp.status_code, 404)
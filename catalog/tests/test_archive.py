@@ -0,0 +1,148 @@
+from django.test import TestCase
+from django.contrib.auth.models import User
+from django.core.urlresolvers import reverse
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+import datetime
+from io import StringIO
+from catalog.archive import archive_copies, restore_copies
+from catalog.barcodes import new_barcodes, scan
+from catalog.holds import place_hold
+from catalog.branches import use_branch
+from catalog.models import ArchivedBookInstance, Book, BookInstance, Branch
+from catalog.tests.factories import create_book, create_copies, create_users
+
+
+class ArchiveTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.patron, = create_users('patron')
+        cls.book = create_book()
+        cls.orphan_book = create_book('Deleted Book', author=None,
+                                      genres=(), language=None)
+        barcodes = new_barcodes(7)
+        statuses = ['a', 'm', 'm', 'o']
+        cls.copies = create_copies(
+            cls.book, 4, status=lambda num: statuses[num],
+            barcode=lambda num: barcodes[num],
+            borrower=lambda num: cls.patron if num == 3 else None,
+            due_back=lambda num: datetime.date.today() if num == 3 else None)
+        statuses = ['a', 'o', 'r']
+        cls.orphans = create_copies(
+            cls.orphan_book, 3, status=lambda num: statuses[num],
+            barcode=lambda num: barcodes[4 + num])
+        cls.orphan_book.delete()
+
+    def test_archives_withdrawn_and_orphaned_copies(self):
+        self.assertEqual(archive_copies(batch_size=1), 3)
+        self.assertEqual(
+            set(ArchivedBookInstance.objects.values_list('pk', flat=True)),
+            {self.copies[1].pk, self.copies[2].pk, self.orphans[0].pk})
+        # copies on loan or reserved stay
+        self.assertEqual(
+            set(BookInstance.objects.values_list('pk', flat=True)),
+            {self.copies[0].pk, self.copies[3].pk, self.orphans[1].pk,
+             self.orphans[2].pk})
+        self.assertEqual(archive_copies(), 0)
+
+    def test_bookkeeping_once_per_batch(self):
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(archive_copies(), 3)
+        availability_checks = [query for query in context.captured_queries
+                               if 'has_available' in query['sql']]
+        self.assertEqual(len(availability_checks), 1)
+
+    def test_include_archived(self):
+        archive_copies()
+        self.assertEqual(BookInstance.objects.filter(book=self.book).count(),
+                         2)
+        copies = BookInstance.objects.include_archived().filter(
+            book=self.book)
+        self.assertEqual(copies.count(), 4)
+        self.assertEqual(copies.filter(status='m').count(), 2)
+        # filters made before include_archived() apply to the archive too
+        self.assertEqual(BookInstance.objects.filter(book=self.book).exclude(
+            status='o').include_archived().count(), 3)
+        self.assertEqual(
+            self.book.bookinstance_set.include_archived().count(), 4)
+        archived = BookInstance.objects.include_archived().get(
+            barcode=self.copies[1].barcode)
+        self.assertTrue(archived.is_archived)
+        self.assertEqual(archived.pk, self.copies[1].pk)
+        self.assertFalse(BookInstance.objects.include_archived().get(
+            pk=self.copies[0].pk).is_archived)
+        with self.assertRaises(BookInstance.DoesNotExist):
+            BookInstance.objects.include_archived().get(barcode='0')
+
+    def test_scoped_include_archived(self):
+        north, south = (Branch.objects.create(name=name, code=name.lower())
+                        for name in ('North', 'South'))
+        BookInstance.objects.filter(pk__in=[
+            copy.pk for copy in self.copies[:2]]).update(branch=north)
+        BookInstance.objects.filter(pk__in=[
+            copy.pk for copy in self.copies[2:]]).update(branch=south)
+        archive_copies()
+        with use_branch(north):
+            self.assertEqual(
+                sorted(copy.pk for copy in BookInstance.scoped.filter(
+                    book=self.book).include_archived()),
+                sorted(copy.pk for copy in self.copies[:2]))
+
+    def test_book_page_lists_archived_copies(self):
+        archive_copies()
+        resp = self.client.get(self.book.get_absolute_url())
+        self.assertEqual(len(resp.context['copies']), 4)
+        self.assertContains(resp, str(self.copies[1].pk))
+        self.assertContains(resp, 'Archived:', count=2)
+
+    def test_book_admin_lists_archived_copies(self):
+        User.objects.create_superuser('admin', 'admin@example.com', '12345')
+        self.client.login(username='admin', password='12345')
+        archive_copies()
+        resp = self.client.get(reverse('admin:catalog_book_change',
+                                       args=[self.book.pk]))
+        self.assertContains(resp, reverse(
+            'admin:catalog_archivedbookinstance_change',
+            args=[self.copies[1].pk]))
+        self.assertContains(resp, self.copies[2].barcode)
+
+    def test_restore(self):
+        archive_copies()
+        self.assertEqual(
+            restore_copies([self.copies[1].pk, self.orphans[0].pk]), 2)
+        restored = BookInstance.objects.get(pk=self.copies[1].pk)
+        self.assertEqual((restored.book, restored.status, restored.barcode),
+                         (self.book, 'm', self.copies[1].barcode))
+        self.assertIsNone(BookInstance.objects.get(
+            pk=self.orphans[0].pk).book)
+        self.assertEqual(ArchivedBookInstance.objects.count(), 1)
+
+    def test_restored_copy_goes_to_waiting_hold(self):
+        archive_copies(statuses=('a',))
+        hold = place_hold(self.book, self.patron)
+        restore_copies([self.copies[0].pk])
+        hold.refresh_from_db()
+        self.assertEqual((hold.status, hold.copy_id), ('r', self.copies[0].pk))
+        self.assertEqual(BookInstance.objects.get(
+            pk=self.copies[0].pk).status, 'r')
+
+    def test_scanning_an_archived_copy(self):
+        archive_copies()
+        results = scan('in', [self.copies[1].barcode])
+        self.assertEqual(results[0]['error'], 'Archived copy')
+
+    def test_command(self):
+        out = StringIO()
+        call_command('archive_copies', '--status', 'a', stdout=out)
+        self.assertIn('Archived 2 copies', out.getvalue())
+        self.assertEqual(BookInstance.objects.filter(status='a').count(), 0)
+        call_command('archive_copies', '--restore', str(self.copies[0].pk),
+                     stdout=out)
+        self.assertIn('Restored 1 copies', out.getvalue())
+        self.assertTrue(Book.objects.get(pk=self.book.pk).is_available)
+        with self.assertRaises(CommandError):
+            call_command('archive_copies', '--restore', 'not-a-uuid',
+                         stdout=out)
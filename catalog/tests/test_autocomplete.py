@@ -0,0 +1,173 @@
+from unittest import mock
+
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.core.urlresolvers import reverse
+from catalog import autocomplete
+from catalog.models import Author, Book
+from catalog.tests.factories import create_book, create_users
+from catalog.versions import SharedVersion
+
+
+class AutocompleteSearchTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        create_book('The Hobbit', author=('John', 'Tolkien'))
+        create_book('The Silmarillion', author=('Christopher', 'Tolkien'))
+        create_book('Dune', author=('Frank', 'Herbert'))
+        create_users('librarian', permissions=['Set book as returned'])
+
+    def setUp(self):
+        # indexes outlive the data of earlier tests
+        autocomplete.invalidate()
+
+    def test_prefix_matches_first_or_last_name(self):
+        self.assertEqual(
+            [label for _, label in autocomplete.search('author', 'tol')],
+            ['Tolkien, Christopher', 'Tolkien, John'])
+        self.assertEqual(
+            [label for _, label in autocomplete.search('author', 'FRA')],
+            ['Herbert, Frank'])
+        self.assertEqual(autocomplete.search('author', 'x'), [])
+
+    def test_search_from_memory(self):
+        autocomplete.search('book', 'the')
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                [label for _, label in autocomplete.search('book', 'the s')],
+                ['The Silmarillion'])
+
+    def test_database_fallback_matches_the_index(self):
+        index = autocomplete.INDEXES['author']
+        Author.objects.create(first_name='Cormac', last_name='McCarthy')
+        for prefix in ('tol', 'Tol', 'fr', 'her', 'mcc', 'MCC', 'x'):
+            self.assertEqual(sorted(index.search_database(prefix)),
+                             sorted(index.search(prefix)))
+
+    def test_database_fallback_reads_the_key_indexes(self):
+        for kind in ('author', 'book'):
+            for query in autocomplete.INDEXES[kind].database_queries('tol'):
+                sql, params = query.query.sql_with_params()
+                with connection.cursor() as cursor:
+                    cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+                    plan = ' '.join(row[-1] for row in cursor.fetchall())
+                self.assertIn('USING INDEX', plan)
+                self.assertNotIn('SCAN', plan)
+                self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_prefix_successor(self):
+        self.assertEqual(autocomplete.prefix_successor('tol'), 'tom')
+        self.assertEqual(autocomplete.prefix_successor(''), None)
+
+    def test_view(self):
+        resp = self.client.get(reverse('autocomplete', args=['book']),
+                               {'q': 'du'})
+        self.assertEqual(resp.json()['results'], [
+            {'id': Book.objects.get(title='Dune').pk, 'text': 'Dune'}])
+        resp = self.client.get(reverse('autocomplete', args=['book']))
+        self.assertEqual(resp.json()['results'], [])
+
+    def test_book_form_renders_only_the_selected_author(self):
+        self.client.login(username='librarian', password='12345')
+        book = Book.objects.get(title='Dune')
+        resp = self.client.get(reverse('book_update', args=[book.pk]))
+        self.assertContains(resp, 'Herbert, Frank')
+        self.assertNotContains(resp, 'Tolkien')
+        self.assertContains(resp, reverse('autocomplete', args=['author']))
+        size = len(resp.content)
+        Author.objects.bulk_create(
+            Author(first_name='Author', last_name=str(i)) for i in range(50))
+        resp = self.client.get(reverse('book_update', args=[book.pk]))
+        self.assertEqual(len(resp.content), size)
+
+    def test_book_form_saves_an_author(self):
+        self.client.login(username='librarian', password='12345')
+        book = Book.objects.get(title='Dune')
+        author = Author.objects.get(first_name='John')
+        resp = self.client.post(reverse('book_update', args=[book.pk]), {
+            'title': 'Dune', 'author': author.pk, 'summary': 'Summary',
+            'genre': list(book.genre.values_list('pk', flat=True)),
+            'publication_language': book.publication_language_id})
+        self.assertEqual(resp.status_code, 302)
+        book.refresh_from_db()
+        self.assertEqual(book.author, author)
+
+
+class AutocompleteIndexUpdateTest(TransactionTestCase):
+
+    def setUp(self):
+        # indexes outlive the data of earlier tests
+        autocomplete.invalidate()
+        create_book('Dune', author=('Frank', 'Herbert'))
+
+    def test_changes_applied_without_rebuild(self):
+        autocomplete.search('author', 'h')
+        author = Author.objects.create(first_name='Ursula',
+                                       last_name='Le Guin')
+        with self.assertNumQueries(0):
+            self.assertEqual(autocomplete.search('author', 'urs'),
+                             [(author.pk, 'Le Guin, Ursula')])
+        author.first_name = 'U. K.'
+        author.save()
+        Author.objects.get(last_name='Herbert').delete()
+        with self.assertNumQueries(0):
+            self.assertEqual(autocomplete.search('author', 'urs'), [])
+            self.assertEqual(autocomplete.search('author', 'u. k'),
+                             [(author.pk, 'Le Guin, U. K.')])
+            self.assertEqual(autocomplete.search('author', 'h'), [])
+
+    def test_invalidate(self):
+        autocomplete.search('book', 'd')
+        Book.objects.update(title='Children of Dune',
+                            title_key='children of dune')
+        autocomplete.invalidate('book')
+        self.assertEqual(
+            [label for _, label in autocomplete.search('book', 'child')],
+            ['Children of Dune'])
+
+    def test_changes_in_other_processes_applied_without_rebuild(self):
+        # the index of another process
+        index = autocomplete.PrefixIndex('book', Book, ('title',), '%s')
+        index.search('d')
+        book = Book.objects.get()
+        book.title = 'Children of Dune'
+        book.save()
+        create_book('Dune Messiah')
+        index.shared_version.expire()
+        with mock.patch.object(index, 'rebuild') as rebuild, \
+                self.assertNumQueries(3):
+            self.assertEqual([label for _, label in index.search('d')],
+                             ['Dune Messiah'])
+        self.assertFalse(rebuild.called)
+        self.assertEqual([label for _, label in index.search('child')],
+                         ['Children of Dune'])
+
+    def test_unrecorded_changes_rebuild(self):
+        index = autocomplete.INDEXES['book']
+        index.search('d')
+        Book.objects.update(title='Children of Dune',
+                            title_key='children of dune')
+        # as seen from another process: the stored version moved
+        SharedVersion('autocomplete:book').bump()
+        index.shared_version.expire()
+        self.assertEqual([label for _, label in index.search('child')],
+                         ['Children of Dune'])
+
+    def test_too_big_catalogue_not_loaded_on_changes(self):
+        index = autocomplete.INDEXES['book']
+        create_book('Dune Messiah')
+        with mock.patch.object(autocomplete, 'INDEX_LIMIT', 1):
+            self.assertEqual(len(index.search('dune')), 2)
+            self.assertIsNone(index.entries)
+            create_book('Children of Dune')
+            index.shared_version.expire()
+            # the version and the database search
+            with self.assertNumQueries(2):
+                self.assertEqual(len(index.search('')), 3)
+            Book.objects.exclude(title='Dune').delete()
+            with mock.patch.object(autocomplete, 'SIZE_CHECK_INTERVAL', 0):
+                index.shared_version.expire()
+                self.assertEqual([label for _, label in index.search('')],
+                                 ['Dune'])
+            self.assertIsNotNone(index.entries)
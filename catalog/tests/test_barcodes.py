@@ -0,0 +1,155 @@
+from django.test import TestCase, override_settings
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from io import StringIO
+import json
+import time
+import uuid
+from catalog.barcodes import InvalidBarcode, parse_barcode, scan
+from catalog.models import ArchivedBookInstance, Book, BookInstance, Hold, \
+    LoanEvent, new_copy_id
+from catalog.tests.factories import create_book, create_copies, create_users
+
+
+class BarcodeTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.book = create_book()
+
+    def test_sequential_barcodes_on_save(self):
+        first = BookInstance.objects.create(book=self.book, imprint='Imprint')
+        second = BookInstance.objects.create(book=self.book, imprint='Imprint')
+        self.assertEqual(len(first.barcode), 10)
+        self.assertEqual(int(second.barcode[:-1]),
+                         int(first.barcode[:-1]) + 1)
+        self.assertEqual(parse_barcode(' %s ' % first.barcode), first.barcode)
+        # a single mistyped digit fails the check digit
+        typo = first.barcode[:3] + str((int(first.barcode[3]) + 1) % 10) + \
+            first.barcode[4:]
+        for value in (typo, first.barcode[:-1], 'ABCDEFGHIJ', None,
+                      int(first.barcode), [first.barcode]):
+            with self.assertRaises(InvalidBarcode):
+                parse_barcode(value)
+
+    def test_backfill(self):
+        copies = create_copies(self.book, 3)
+        archived = ArchivedBookInstance.objects.create(
+            id=uuid.uuid4(), book_id=self.book.pk, imprint='Imprint',
+            status='m')
+        out = StringIO()
+        call_command('backfill_barcodes', batch_size=2, stdout=out)
+        barcodes = [BookInstance.objects.get(pk=copy.pk).barcode
+                    for copy in copies]
+        barcodes.append(ArchivedBookInstance.objects.get(
+            pk=archived.pk).barcode)
+        self.assertEqual(len(set(barcodes)), 4)
+        for barcode in barcodes:
+            self.assertEqual(parse_barcode(barcode), barcode)
+        self.assertIn('4 copies', out.getvalue())
+
+    def test_renew_by_barcode(self):
+        copy = BookInstance.objects.create(book=self.book, imprint='Imprint')
+        create_users('librarian', permissions=['Set book as returned'])
+        self.client.login(username='librarian', password='12345')
+        resp = self.client.get(reverse('renew-book-librarian',
+                                       args=[copy.barcode]))
+        self.assertEqual(resp.context['bookinst'], copy)
+
+    @override_settings(TIME_ORDERED_COPY_IDS=True)
+    def test_time_ordered_ids(self):
+        ids = []
+        for _ in range(3):
+            ids.append(new_copy_id())
+            time.sleep(0.002)
+        self.assertEqual(ids, sorted(ids, key=lambda value: value.int))
+        self.assertEqual(ids[0].version, 7)
+
+    @override_settings(TIME_ORDERED_COPY_IDS=False)
+    def test_random_ids(self):
+        self.assertEqual(new_copy_id().version, 4)
+
+
+class ScanTest(TestCase):
+
+    def setUp(self):
+        self.patron, self.other = create_users('patron', 'other')
+        self.librarian, = create_users('librarian',
+                                       permissions=['Set book as returned'])
+        self.book = create_book()
+        self.copies = [BookInstance.objects.create(
+            book=self.book, imprint='Imprint', status='a')
+            for _ in range(20)]
+        self.barcodes = [copy.barcode for copy in self.copies]
+
+    def scan_queries(self, action, barcodes, borrower=None):
+        with CaptureQueriesContext(connection) as context:
+            scan(action, barcodes, borrower)
+        return len(context)
+
+    def test_scan_out_and_in(self):
+        results = scan('out', self.barcodes, self.patron)
+        self.assertEqual({result['status'] for result in results}, {'o'})
+        self.assertEqual(BookInstance.objects.filter(
+            status='o', borrower=self.patron).count(), 20)
+        self.assertFalse(Book.objects.get(pk=self.book.pk).is_available)
+        self.assertEqual(LoanEvent.objects.filter(event='o').count(), 20)
+        scan('in', self.barcodes[:5])
+        self.assertEqual(BookInstance.objects.filter(status='a').count(), 5)
+        self.assertEqual(LoanEvent.objects.filter(event='a').count(), 5)
+        self.assertTrue(Book.objects.get(pk=self.book.pk).is_available)
+
+    def test_batched_queries(self):
+        # the last copy stays available, so the availability facet does
+        # not change in between
+        few = self.scan_queries('out', self.barcodes[:2], self.patron)
+        many = self.scan_queries('out', self.barcodes[2:19], self.patron)
+        self.assertEqual(few, many)
+        self.assertEqual(self.scan_queries('in', self.barcodes[:2]),
+                         self.scan_queries('in', self.barcodes[2:19]))
+
+    def test_errors(self):
+        scan('out', self.barcodes[:1], self.patron)
+        results = scan('out', [self.barcodes[0], '1234567890', 'bad',
+                               self.barcodes[1]], self.other)
+        self.assertEqual(results[0]['error'], 'Already on loan')
+        self.assertIn('error', results[1])
+        self.assertIn('error', results[2])
+        self.assertEqual(results[3]['status'], 'o')
+
+    def test_returned_copy_goes_to_waiting_hold(self):
+        scan('out', self.barcodes, self.patron)
+        hold = Hold.objects.create(book=self.book, patron=self.other)
+        results = scan('in', self.barcodes[:2])
+        self.assertEqual([result['status'] for result in results],
+                         ['r', 'a'])
+        hold.refresh_from_db()
+        self.assertEqual(hold.status, 'r')
+        self.assertEqual(hold.copy.barcode, self.barcodes[0])
+        # only its patron can take it out
+        results = scan('out', self.barcodes[:1], self.patron)
+        self.assertEqual(results[0]['error'], 'Reserved for another patron')
+        scan('out', self.barcodes[:1], self.other)
+        hold.refresh_from_db()
+        self.assertEqual(hold.status, 'f')
+
+    def test_scan_view(self):
+        url = reverse('scan-copies')
+        body = json.dumps({'action': 'out', 'barcodes': self.barcodes[:3],
+                           'borrower': 'patron'})
+        self.client.login(username='patron', password='12345')
+        resp = self.client.post(url, body, content_type='application/json')
+        self.assertEqual(resp.status_code, 302)
+        self.client.login(username='librarian', password='12345')
+        resp = self.client.post(url, body, content_type='application/json')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(resp.json()['results']), 3)
+        resp = self.client.post(url, '{"action": "out"}',
+                                content_type='application/json')
+        self.assertEqual(resp.status_code, 400)
+        resp = self.client.post(url, json.dumps(
+            {'action': 'in', 'barcodes': [int(self.barcodes[0])]}),
+            content_type='application/json')
+        self.assertEqual(resp.status_code, 400)
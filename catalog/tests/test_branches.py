@@ -0,0 +1,134 @@
+from django.test import TestCase
+from django.core.urlresolvers import reverse
+from django.db import connection
+import datetime
+import json
+from catalog import branches
+from catalog.barcodes import format_barcode
+from catalog.branches import get_branch, use_branch
+from catalog.facets import rebuild_facets
+from catalog.models import BookInstance, Branch
+from catalog.tests.factories import create_book, create_copies, create_users
+
+
+class BranchTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.north = Branch.objects.create(name='North', code='north')
+        cls.south = Branch.objects.create(name='South', code='south')
+        cls.patron, cls.librarian = create_users(
+            'patron', 'librarian', permissions=['Set book as returned'])
+        cls.book = create_book()
+        due_back = datetime.date.today() + datetime.timedelta(days=7)
+        create_copies(cls.book, 3, branch=cls.north,
+                      status=lambda num: 'o' if num else 'a',
+                      borrower=lambda num: cls.patron if num else None,
+                      due_back=lambda num: due_back if num else None)
+        create_copies(cls.book, 2, branch=cls.south, status='a')
+        # available at north only
+        cls.other_book = create_book('Other book')
+        create_copies(cls.other_book, 1, branch=cls.north, status='a',
+                      barcode=format_barcode(1))
+        rebuild_facets()
+
+    def setUp(self):
+        branches.invalidate_branches()
+
+    def test_index_counts_the_chosen_branch(self):
+        resp = self.client.get(reverse('index'))
+        self.assertEqual(resp.context['num_instances'], 6)
+        resp = self.client.get(reverse('index'), {'branch': 'north'})
+        self.assertEqual(resp.context['num_instances'], 4)
+        self.assertEqual(resp.context['num_instances_available'], 2)
+        self.assertContains(resp, 'North branch')
+        # remembered in the session
+        resp = self.client.get(reverse('index'))
+        self.assertEqual(resp.context['num_instances'], 4)
+        resp = self.client.get(reverse('index'), {'branch': ''})
+        self.assertEqual(resp.context['num_instances'], 6)
+
+    def test_copy_lists_are_scoped(self):
+        self.client.login(username='librarian', password='12345')
+        resp = self.client.get(reverse('all-borrowed'), {'branch': 'south'})
+        self.assertEqual(len(resp.context['bookinstance_list']), 0)
+        resp = self.client.get(reverse('all-borrowed'), {'branch': 'north'})
+        self.assertEqual(len(resp.context['bookinstance_list']), 2)
+        resp = self.client.get(reverse('book-detail', args=[self.book.pk]),
+                               {'branch': 'south'})
+        self.assertEqual(len(resp.context['copies']), 2)
+
+    def test_unscoped_outside_a_branch(self):
+        self.assertEqual(BookInstance.scoped.count(), 6)
+        with use_branch(self.south):
+            self.assertEqual(BookInstance.scoped.count(), 2)
+            # the default manager is never filtered
+            self.assertEqual(BookInstance.objects.count(), 6)
+        self.assertEqual(BookInstance.scoped.count(), 6)
+
+    def test_scoped_queries_use_a_branch_index(self):
+        with use_branch(self.north):
+            queryset = BookInstance.scoped.filter(status='o').order_by(
+                'due_back')
+            sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            plan = ' '.join(str(row) for row in cursor.fetchall())
+        self.assertIn('branch', plan)
+
+    def test_branches_are_cached(self):
+        self.assertEqual(get_branch('north'), self.north)
+        self.assertIsNone(get_branch('west'))
+        with self.assertNumQueries(0):
+            self.assertEqual(get_branch('north'), self.north)
+            self.assertIsNone(get_branch('west'))
+        Branch.objects.create(name='West', code='west')
+        self.assertEqual(get_branch('west').name, 'West')
+
+    def test_changes_in_other_processes_are_seen(self):
+        self.assertEqual(get_branch('north').name, 'North')
+        # renamed by another process, which bumps the stored version
+        Branch.objects.filter(pk=self.north.pk).update(name='Northgate')
+        branches._version.bump()
+        branches._version.expire()
+        self.assertEqual(get_branch('north').name, 'Northgate')
+
+    def test_unknown_branch_is_not_remembered(self):
+        self.client.get(reverse('index'), {'branch': 'north'})
+        resp = self.client.get(reverse('index'), {'branch': 'nowhere'})
+        self.assertEqual(resp.context['num_instances'], 4)
+        self.assertEqual(self.client.session['branch'], 'north')
+
+    def test_book_list_availability_follows_the_branch(self):
+        resp = self.client.get(reverse('books'),
+                               {'branch': 'south', 'available': 1})
+        self.assertEqual([book.pk for book in resp.context['book_list']],
+                         [self.book.pk])
+        self.assertEqual(resp.context['paginator'].count, 1)
+        available = dict(resp.context['facets'])['Availability']
+        self.assertEqual({value['label']: value['count']
+                          for value in available},
+                         {'Available': 1, 'Not available': 1})
+        resp = self.client.get(reverse('books'), {'available': 0})
+        self.assertEqual([book.pk for book in resp.context['book_list']],
+                         [self.other_book.pk])
+        resp = self.client.get(reverse('books'), {'branch': '',
+                                                  'available': 0})
+        self.assertEqual(len(resp.context['book_list']), 0)
+
+    def test_scanning_out_is_restricted_to_the_branch(self):
+        self.client.login(username='librarian', password='12345')
+        barcode = format_barcode(1)
+        resp = self.client.post(
+            reverse('scan-copies') + '?branch=south',
+            json.dumps({'action': 'out', 'barcodes': [barcode],
+                        'borrower': 'patron'}),
+            content_type='application/json')
+        self.assertEqual(resp.json()['results'][0]['error'],
+                         'Copy belongs to another branch')
+        resp = self.client.post(
+            reverse('scan-copies') + '?branch=north',
+            json.dumps({'action': 'out', 'barcodes': [barcode],
+                        'borrower': 'patron'}),
+            content_type='application/json')
+        self.assertEqual(resp.json()['results'][0]['status'], 'o')
@@ -0,0 +1,149 @@
+from django.test import TestCase
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from catalog.models import Author, Book, BookInstance, FacetCount, Genre, \
+    Language
+from catalog.facets import rebuild_facets, sync_availability
+
+
+class FacetCountTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.fantasy = Genre.objects.create(name='Fantasy')
+        cls.poetry = Genre.objects.create(name='Poetry')
+        cls.english = Language.objects.create(language='English')
+        cls.french = Language.objects.create(language='French')
+        cls.author = Author.objects.create(first_name='John',
+                                           last_name='Smith')
+
+    def create_book(self, title, **kwargs):
+        return Book.objects.create(title=title, summary='Summary',
+                                   isbn='ABCDEFG', **kwargs)
+
+    def counts(self):
+        return {(row.facet, row.value): row.count
+                for row in FacetCount.objects.exclude(count=0)}
+
+    def assertMatchesRebuild(self):
+        incremental = self.counts()
+        rebuild_facets()
+        self.assertEqual(incremental, self.counts())
+
+    def test_availability_sync_is_counted_once(self):
+        book = self.create_book('One')
+        BookInstance.objects.create(book=book, imprint='Imprint', status='a')
+        self.assertEqual(self.counts().get(('available', 1)), 1)
+        sync_availability([book.pk])
+        sync_availability([book.pk])
+        self.assertEqual(self.counts().get(('available', 1)), 1)
+        self.assertMatchesRebuild()
+
+    def test_book_save_and_delete(self):
+        book = self.create_book('One', author=self.author,
+                                publication_language=self.english)
+        self.create_book('Two', publication_language=self.english)
+        self.assertEqual(self.counts()['language', self.english.pk], 2)
+        self.assertEqual(self.counts()['author', self.author.pk], 1)
+        book.publication_language = self.french
+        book.save()
+        self.assertEqual(self.counts()['language', self.english.pk], 1)
+        self.assertEqual(self.counts()['language', self.french.pk], 1)
+        self.assertMatchesRebuild()
+        book.genre = [self.fantasy]
+        book.delete()
+        self.assertNotIn(('author', self.author.pk), self.counts())
+        self.assertNotIn(('genre', self.fantasy.pk), self.counts())
+        self.assertMatchesRebuild()
+
+    def test_genre_relation_changes(self):
+        book = self.create_book('One')
+        other = self.create_book('Two')
+        book.genre.add(self.fantasy, self.poetry)
+        # adding an existing genre again does not count twice
+        book.genre.add(self.fantasy)
+        self.fantasy.book_set.add(other)
+        self.assertEqual(self.counts()['genre', self.fantasy.pk], 2)
+        book.genre.remove(self.poetry, self.poetry)
+        self.assertNotIn(('genre', self.poetry.pk), self.counts())
+        self.fantasy.book_set.remove(other)
+        self.assertEqual(self.counts()['genre', self.fantasy.pk], 1)
+        book.genre = [self.poetry]
+        self.assertMatchesRebuild()
+        self.poetry.book_set.clear()
+        book.genre.clear()
+        self.assertMatchesRebuild()
+
+    def test_availability_follows_copies(self):
+        book = self.create_book('One')
+        self.assertEqual(self.counts()['available', 0], 1)
+        copy = BookInstance.objects.create(book=book, imprint='Imprint',
+                                           status='a')
+        book.refresh_from_db()
+        self.assertTrue(book.is_available)
+        self.assertEqual(self.counts()['available', 1], 1)
+        copy.status = 'o'
+        copy.save()
+        self.assertEqual(self.counts()['available', 0], 1)
+        BookInstance.objects.filter(pk=copy.pk).update(status='a')
+        sync_availability([book.pk])
+        self.assertEqual(self.counts()['available', 1], 1)
+        copy.delete()
+        self.assertEqual(self.counts().get(('available', 1)), None)
+        self.assertMatchesRebuild()
+
+
+class BookListFacetViewTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.fantasy = Genre.objects.create(name='Fantasy')
+        cls.english = Language.objects.create(language='English')
+        for book_num in range(12):
+            book = Book.objects.create(
+                title='Book %s' % book_num, summary='Summary',
+                isbn='ABCDEFG',
+                publication_language=cls.english if book_num % 2 else None)
+            if book_num % 3 == 0:
+                book.genre = [cls.fantasy]
+
+    def test_filter_by_single_facet_uses_facet_count(self):
+        with CaptureQueriesContext(connection) as context:
+            resp = self.client.get(reverse('books'),
+                                   {'genre': self.fantasy.pk})
+        for query in context.captured_queries:
+            self.assertNotIn('COUNT(', query['sql'])
+            self.assertNotIn('GROUP BY', query['sql'])
+        self.assertEqual(resp.context['paginator'].count, 4)
+        for book in resp.context['book_list']:
+            self.assertIn(self.fantasy, book.genre.all())
+
+    def test_availability_values_normalised(self):
+        # no copies: every book is unavailable
+        resp = self.client.get(reverse('books'), {'available': 2})
+        self.assertEqual(resp.context['paginator'].count, 0)
+        self.assertEqual(len(resp.context['book_list']), 0)
+        resp = self.client.get(reverse('books'), {'available': 0})
+        self.assertEqual(resp.context['paginator'].count, 12)
+
+    def test_filter_combination(self):
+        resp = self.client.get(reverse('books'),
+                               {'genre': self.fantasy.pk,
+                                'language': self.english.pk})
+        # books 3 and 9
+        self.assertEqual(resp.context['paginator'].count, 2)
+
+    def test_facets_listed_with_counts(self):
+        resp = self.client.get(reverse('books'))
+        facets = dict(resp.context['facets'])
+        self.assertEqual(facets['Genre'][0]['count'], 4)
+        self.assertEqual(facets['Language'][0]['count'], 6)
+        self.assertEqual(facets['Availability'][0]['count'], 12)
+        self.assertEqual(resp.context['paginator'].count, 12)
+
+    def test_pagination_keeps_filters(self):
+        resp = self.client.get(reverse('books'),
+                               {'language': self.english.pk})
+        self.assertContains(resp, 'language=%s&amp;page=2' %
+                            self.english.pk)
@@ -0,0 +1,120 @@
+from django.test import TestCase
+from django.core.urlresolvers import reverse
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+import datetime
+from catalog.models import Book, BookInstance, Hold, LoanEvent
+from catalog.holds import allocate_copy, expire_holds, place_hold, \
+    copy_status_changed
+
+
+class HoldQueueTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.book = Book.objects.create(title='Book Title',
+                                       summary='My book summary',
+                                       isbn='ABCDEFG')
+        cls.patrons = [User.objects.create_user(username='patron%s' % num,
+                                                password='12345')
+                       for num in range(3)]
+
+    def setUp(self):
+        self.copy = BookInstance.objects.create(
+            book=self.book, imprint='Unlikely Imprint, 2016', status='o')
+        for patron in self.patrons:
+            place_hold(self.book, patron)
+
+    def return_copy(self, copy):
+        copy.status = 'a'
+        copy.borrower = None
+        copy.save()
+        return allocate_copy(copy)
+
+    def test_place_hold_is_idempotent(self):
+        place_hold(self.book, self.patrons[0])
+        self.assertEqual(Hold.objects.filter(
+            patron=self.patrons[0]).count(), 1)
+
+    def test_returned_copy_goes_to_head_of_queue(self):
+        hold = self.return_copy(self.copy)
+        self.assertEqual(hold.patron, self.patrons[0])
+        self.copy.refresh_from_db()
+        self.assertEqual(self.copy.status, 'r')
+        self.assertEqual(self.copy.borrower, self.patrons[0])
+        self.assertEqual(Hold.objects.filter(status='w').count(), 2)
+
+    def test_inactive_patrons_are_skipped(self):
+        self.patrons[0].is_active = False
+        self.patrons[0].save()
+        hold = self.return_copy(self.copy)
+        self.assertEqual(hold.patron, self.patrons[1])
+        self.assertEqual(Hold.objects.get(patron=self.patrons[0]).status,
+                         'c')
+
+    def hold_queries(self, context):
+        return len([query for query in context.captured_queries
+                    if '"catalog_hold"' in query['sql'] or
+                    '"auth_user"' in query['sql']])
+
+    def test_allocation_queries_do_not_grow_with_inactive_patrons(self):
+        other = BookInstance.objects.create(
+            book=self.book, imprint='Unlikely Imprint, 2016', status='a')
+        with CaptureQueriesContext(connection) as first:
+            allocate_copy(other)
+        self.return_copy(self.copy)
+        User.objects.filter(pk__in=[self.patrons[1].pk]).update(
+            is_active=False)
+        Hold.objects.filter(patron=self.patrons[1]).update(status='w')
+        other.refresh_from_db()
+        other.status, other.borrower = 'a', None
+        other.save()
+        with CaptureQueriesContext(connection) as second:
+            hold = allocate_copy(other)
+        self.assertEqual(hold.patron, self.patrons[2])
+        self.assertEqual(self.hold_queries(first), self.hold_queries(second))
+
+    def test_reserved_copy_is_not_allocated_twice(self):
+        self.return_copy(self.copy)
+        self.assertIsNone(allocate_copy(self.copy))
+        self.assertEqual(Hold.objects.filter(status='r').count(), 1)
+
+    def test_no_allocation_without_waiting_holds(self):
+        Hold.objects.update(status='c')
+        self.assertIsNone(self.return_copy(self.copy))
+        self.copy.refresh_from_db()
+        self.assertEqual(self.copy.status, 'a')
+
+    def test_checkout_fulfils_hold(self):
+        hold = self.return_copy(self.copy)
+        self.copy.status = 'o'
+        self.copy.save()
+        copy_status_changed(self.copy)
+        hold.refresh_from_db()
+        self.assertEqual(hold.status, 'f')
+
+    def test_expired_hold_passes_copy_to_next_patron(self):
+        first = self.return_copy(self.copy)
+        expired = expire_holds(today=first.expires + datetime.timedelta(
+            days=1))
+        self.assertEqual(expired, 1)
+        first.refresh_from_db()
+        self.assertEqual(first.status, 'x')
+        second = Hold.objects.get(status='r')
+        self.assertEqual(second.patron, self.patrons[1])
+        self.assertEqual(second.copy, first.copy)
+        # released from the first patron, then reserved for the second
+        self.assertEqual(list(LoanEvent.objects.filter(
+            copy_id=self.copy.pk).values_list('event', 'status'))[-2:],
+            [('s', 'a'), ('s', 'r')])
+
+    def test_place_hold_view(self):
+        patron = User.objects.create_user(username='newpatron',
+                                          password='12345')
+        self.client.login(username='newpatron', password='12345')
+        resp = self.client.post(reverse('book-hold', args=[self.book.pk]))
+        self.assertRedirects(resp, self.book.get_absolute_url(),
+                             fetch_redirect_response=False)
+        self.assertTrue(Hold.objects.filter(patron=patron,
+                                            status='w').exists())
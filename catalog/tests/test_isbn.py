@@ -0,0 +1,116 @@
+from django.test import TestCase
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from io import StringIO
+from catalog.isbn import InvalidISBN, normalize
+from catalog.models import Book
+from catalog.tests.factories import create_book, create_copies, create_users
+
+
+class NormalizeTest(TestCase):
+
+    def test_isbn13(self):
+        self.assertEqual(normalize('978-0-306-40615-7'), '9780306406157')
+        self.assertEqual(normalize(' 9780306406157 '), '9780306406157')
+
+    def test_isbn10_converted(self):
+        self.assertEqual(normalize('0-306-40615-2'), '9780306406157')
+        self.assertEqual(normalize('080442957x'), '9780804429573')
+
+    def test_invalid(self):
+        for value in ('0-306-40615-3', '9780306406158', 'ABCDEFG', '',
+                      '1234567890123'):
+            with self.assertRaises(InvalidISBN):
+                normalize(value)
+
+
+class ISBNLookupTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.book = create_book(isbn='0-306-40615-2')
+        cls.available = create_copies(cls.book, 2, status='a')
+        create_copies(cls.book, 1, status='o')
+        cls.other = create_book(title='Other', author=None,
+                                isbn='9780804429573')
+
+    def test_canonical_column(self):
+        self.assertEqual(self.book.isbn13, '9780306406157')
+        self.assertIsNone(create_book(isbn='ABCDEFG', author=None).isbn13)
+
+    def test_lookup_queries(self):
+        # the book, then its available copies
+        with self.assertNumQueries(2):
+            resp = self.client.get(reverse('isbn-lookup',
+                                           args=['978-0-306-40615-7']))
+        self.assertEqual(resp.status_code, 200)
+        data = resp.json()
+        self.assertEqual(data['book']['id'], self.book.pk)
+        self.assertEqual(data['book']['author'], 'Smith, John')
+        self.assertEqual(sorted(copy['id'] for copy in
+                                data['book']['available_copies']),
+                         sorted(str(copy.pk) for copy in self.available))
+
+    def test_lookup_by_isbn10(self):
+        resp = self.client.get(reverse('isbn-lookup', args=['0306406152']))
+        self.assertEqual(resp.json()['isbn'], '9780306406157')
+
+    def test_lookup_errors(self):
+        resp = self.client.get(reverse('isbn-lookup', args=['9780306406158']))
+        self.assertEqual(resp.status_code, 400)
+        with self.assertNumQueries(1):
+            resp = self.client.get(reverse('isbn-lookup',
+                                           args=['9791234567896']))
+        self.assertEqual(resp.status_code, 404)
+
+    def test_batch_lookup(self):
+        with self.assertNumQueries(2):
+            resp = self.client.get(reverse('isbn-batch'), {'isbn': [
+                '9780804429573', 'bad', '0306406152', '9791234567896']})
+        results = resp.json()['results']
+        self.assertEqual([result['isbn'] for result in results],
+                         ['9780804429573', None, '9780306406157',
+                          '9791234567896'])
+        self.assertEqual(results[0]['book']['id'], self.other.pk)
+        self.assertEqual(results[0]['book']['available_copies'], [])
+        self.assertIn('error', results[1])
+        self.assertEqual(len(results[2]['book']['available_copies']), 2)
+        self.assertIsNone(results[3]['book'])
+
+    def test_duplicate_isbn_rejected(self):
+        book = Book(title='Copy', summary='Summary', isbn='9780306406157')
+        with self.assertRaises(ValidationError) as context:
+            book.full_clean()
+        self.assertIn('isbn', context.exception.message_dict)
+
+    def test_legacy_duplicate_can_be_saved(self):
+        duplicate = create_book(title='Duplicate', author=None,
+                                isbn='ABCDEFG')
+        Book.objects.filter(pk=duplicate.pk).update(isbn='9780306406157')
+        duplicate.refresh_from_db()
+        duplicate.title = 'Renamed'
+        duplicate.save()
+        self.assertIsNone(Book.objects.get(pk=duplicate.pk).isbn13)
+        # the update form does not edit the ISBN: a form error, not a crash
+        create_users('librarian', permissions=['Set book as returned'])
+        self.client.login(username='librarian', password='12345')
+        resp = self.client.post(reverse('book_update', args=[duplicate.pk]),
+                                {'title': 'Duplicate', 'summary': 'Summary'})
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn('Another book has the ISBN 9780306406157.',
+                      resp.context['form'].non_field_errors())
+
+    def test_backfill(self):
+        Book.objects.update(isbn13=None)
+        duplicate = create_book(title='Duplicate', author=None,
+                                isbn='ABCDEFG')
+        Book.objects.filter(pk=duplicate.pk).update(isbn='9780306406157')
+        out = StringIO()
+        call_command('backfill_isbn13', batch_size=1, stdout=out)
+        self.assertEqual(Book.objects.get(pk=self.book.pk).isbn13,
+                         '9780306406157')
+        self.assertEqual(Book.objects.get(pk=self.other.pk).isbn13,
+                         '9780804429573')
+        self.assertIsNone(Book.objects.get(pk=duplicate.pk).isbn13)
+        self.assertIn('already used', out.getvalue())
@@ -0,0 +1,127 @@
+from django.test import TestCase
+from django.core.urlresolvers import reverse
+from django.contrib.auth.models import User, Permission
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+import datetime
+from catalog.models import Book, BookInstance, Genre, Language, LoanEvent, \
+    ArchivedLoanEvent
+from catalog.ledger import archive_loan_events, circulation_report, \
+    make_event, record, rollup_day
+
+
+class LoanLedgerTest(TestCase):
+
+    def setUp(self):
+        self.patron = User.objects.create_user(username='patron',
+                                               password='12345')
+        librarian = User.objects.create_user(username='librarian',
+                                             password='12345')
+        librarian.user_permissions.add(
+            Permission.objects.get(name='Set book as returned'))
+        self.language = Language.objects.create(language='English')
+        self.genre = Genre.objects.create(name='Fantasy')
+        self.book = Book.objects.create(title='Book Title',
+                                        summary='My book summary',
+                                        isbn='ABCDEFG',
+                                        publication_language=self.language)
+        self.book.genre = [self.genre]
+        self.copy = BookInstance.objects.create(
+            book=self.book, imprint='Unlikely Imprint, 2016', status='a')
+
+    def checkout(self, copy):
+        copy.status = 'o'
+        copy.borrower = self.patron
+        copy.due_back = datetime.date.today() + datetime.timedelta(weeks=3)
+        copy.save()
+
+    def events(self):
+        return list(LoanEvent.objects.filter(
+            copy_id=self.copy.pk).values_list('event', flat=True))
+
+    def test_checkout_renewal_and_return_are_recorded(self):
+        self.checkout(self.copy)
+        copy = BookInstance.objects.get(pk=self.copy.pk)
+        copy.due_back += datetime.timedelta(days=7)
+        copy.save()
+        copy.status = 'a'
+        copy.borrower = None
+        copy.save()
+        self.assertEqual(self.events(), ['o', 'n', 'a'])
+
+    def test_unchanged_save_is_not_recorded(self):
+        self.copy.imprint = 'Other Imprint'
+        self.copy.save()
+        self.assertEqual(self.events(), [])
+
+    def test_renewal_view_is_recorded(self):
+        self.checkout(self.copy)
+        self.client.login(username='librarian', password='12345')
+        self.client.post(reverse('renew-book-librarian',
+                                 kwargs={'pk': self.copy.pk}),
+                         {'renewal_date': datetime.date.today() +
+                          datetime.timedelta(weeks=2)})
+        self.assertEqual(self.events(), ['o', 'n'])
+
+    def test_recorded_events_are_written_in_one_insert(self):
+        copies = [BookInstance.objects.create(book=self.book,
+                                              imprint='Imprint', status='a')
+                  for _ in range(5)]
+        with CaptureQueriesContext(connection) as context:
+            record([make_event(copy, 's') for copy in copies])
+        inserts = [query for query in context.captured_queries
+                   if query['sql'].startswith('INSERT INTO "catalog_loanevent"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(LoanEvent.objects.count(), 5)
+
+    def test_rolled_back_events_are_dropped(self):
+        with transaction.atomic():
+            try:
+                # a savepoint rolled back inside the outer transaction
+                with transaction.atomic():
+                    self.checkout(self.copy)
+                    raise ValueError
+            except ValueError:
+                pass
+            record([make_event(self.copy, 's')])
+        self.assertEqual(self.events(), ['s'])
+
+    def test_rollups_and_report(self):
+        self.checkout(self.copy)
+        other = BookInstance.objects.create(book=self.book,
+                                            imprint='Imprint', status='a')
+        self.checkout(other)
+        today = timezone.localdate()
+        rollup_day(today)
+        # idempotent
+        rollup_day(today)
+        self.assertEqual(circulation_report('book', today, today),
+                         [(self.book.pk, 2)])
+        self.assertEqual(circulation_report('genre', today, today),
+                         [(self.genre.pk, 2)])
+        self.assertEqual(circulation_report('language', today, today),
+                         [(self.language.pk, 2)])
+        self.assertEqual(circulation_report('borrower', today, today),
+                         [(self.patron.pk, 2)])
+        yesterday = today - datetime.timedelta(days=1)
+        self.assertEqual(circulation_report('book', yesterday, yesterday),
+                         [])
+        # archiving the events does not change the rollups of their days
+        archive_loan_events(today.replace(day=1) + datetime.timedelta(
+            days=32))
+        rollup_day(today)
+        self.assertEqual(circulation_report('book', today, today),
+                         [(self.book.pk, 2)])
+
+    def test_archive_moves_old_months(self):
+        self.checkout(self.copy)
+        LoanEvent.objects.update(month=datetime.date(2016, 1, 1))
+        self.checkout(BookInstance.objects.create(
+            book=self.book, imprint='Imprint', status='a'))
+        archived = archive_loan_events(datetime.date(2016, 2, 1),
+                                       batch_size=1)
+        self.assertEqual(archived, 1)
+        self.assertEqual(LoanEvent.objects.count(), 1)
+        self.assertEqual(ArchivedLoanEvent.objects.get().copy_id,
+                         self.copy.pk)
@@ -7,9 +7,7 @@ class AuthorModelTest(TestCase):
     @classmethod
     def setUpTestData(cls):
         # set up non-modified objects used by all test methods
-        Author.objects.create(first_name='Big', last_name='Bob')
-
-    author = Author.objects.get(id=1)
+        cls.author = Author.objects.create(first_name='Big', last_name='Bob')
 
     def test_first_name_label(self):
         field_label = self.author._meta.get_field('first_name').verbose_name
@@ -30,4 +28,5 @@ class AuthorModelTest(TestCase):
 
     def test_get_absolute_url(self):
         # this will also fail if the urlconf is not defined
-        self.assertEquals(self.author.get_absolute_url(), '/catalog/author/1')
+        self.assertEquals(self.author.get_absolute_url(),
+                          '/catalog/author/%s' % self.author.pk)
@@ -0,0 +1,78 @@
+from django.test import TestCase
+from django.core.urlresolvers import reverse
+import datetime
+from catalog.models import Book, Genre, LoanRollup, Ranking
+from catalog import rankings
+from catalog.rankings import compute_ranking, get_ranking
+
+
+class RankingTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.today = datetime.date.today()
+        cls.books = [Book.objects.create(title='Book %s' % num,
+                                         summary='Summary', isbn='ABCDEFG')
+                     for num in range(3)]
+        cls.genre = Genre.objects.create(name='Fantasy')
+        # book 0: 5 loans 40 days ago, book 1: 3 loans today,
+        # book 2: 1 loan yesterday
+        for book, loans, days_ago in ((cls.books[0], 5, 40),
+                                      (cls.books[1], 3, 0),
+                                      (cls.books[2], 1, 1)):
+            day = cls.today - datetime.timedelta(days=days_ago)
+            LoanRollup.objects.create(day=day, dimension='book',
+                                      key=book.pk, loans=loans)
+            LoanRollup.objects.create(day=day, dimension='genre',
+                                      key=cls.genre.pk, loans=loans)
+
+    def setUp(self):
+        rankings.invalidate_rankings()
+
+    def test_window_only_counts_recent_loans(self):
+        entries = compute_ranking('book', 30, today=self.today)
+        self.assertEqual([entry['label'] for entry in entries],
+                         ['Book 1', 'Book 2'])
+        self.assertEqual([entry['rank'] for entry in entries], [1, 2])
+        entries = compute_ranking('book', 365, today=self.today)
+        self.assertEqual(entries[0]['label'], 'Book 0')
+
+    def test_genre_ranking(self):
+        entries = compute_ranking('genre', 7, today=self.today)
+        self.assertEqual(entries, [{'rank': 1, 'key': self.genre.pk,
+                                    'label': 'Fantasy', 'loans': 4}])
+
+    def test_recompute_replaces_ranking(self):
+        compute_ranking('book', 30, today=self.today)
+        compute_ranking('book', 30, today=self.today)
+        self.assertEqual(Ranking.objects.filter(kind='book',
+                                                window=30).count(), 2)
+
+    def test_ranking_served_from_memory(self):
+        compute_ranking('book', 30, today=self.today)
+        with self.assertNumQueries(1):
+            self.assertEqual(len(get_ranking('book', 30)), 2)
+        with self.assertNumQueries(0):
+            entries = get_ranking('book', 30, limit=1)
+        self.assertEqual(entries[0]['label'], 'Book 1')
+
+    def test_rankings_computed_by_other_processes_are_read(self):
+        self.assertEqual(get_ranking('book', 30), [])
+        # computed by a command or task process, which bumps the version
+        Ranking.objects.create(kind='book', window=30, rank=1,
+                               key=self.books[1].pk, label='Book 1', loans=3)
+        rankings._version.bump()
+        rankings._version.expire()
+        with self.assertNumQueries(2):
+            entries = get_ranking('book', 30, limit=1)
+        self.assertEqual(entries[0]['label'], 'Book 1')
+
+    def test_widgets_rendered(self):
+        compute_ranking('book', 30, today=self.today)
+        compute_ranking('genre', 7, today=self.today)
+        resp = self.client.get(reverse('index'))
+        self.assertContains(resp, 'Popular books')
+        self.assertContains(resp, 'Book 1')
+        self.assertContains(resp, 'Trending genres')
+        resp = self.client.get(reverse('books'))
+        self.assertEqual(len(resp.context['popular_books']), 2)
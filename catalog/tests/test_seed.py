@@ -0,0 +1,81 @@
+from django.test import TestCase
+from django.contrib.auth.models import User
+from django.db import connection
+import datetime
+from catalog.facets import rebuild_facets
+from catalog.models import Book, BookInstance, FacetCount, LoanEvent
+from catalog.seed import deferred_indexes, seed_library
+
+
+def indexes():
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index'")
+        return sorted(row[0] for row in cursor.fetchall())
+
+
+class SeedLibraryTest(TestCase):
+    today = datetime.date(2017, 9, 1)
+
+    def seed(self, **kwargs):
+        return seed_library(200, copies_per_book=2, users=20,
+                            loan_ratio=0.5, today=self.today, **kwargs)
+
+    def snapshot(self):
+        return (list(Book.objects.order_by('pk').values_list(
+                    'title', 'author_id', 'publication_language_id')),
+                list(BookInstance.objects.order_by('pk').values_list(
+                    'book_id', 'status', 'borrower_id', 'due_back')))
+
+    def test_counts(self):
+        before = indexes()
+        written = self.seed()
+        self.assertEqual(written['catalog.Book'], 200)
+        self.assertEqual(written['auth.User'], 20)
+        self.assertEqual(Book.objects.count(), 200)
+        self.assertEqual(User.objects.count(), 20)
+        self.assertEqual(BookInstance.objects.count(),
+                         written['catalog.BookInstance'])
+        # one checkout event per copy on loan
+        self.assertEqual(LoanEvent.objects.count(),
+                         BookInstance.objects.filter(status='o').count())
+        self.assertFalse(Book.objects.filter(genre=None).exists())
+        # the indexes dropped during the load are back
+        self.assertEqual(indexes(), before)
+
+    def test_without_copies(self):
+        written = seed_library(20, copies_per_book=0, users=5,
+                               today=self.today)
+        self.assertEqual(written['catalog.BookInstance'], 0)
+        self.assertEqual(Book.objects.count(), 20)
+
+    def test_indexes_restored_on_failure(self):
+        before = indexes()
+        with self.assertRaises(ValueError):
+            with deferred_indexes(BookInstance, LoanEvent):
+                raise ValueError
+        self.assertEqual(indexes(), before)
+
+    def test_deterministic(self):
+        self.seed(seed=1)
+        first = self.snapshot()
+        Book.objects.all().delete()
+        BookInstance.objects.all().delete()
+        self.seed(seed=1)
+        # ids continue after the existing rows
+        second = self.snapshot()
+        self.assertEqual([row[0] for row in first[0]],
+                         [row[0] for row in second[0]])
+        self.assertEqual([row[1] for row in first[1]],
+                         [row[1] for row in second[1]])
+
+    def test_skewed_borrowers(self):
+        self.seed()
+        loans = [BookInstance.objects.filter(borrower=user).count()
+                 for user in User.objects.order_by('pk')]
+        self.assertGreater(loans[0], 3 * loans[-1])
+
+    def test_facets_after_rebuild(self):
+        self.seed()
+        rebuild_facets()
+        self.assertEqual(sum(FacetCount.objects.filter(
+            facet='available').values_list('count', flat=True)), 200)
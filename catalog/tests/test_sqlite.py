@@ -0,0 +1,27 @@
+from django.test import SimpleTestCase, override_settings
+from django.db import connection
+from catalog.sqlite import configure_connection
+
+
+class SqliteTuningTest(SimpleTestCase):
+    allow_database_queries = True
+
+    def get_pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA %s' % name)
+            return cursor.fetchone()[0]
+
+    @override_settings(SQLITE_TUNING=True,
+                       SQLITE_PRAGMAS={'busy_timeout': 1234,
+                                       'journal_mode': 'WAL'})
+    def test_pragmas_applied_on_connection_created(self):
+        configure_connection(sender=None, connection=connection)
+        self.assertEqual(self.get_pragma('busy_timeout'), 1234)
+        # the test database lives in memory, so WAL is skipped
+        self.assertEqual(self.get_pragma('journal_mode'), 'memory')
+
+    @override_settings(SQLITE_TUNING=False,
+                       SQLITE_PRAGMAS={'busy_timeout': 4321})
+    def test_pragmas_not_applied_when_tuning_disabled(self):
+        configure_connection(sender=None, connection=connection)
+        self.assertNotEqual(self.get_pragma('busy_timeout'), 4321)
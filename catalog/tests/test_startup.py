@@ -0,0 +1,66 @@
+from django.test import SimpleTestCase
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from io import StringIO
+from unittest import mock
+import sys
+from catalog.startup import ImportTimer
+from catalog.warmup import warm_up
+
+
+class WarmUpTest(SimpleTestCase):
+    allow_database_queries = True
+
+    def test_steps(self):
+        timings = warm_up()
+        self.assertEqual([step for step, _, _ in timings],
+                         ['urls', 'templates', 'databases'])
+        counts = {step: count for step, count, _ in timings}
+        self.assertGreater(counts['urls'], 20)
+        self.assertEqual(counts['databases'], 1)
+        self.assertEqual([step for step, _, _ in warm_up(['urls'])],
+                         ['urls'])
+
+    def test_database_connection_is_closed(self):
+        # request threads open their own connections
+        with mock.patch.object(connection, 'close') as close:
+            warm_up(['databases'])
+        close.assert_called_once_with()
+
+    def test_failing_step_is_reported_and_skipped(self):
+        failures = []
+
+        def failed(step, error):
+            failures.append((step, str(error)))
+
+        with mock.patch.object(connection, 'ensure_connection',
+                               side_effect=OperationalError('unreachable')):
+            timings = warm_up(['urls', 'databases'], on_error=failed)
+            with self.assertRaises(OperationalError):
+                warm_up(['databases'])
+        self.assertEqual([step for step, _, _ in timings], ['urls'])
+        self.assertEqual(failures, [('databases', 'unreachable')])
+
+
+class StartupProfileTest(SimpleTestCase):
+
+    def test_import_timer(self):
+        sys.modules.pop('colorsys', None)
+        timer = ImportTimer()
+        timer.install()
+        try:
+            import colorsys
+        finally:
+            timer.uninstall()
+        self.assertIn('colorsys', timer.cumulative)
+        self.assertGreaterEqual(timer.cumulative['colorsys'],
+                                timer.own['colorsys'])
+        self.assertEqual(colorsys.rgb_to_hsv(0, 0, 0), (0, 0, 0))
+
+    def test_command(self):
+        out = StringIO()
+        call_command('profile_startup', '--limit', '3', stdout=out)
+        report = out.getvalue()
+        for line in ('django.setup', 'urls', 'templates',
+                     'Import time per app or package', 'Slowest modules'):
+            self.assertIn(line, report)
@@ -0,0 +1,158 @@
+from django.test import TransactionTestCase, override_settings
+from django.core import mail
+import datetime
+import email
+import os
+import shutil
+import tempfile
+import time
+from email.mime.base import MIMEBase
+from email.mime.text import MIMEText
+from catalog.models import Task
+from catalog import taskqueue
+from catalog.tasks import send_email, serialize_email
+from catalog.taskqueue import enqueue, run_tasks, retry_delay, task
+
+# the tasks run in child processes: they leave their traces in files
+TRACES = tempfile.mkdtemp()
+
+
+def calls():
+    path = os.path.join(TRACES, 'calls')
+    if not os.path.exists(path):
+        return []
+    with open(path) as calls_file:
+        return calls_file.read().split()
+
+
+@task
+def record_call(value):
+    with open(os.path.join(TRACES, 'calls'), 'a') as calls_file:
+        calls_file.write(value + '\n')
+
+
+@task
+def always_fails():
+    raise ValueError('failure')
+
+
+@task
+def fails_at_length():
+    # a traceback larger than a pipe buffer
+    raise ValueError('x' * 200000)
+
+
+@task
+def sleeps(seconds):
+    time.sleep(seconds)
+
+
+@override_settings(
+    TASKS_EMAIL_BACKEND='django.core.mail.backends.filebased.EmailBackend',
+    EMAIL_FILE_PATH=os.path.join(TRACES, 'outbox'))
+class TaskQueueTest(TransactionTestCase):
+
+    def setUp(self):
+        shutil.rmtree(TRACES)
+        os.mkdir(TRACES)
+
+    def outbox(self):
+        '''
+        :return: the messages sent by the tasks, as email.message.Message
+        '''
+        directory = os.path.join(TRACES, 'outbox')
+        messages = []
+        for name in sorted(os.listdir(directory)):
+            with open(os.path.join(directory, name), 'rb') as sent:
+                messages.extend(email.message_from_bytes(message.strip())
+                                for message in sent.read().split(b'-' * 79)
+                                if message.strip())
+        return messages
+
+    def test_queued_task_runs(self):
+        enqueue('record_call', 'a')
+        enqueue('record_call', value='b')
+        self.assertEqual(run_tasks(once=True), 2)
+        self.assertEqual(sorted(calls()), ['a', 'b'])
+        self.assertEqual(Task.objects.filter(status='d').count(), 2)
+
+    def test_unknown_task_cannot_be_queued(self):
+        with self.assertRaises(KeyError):
+            enqueue('no_such_task')
+
+    def test_failed_task_is_retried_with_backoff(self):
+        queued = enqueue('always_fails')
+        before = datetime.datetime.now(datetime.timezone.utc)
+        run_tasks(once=True)
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, 'q')
+        self.assertEqual(queued.attempts, 1)
+        self.assertIn('ValueError', queued.last_error)
+        self.assertGreaterEqual(
+            queued.run_after,
+            before + datetime.timedelta(seconds=retry_delay(1)))
+        # not due yet
+        self.assertEqual(run_tasks(once=True), 0)
+
+    def test_long_traceback_is_recorded(self):
+        queued = enqueue('fails_at_length')
+        run_tasks(once=True, timeout=5)
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, 'q')
+        self.assertIn('x' * 200000, queued.last_error)
+
+    def test_task_fails_after_max_attempts(self):
+        queued = enqueue('always_fails')
+        Task.objects.filter(pk=queued.pk).update(max_attempts=1)
+        run_tasks(once=True)
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, 'f')
+
+    def test_backoff_doubles(self):
+        self.assertEqual(retry_delay(2), 2 * retry_delay(1))
+        self.assertEqual(retry_delay(50), taskqueue.TASK_RETRY_BACKOFF_MAX)
+
+    def test_task_timeout(self):
+        queued = enqueue('sleeps', 30)
+        started = time.monotonic()
+        run_tasks(once=True, timeout=0.2)
+        # killed, not waited for
+        self.assertLess(time.monotonic() - started, 10)
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), ('q', 1))
+        self.assertIn('Timed out', queued.last_error)
+
+    def test_no_more_tasks_claimed_than_concurrency(self):
+        first = enqueue('sleeps', 0.3)
+        second = enqueue('record_call', 'after')
+        run_tasks(once=True, concurrency=1, timeout=5)
+        for queued in (first, second):
+            queued.refresh_from_db()
+            self.assertEqual((queued.status, queued.attempts), ('d', 1))
+        self.assertEqual(calls(), ['after'])
+
+    @override_settings(EMAIL_BACKEND='catalog.mail.QueuedEmailBackend')
+    def test_email_is_sent_by_the_worker(self):
+        mail.send_mail('Password reset', 'Body', 'library@example.com',
+                       ['patron@example.com'])
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(Task.objects.filter(name='send_email').count(), 1)
+        run_tasks(once=True)
+        sent, = self.outbox()
+        self.assertEqual(sent['Subject'], 'Password reset')
+        self.assertEqual(sent['To'], 'patron@example.com')
+
+    @override_settings(
+        TASKS_EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+    def test_email_attachments_are_serialized(self):
+        message = mail.EmailMessage('Overdue', 'Body', 'library@example.com',
+                                    ['patron@example.com'])
+        message.attach('loans.csv', 'title,due\n', 'text/csv')
+        message.attach(MIMEText('See you soon'))
+        send_email(serialize_email(message))
+        sent, = mail.outbox
+        self.assertEqual(sent.attachments[0],
+                         ('loans.csv', 'title,due\n', 'text/csv'))
+        self.assertIsInstance(sent.attachments[1], MIMEBase)
+        self.assertEqual(sent.attachments[1].get_payload(), 'See you soon')
+        self.assertIn('See you soon', sent.message().as_string())
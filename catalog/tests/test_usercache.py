@@ -0,0 +1,131 @@
+from django.test import TestCase, override_settings
+from django.contrib.auth.models import Group, Permission, User
+from django.core.exceptions import ImproperlyConfigured
+from django.core.urlresolvers import reverse
+import datetime
+from catalog.models import Book
+from catalog.tests.factories import CacheIsolationMixin, create_book, \
+    create_copies, create_users
+from catalog.usercache import CACHED_PERMISSIONS_BACKEND, \
+    CACHED_SESSION_ENGINE, check_shared_cache
+
+
+class UserCacheTest(CacheIsolationMixin, TestCase):
+    shared_cache = True
+    # queries of the my-borrowed page once the caches are warm: the user
+    # only, sessions, permissions and loans coming from the cache
+    warm_dashboard_queries = 1
+    # queries of a has_perm() check on a freshly loaded user
+    permission_check_queries = 1
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.patron, cls.other = create_users('patron', 'other')
+        cls.book = create_book()
+        due_back = datetime.date.today() + datetime.timedelta(days=7)
+        cls.copies = create_copies(cls.book, 3, status='o',
+                                   borrower=cls.patron, due_back=due_back)
+
+    def setUp(self):
+        super(UserCacheTest, self).setUp()
+        self.client.login(username='patron', password='12345')
+
+    def test_dashboard_queries_on_warm_cache(self):
+        self.client.get(reverse('my-borrowed'))
+        with self.assertNumQueries(self.warm_dashboard_queries):
+            resp = self.client.get(reverse('my-borrowed'))
+        self.assertEqual(len(resp.context['bookinstance_list']), 3)
+        self.assertContains(resp, 'Book Title')
+
+    def test_loans_invalidated_when_a_copy_changes(self):
+        self.client.get(reverse('my-borrowed'))
+        copy = self.copies[0]
+        copy.refresh_from_db()
+        copy.status = 'a'
+        copy.borrower = None
+        copy.save()
+        resp = self.client.get(reverse('my-borrowed'))
+        self.assertEqual(len(resp.context['bookinstance_list']), 2)
+        # lent to someone else
+        copy.status = 'o'
+        copy.borrower = self.other
+        copy.save()
+        self.client.login(username='other', password='12345')
+        resp = self.client.get(reverse('my-borrowed'))
+        self.assertEqual(len(resp.context['bookinstance_list']), 1)
+
+    def test_permissions_cached_and_invalidated(self):
+        self.assertFalse(User.objects.get(pk=self.patron.pk).has_perm(
+            'catalog.can_mark_returned'))
+        with self.assertNumQueries(self.permission_check_queries):
+            self.assertFalse(User.objects.get(pk=self.patron.pk).has_perm(
+                'catalog.can_mark_returned'))
+        group = Group.objects.create(name='Librarians')
+        group.permissions.add(Permission.objects.get(
+            codename='can_mark_returned'))
+        self.patron.groups.add(group)
+        self.assertTrue(User.objects.get(pk=self.patron.pk).has_perm(
+            'catalog.can_mark_returned'))
+        group.delete()
+        self.assertFalse(User.objects.get(pk=self.patron.pk).has_perm(
+            'catalog.can_mark_returned'))
+
+    def test_cached_permissions_invalidated(self):
+        # CachedPermissionsBackend in either mode: with a per-process cache
+        # the changes still reach the sets cached by the process
+        def can_mark_returned():
+            return User.objects.get(pk=self.patron.pk).has_perm(
+                'catalog.can_mark_returned')
+
+        permission = Permission.objects.get(codename='can_mark_returned')
+        with override_settings(
+                AUTHENTICATION_BACKENDS=[CACHED_PERMISSIONS_BACKEND]):
+            self.assertFalse(can_mark_returned())
+            with self.assertNumQueries(1):
+                self.assertFalse(can_mark_returned())
+            self.patron.user_permissions.add(permission)
+            self.assertTrue(can_mark_returned())
+            self.patron.user_permissions.remove(permission)
+            self.assertFalse(can_mark_returned())
+            group = Group.objects.create(name='Librarians')
+            group.permissions.add(permission)
+            self.patron.groups.add(group)
+            self.assertTrue(can_mark_returned())
+            group.permissions.clear()
+            self.assertFalse(can_mark_returned())
+
+    def test_loans_invalidated_when_their_book_changes(self):
+        self.client.get(reverse('my-borrowed'))
+        book = Book.objects.get(pk=self.book.pk)
+        book.title = 'New Title'
+        book.save()
+        resp = self.client.get(reverse('my-borrowed'))
+        self.assertContains(resp, 'New Title')
+
+    def test_cached_sessions_and_permissions_need_a_shared_cache(self):
+        # the settings of either mode pass
+        check_shared_cache()
+        with override_settings(
+                SHARED_CACHE=False, SESSION_ENGINE=CACHED_SESSION_ENGINE,
+                AUTHENTICATION_BACKENDS=[CACHED_PERMISSIONS_BACKEND]):
+            with self.assertRaises(ImproperlyConfigured):
+                check_shared_cache()
+            with override_settings(
+                    SESSION_ENGINE='django.contrib.sessions.backends.db'):
+                with self.assertRaises(ImproperlyConfigured):
+                    check_shared_cache()
+                with override_settings(AUTHENTICATION_BACKENDS=[
+                        'django.contrib.auth.backends.ModelBackend']):
+                    check_shared_cache()
+
+
+class PerProcessUserCacheTest(UserCacheTest):
+    '''
+    The same with a per-process cache, which nothing is cached in
+    '''
+    shared_cache = False
+    # the session, the user, the loans, and the user and group
+    # permissions of the menu
+    warm_dashboard_queries = 5
+    # the user, and the user and group permissions
+    permission_check_queries = 3
@@ -1,14 +1,11 @@
 from django.test import TestCase
 from catalog.models import Author
 from django.core.urlresolvers import reverse
-from django.utils import timezone
 import datetime
-from catalog.models import BookInstance, Book, Genre, Language
+from catalog.models import BookInstance
 from catalog.views import AuthorCreate
-# required to assign a user object as a borrower
-from django.contrib.auth.models import User
-# required to grant the permission needed to set a book as returned
-from django.contrib.auth.models import Permission
+from catalog.tests.factories import CacheIsolationMixin, create_book, \
+    create_copies, create_users
 
 class AuthorListViewTest(TestCase):
     num_of_authors_per_page = 10
@@ -50,43 +47,39 @@ class AuthorListViewTest(TestCase):
                         num_of_authors_left)
 
 
-class LoanedBookInstancesByUserListViewTest(TestCase):
-
-    def setUp(self):
-        test_user1 = User.objects.create_user(username='testuser1',
-                                              password='12345')
-        test_user1.save()
-        test_user2 = User.objects.create_user(username='testuser2',
-                                              password='12345')
-        test_user2.save()
-
-        # create a book
-        test_author = Author.objects.create(first_name='John',
-                                            last_name='Smith')
-        test_genre = Genre.objects.create(name='Fantasy')
-        test_language = Language.objects.create(language='English')
-        test_book = Book.objects.create(title='Book Title',
-                                        summary='My book summary',
-                                        isbn='ABCDEFG', author=test_author,
-                                        publication_language=test_language)
-        # create genre as a post-step
-        genre_objects_for_book = Genre.objects.all()
-        test_book.genre = genre_objects_for_book
-        test_book.save()
+class IndexViewTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        test_book = create_book(author=None, genres=(), language=None)
+        statuses = ('a', 'a', 'o', 'm')
+        create_copies(test_book, len(statuses),
+                      status=lambda num: statuses[num])
+
+    def test_copy_counts(self):
+        resp = self.client.get(reverse('index'))
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.context['num_books'], 1)
+        self.assertEqual(resp.context['num_instances'], 4)
+        self.assertEqual(resp.context['num_instances_available'], 2)
+
+
+class LoanedBookInstancesByUserListViewTest(CacheIsolationMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        test_user1, test_user2 = create_users('testuser1', 'testuser2')
+        test_book = create_book()
 
         # create 30 BookInstance objects
         num_of_copies = 30
-        for copy_of_book in range(num_of_copies):
-            return_date = timezone.now() + datetime.timedelta(
-                days=copy_of_book % 5)
-            if copy_of_book % 2:
-                the_borrower = test_user1
-            else:
-                the_borrower = test_user2
-            status = 'm'
-            BookInstance.objects.create(
-                book=test_book, imprint='Unlikely Imprint, 2016',
-                due_back=return_date, borrower=the_borrower, status=status)
+        create_copies(
+            test_book, num_of_copies,
+            due_back=lambda copy_of_book: datetime.date.today() +
+            datetime.timedelta(days=copy_of_book % 5),
+            borrower=lambda copy_of_book: test_user1 if copy_of_book % 2
+            else test_user2,
+            status='m')
 
     def test_redirect_if_not_logged_in(self):
         resp = self.client.get(reverse('my-borrowed'))
@@ -146,43 +139,27 @@ class LoanedBookInstancesByUserListViewTest(TestCase):
                 self.assertTrue(last_date <= copy.due_back)
 
 
+class SharedCacheLoanedBookInstancesByUserListViewTest(
+        LoanedBookInstancesByUserListViewTest):
+    # loan lists are cached
+    shared_cache = True
+
+
 class RenewBookInstancesViewTest(TestCase):
 
-    def setUp(self):
-        test_user1 = User.objects.create_user(username='test',
-                                              password='12345')
-        test_user1.save()
-        test_user2 = User.objects.create_user(username='testuser2',
-                                              password='12345')
-        test_user2.save()
-        permission = Permission.objects.get(name='Set book as returned')
-        test_user2.user_permissions.add(permission)
-        test_user2.save()
-
-        test_author = Author.objects.create(first_name='John',
-                                            last_name='Smith')
-        test_genre = Genre.objects.create(name='Fantasy')
-        test_language = Language.objects.create(language='English')
-        test_book = Book.objects.create(title='Book Title',
-                                        summary='My book summary',
-                                        isbn='ABCDEFG', author=test_author,
-                                        publication_language=test_language)
-        # create genre as a post-step
-        genre_objects_for_book = Genre.objects.all()
-        test_book.genre = genre_objects_for_book
-        test_book.save()
-
-        # create a BookInstance object for test_user1
-        return_date = datetime.date.today() + datetime.timedelta(days=5)
-        self.test_bookinstance1 = BookInstance.objects.create(
-            book=test_book, imprint='Unlikely Imprint, 2016',
-            due_back=return_date, borrower=test_user1, status='o')
+    @classmethod
+    def setUpTestData(cls):
+        test_user1, = create_users('test')
+        test_user2, = create_users('testuser2',
+                                   permissions=['Set book as returned'])
+        test_book = create_book()
 
-        # create a BookInstance object for test_user2
+        # create a BookInstance object for each user
         return_date = datetime.date.today() + datetime.timedelta(days=5)
-        self.test_bookinstance2 = BookInstance.objects.create(
-            book=test_book, imprint='Unlikely Imprint, 2016',
-            due_back=return_date, borrower=test_user2, status='o')
+        cls.test_bookinstance1, = create_copies(
+            test_book, due_back=return_date, borrower=test_user1, status='o')
+        cls.test_bookinstance2, = create_copies(
+            test_book, due_back=return_date, borrower=test_user2, status='o')
 
     def test_redirect_if_not_logged_in(self):
         resp = self.client.get(
@@ -285,16 +262,10 @@ class RenewBookInstancesViewTest(TestCase):
 class AuthorCreateViewTest(TestCase):
     redirection_url = '/accounts/login/?next=/catalog/author/create/'
 
-    def setUp(self):
-        test_user1 = User.objects.create_user(username='testuser1',
-                                              password='12345')
-        test_user1.save()
-        test_user2 = User.objects.create_user(username='testuser2',
-                                              password='12345')
-        test_user2.save()
-        permission = Permission.objects.get(name='Set book as returned')
-        test_user2.user_permissions.add(permission)
-        test_user2.save()
+    @classmethod
+    def setUpTestData(cls):
+        create_users('testuser1')
+        create_users('testuser2', permissions=['Set book as returned'])
 
     def make_a_get_request(self, view_name='author_create'):
         response = self.client.get(reverse(view_name))
@@ -15,6 +15,14 @@ urlpatterns = [
         name='all-borrowed'),
     url(r'^book/(?P<pk>[-\w]+)/renew/$', views.renew_book_librarian,
         name='renew-book-librarian'),
+    url(r'^book/(?P<pk>\d+)/hold/$', views.place_hold_view,
+        name='book-hold'),
+    url(r'^scan/$', views.scan_copies, name='scan-copies'),
+    url(r'^isbn/$', views.isbn_batch_lookup, name='isbn-batch'),
+    url(r'^isbn/(?P<isbn>[\dXx -]+)/$', views.isbn_lookup,
+        name='isbn-lookup'),
+    url(r'^autocomplete/(?P<kind>author|book)/$', views.autocomplete_view,
+        name='autocomplete'),
     url(r'^author/create/$', views.AuthorCreate.as_view(),
         name='author_create'),
     url(r'^author/(?P<pk>\d+)/update/$', views.AuthorUpdate.as_view(),
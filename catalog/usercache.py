@@ -0,0 +1,167 @@
+'''
+Per-user caches: the copies a patron has on loan and the permission set
+of a user.
+
+They are only correct when every process (web workers, run_tasks) shares
+the cache, so they are turned on by settings.SHARED_CACHE; without it
+get_loans() reads the database every time, and check_shared_cache() stops
+start-up when cached sessions or CachedPermissionsBackend are configured
+anyway.
+
+Cache keys embed a version number that is itself kept in the cache.
+Invalidating bumps the version rather than deleting entries, so it is a
+single cache.incr() whatever the number of cached entries (e.g. every
+user's permissions after a group change); entries under old versions just
+expire. Versions start from the clock, so one lost to eviction is never
+handed out again.
+'''
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+
+from .models import BookInstance
+
+LOAN_CACHE_TIMEOUT = getattr(settings, 'LOAN_CACHE_TIMEOUT', 60 * 60)
+PERMISSION_CACHE_TIMEOUT = getattr(settings, 'PERMISSION_CACHE_TIMEOUT',
+                                   60 * 60)
+CACHED_SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+CACHED_PERMISSIONS_BACKEND = 'catalog.backends.CachedPermissionsBackend'
+
+
+def shared_cache():
+    '''
+    :return: whether the default cache is shared by every process
+    '''
+    return getattr(settings, 'SHARED_CACHE', False)
+
+
+def check_shared_cache():
+    '''
+    Called on start-up: a session or permission set cached in a single
+    process would survive a logout or a revoked permission in the others
+    :raises ImproperlyConfigured:
+    '''
+    if shared_cache():
+        return
+    if settings.SESSION_ENGINE == CACHED_SESSION_ENGINE:
+        raise ImproperlyConfigured(
+            'SESSION_ENGINE %s needs a cache shared by every process '
+            '(SHARED_CACHE)' % CACHED_SESSION_ENGINE)
+    if CACHED_PERMISSIONS_BACKEND in settings.AUTHENTICATION_BACKENDS:
+        raise ImproperlyConfigured(
+            '%s needs a cache shared by every process (SHARED_CACHE)'
+            % CACHED_PERMISSIONS_BACKEND)
+
+
+def _version_key(name):
+    return 'catalog:version:%s' % name
+
+
+def get_version(name):
+    '''
+    Returns the current version of a family of cache keys
+    :param name:
+    :return:
+    '''
+    key = _version_key(name)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, int(time.time() * 1000), None)
+        version = cache.get(key, 0)
+    return version
+
+
+def incr_version(name):
+    '''
+    Invalidates every key of a family
+    :param name:
+    :return: the new version, None when there was none (get_version()
+    starts a new one)
+    '''
+    try:
+        return cache.incr(_version_key(name))
+    except ValueError:
+        return None
+
+
+def bump_version(name):
+    '''
+    Invalidates every key of a family, now and again when the current
+    transaction commits (a concurrent request may have cached data it
+    could not see yet in between)
+    :param name:
+    :return:
+    '''
+    incr_version(name)
+    transaction.on_commit(lambda: incr_version(name))
+
+
+def get_loans(user):
+    '''
+    Returns the copies on loan to a user, with their books, ordered by due
+    date
+    :param user:
+    :return: list of BookInstances
+    '''
+    if not shared_cache():
+        return list(_loans_of(user))
+    key = 'catalog:loans:%s:%s' % (user.pk, get_version('loans:%s' % user.pk))
+    loans = cache.get(key)
+    if loans is None:
+        loans = list(_loans_of(user))
+        cache.set(key, loans, LOAN_CACHE_TIMEOUT)
+    return loans
+
+
+def _loans_of(user):
+    return BookInstance.objects.filter(borrower=user, status='o') \
+        .select_related('book').order_by('due_back')
+
+
+def invalidate_loans(user_ids):
+    '''
+    Called when copies borrowed by (or returned from) users change
+    :param user_ids: ids of the borrowers, None is ignored
+    :return:
+    '''
+    for user_id in set(user_ids) - {None}:
+        bump_version('loans:%s' % user_id)
+
+
+def invalidate_book_loans(book_ids):
+    '''
+    Called when books are changed or deleted: cached loans embed them
+    :param book_ids:
+    :return:
+    '''
+    if shared_cache():
+        invalidate_loans(BookInstance.objects.filter(
+            book_id__in=book_ids, status='o').values_list(
+            'borrower_id', flat=True).distinct())
+
+
+def get_permissions(user, compute):
+    '''
+    Returns the cached permission set of a user
+    :param user:
+    :param compute: called on a cache miss to get the permissions
+    :return: set of "app_label.codename" strings
+    '''
+    key = 'catalog:permissions:%s:%s' % (get_version('permissions'), user.pk)
+    permissions = cache.get(key)
+    if permissions is None:
+        permissions = compute()
+        cache.set(key, permissions, PERMISSION_CACHE_TIMEOUT)
+    return permissions
+
+
+def invalidate_permissions():
+    '''
+    Called when any permission or group assignment changes: a group
+    change affects all of its members, so every user's set is dropped
+    :return:
+    '''
+    bump_version('permissions')
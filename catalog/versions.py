@@ -0,0 +1,57 @@
+'''
+Version numbers of data that every process keeps a copy of in memory
+(the autocomplete indexes, the branches, the rankings), stored in the
+Sequence table so that web workers, run_tasks and management commands all
+see the same ones whatever the cache backend.
+
+A SharedVersion reads the stored number at most once every
+VERSION_CHECK_INTERVAL seconds, so a change made by another process is
+picked up within that delay at the cost of one indexed query per interval.
+'''
+import time
+
+from django.conf import settings
+
+from .barcodes import next_values
+from .models import Sequence
+
+VERSION_CHECK_INTERVAL = getattr(settings, 'VERSION_CHECK_INTERVAL', 1.0)
+
+
+class SharedVersion(object):
+    '''
+    The stored version of a family of data
+    '''
+
+    def __init__(self, name):
+        self.name = 'version:' + name
+        self.checked = None
+        self.value = None
+
+    def current(self):
+        '''
+        :return: the stored version, read again once VERSION_CHECK_INTERVAL
+        has passed since the last read
+        '''
+        now = time.monotonic()
+        if self.checked is None or now - self.checked >= \
+                VERSION_CHECK_INTERVAL:
+            self.value = Sequence.objects.filter(name=self.name).values_list(
+                'value', flat=True).first() or 0
+            self.checked = now
+        return self.value
+
+    def bump(self):
+        '''
+        Increments the stored version
+        :return: the new version
+        '''
+        value, = next_values(self.name)
+        self.value, self.checked = value, time.monotonic()
+        return value
+
+    def expire(self):
+        '''
+        Makes the next current() read the stored version
+        '''
+        self.checked = None
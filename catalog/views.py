@@ -5,13 +5,24 @@ from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.mixins import PermissionRequiredMixin
 from django.contrib.auth.decorators import permission_required
 from django.shortcuts import get_object_or_404
-from django.http import HttpResponseRedirect
+from django.http import HttpResponseRedirect, JsonResponse
 from django.core.urlresolvers import reverse
-from .forms import RenewBookForm
-from .models import Author
+from .forms import BookForm, RenewBookForm
+from .barcodes import BARCODE_LENGTH, SCAN_BATCH_SIZE, scan
+from .holds import place_hold
+from .isbn import InvalidISBN, normalize as normalize_isbn
+from .rankings import get_ranking
+from . import autocomplete, facets, usercache
+from .paginators import PrecountedPaginator
+from django.contrib.auth.decorators import login_required
+from django.contrib.auth.models import User
+from django.views.decorators.http import require_POST
 from django.views.generic.edit import CreateView, UpdateView, DeleteView
+from django.forms import modelform_factory
 from django.urls import reverse_lazy
+from django.db.models import Case, Count, When
 import datetime
+import json
 
 
 # Create your views here.
@@ -24,10 +35,14 @@ def index(request):
     word_of_the_day = 'revolution'
     # generate counts of some of the main objects
     num_books = Book.objects.all().count()
-    num_instances = BookInstance.objects.all().count()
-    # available books (status = 'a')
-    num_instances_available = BookInstance.objects.filter(
-        status__exact='a').count()
+    # all copies and available copies (status = 'a') in a single table scan,
+    # of the current branch only
+    copies = BookInstance.scoped.aggregate(
+        num_instances=Count('id'),
+        num_instances_available=Count(Case(When(status__exact='a',
+                                                then=1))))
+    num_instances = copies['num_instances']
+    num_instances_available = copies['num_instances_available']
     num_authors = Author.objects.count()  # the 'all()' is implied by default
     num_genres = Genre.objects.count()
     titles_with_word_of_day = list(Book.objects.filter(
@@ -44,17 +59,57 @@ def index(request):
         'num_authors': num_authors, 'num_genres': num_genres,
         'word_of_the_day': word_of_the_day,
         'titles_with_word_of_day': titles_with_word_of_day, 'num_visits':
-            num_visits},)
+            num_visits,
+        'popular_books': get_ranking('book', 30),
+        'trending_genres': get_ranking('genre', 7)},)
 
 
 class BookListView(generic.ListView):
+    '''
+    Generic class-based view listing books, filtered by the genre,
+    language, author and availability facets given in the query string
+    '''
     model = Book
     paginate_by = 5
+    paginator_class = PrecountedPaginator
+
+    def get_queryset(self):
+        self.selected_filters = facets.selected_filters(self.request.GET)
+        # availability is that of the branch of the request, like the
+        # copy counts of the index page
+        self.branch = getattr(self.request, 'branch', None)
+        return facets.filter_books(Book.objects.order_by('pk'),
+                                   self.selected_filters, self.branch)
+
+    def get_paginator(self, queryset, per_page, **kwargs):
+        # the facet counts give the size of unfiltered and single-filter
+        # lists
+        return super(BookListView, self).get_paginator(
+            queryset, per_page,
+            count=facets.known_count(self.selected_filters, self.branch),
+            **kwargs)
+
+    def get_context_data(self, **kwargs):
+        context = super(BookListView, self).get_context_data(**kwargs)
+        context['popular_books'] = get_ranking('book', 30)
+        context['facets'] = facets.facet_values(self.selected_filters,
+                                                self.request.GET, self.branch)
+        query = self.request.GET.copy()
+        query.pop('page', None)
+        context['filter_querystring'] = query.urlencode()
+        return context
 
 
 class BookDetailView(generic.DetailView):
     model = Book
 
+    def get_context_data(self, **kwargs):
+        context = super(BookDetailView, self).get_context_data(**kwargs)
+        # withdrawn copies stay listed once archived
+        context['copies'] = BookInstance.scoped.filter(
+            book=self.object).include_archived()
+        return context
+
 
 class AuthorListView(generic.ListView):
     model = Author
@@ -74,12 +129,12 @@ class LoanedBooksByUserListView(LoginRequiredMixin, generic.ListView):
     '''
     model = BookInstance
     template_name = 'catalog/bookinstance_list_borrowed_user.html'
+    context_object_name = 'bookinstance_list'
     paginate_by = 10
 
     def get_queryset(self):
-        return BookInstance.objects.filter(
-            borrower=self.request.user).filter(status__exact='o').order_by(
-            'due_back')
+        # a cached list: no query, and no COUNT to paginate it
+        return usercache.get_loans(self.request.user)
 
 
 class AllLoanedBooksListView(PermissionRequiredMixin, generic.ListView):
@@ -92,7 +147,7 @@ class AllLoanedBooksListView(PermissionRequiredMixin, generic.ListView):
     paginate_by = 10
 
     def get_queryset(self):
-        return BookInstance.objects.filter(status__exact='o').exclude(
+        return BookInstance.scoped.filter(status__exact='o').exclude(
             borrower=None).order_by('due_back')
 
 
@@ -104,7 +159,11 @@ def renew_book_librarian(request, pk):
     :param pk:
     :return:
     '''
-    book_inst = get_object_or_404(BookInstance, pk=pk)
+    if len(pk) == BARCODE_LENGTH and pk.isdigit():
+        # scanned from the label on the copy
+        book_inst = get_object_or_404(BookInstance, barcode=pk)
+    else:
+        book_inst = get_object_or_404(BookInstance, pk=pk)
 
     # if this is a POST request, then process the form data
     if request.method == 'POST':
@@ -129,6 +188,156 @@ def renew_book_librarian(request, pk):
         'form': form, 'bookinst': book_inst})
 
 
+@login_required
+@require_POST
+def place_hold_view(request, pk):
+    '''
+    View function for a patron joining the reservation queue of a book
+    :param request:
+    :param pk:
+    :return:
+    '''
+    book = get_object_or_404(Book, pk=pk)
+    place_hold(book, request.user)
+    return HttpResponseRedirect(book.get_absolute_url())
+
+
+@permission_required('catalog.can_mark_returned')
+@require_POST
+def scan_copies(request):
+    '''
+    View function for librarians checking a batch of scanned copies in or
+    out. Expects a JSON body: {"action": "in" or "out", "barcodes": [...],
+    "borrower": username, for "out"}
+    :param request:
+    :return: JSON results, in scan order
+    '''
+    try:
+        data = json.loads(request.body.decode('utf-8'))
+        action, scanned = data['action'], list(data['barcodes'])
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'Expected a JSON object with "action" '
+                                      'and "barcodes"'}, status=400)
+    if not all(isinstance(barcode, str) for barcode in scanned):
+        return JsonResponse({'error': 'Barcodes must be strings'},
+                            status=400)
+    if len(scanned) > SCAN_BATCH_SIZE:
+        return JsonResponse({'error': 'At most %d barcodes per request'
+                                      % SCAN_BATCH_SIZE}, status=400)
+    borrower = None
+    if action == 'out':
+        borrower = User.objects.filter(username=data.get('borrower'),
+                                       is_active=True).first()
+        if borrower is None:
+            return JsonResponse({'error': 'Unknown borrower'}, status=400)
+    try:
+        results = scan(action, scanned, borrower,
+                       branch=getattr(request, 'branch', None))
+    except ValueError as error:
+        return JsonResponse({'error': str(error)}, status=400)
+    return JsonResponse({'results': results})
+
+
+# most ISBNs resolved by one batch request
+ISBN_BATCH_SIZE = 100
+
+
+def resolve_isbns(isbns):
+    '''
+    Looks books up by canonical ISBN, then their available copies, in two
+    queries whatever the number of ISBNs and copies
+    :param isbns: canonical ISBN-13s
+    :return: dict of ISBN to book data
+    '''
+    books, by_pk = {}, {}
+    for pk, isbn13, title, first_name, last_name in Book.objects.filter(
+            isbn13__in=isbns).values_list(
+            'pk', 'isbn13', 'title', 'author__first_name',
+            'author__last_name'):
+        books[isbn13] = by_pk[pk] = {
+            'id': pk,
+            'title': title,
+            'author': '%s, %s' % (last_name, first_name)
+            if last_name is not None else None,
+            'url': reverse('book-detail', args=[pk]),
+            'available_copies': [],
+        }
+    if by_pk:
+        # only the available copies are read, not every copy of the books
+        for book_id, copy_id, imprint in BookInstance.objects.filter(
+                book_id__in=by_pk, status='a').order_by(
+                'book_id', 'id').values_list('book_id', 'id', 'imprint'):
+            by_pk[book_id]['available_copies'].append(
+                {'id': str(copy_id), 'imprint': imprint})
+    return books
+
+
+def isbn_lookup(request, isbn):
+    '''
+    View function resolving a scanned ISBN (10 or 13 digits, hyphens
+    allowed) to its book and available copies, as JSON
+    :param request:
+    :param isbn:
+    :return:
+    '''
+    try:
+        isbn = normalize_isbn(isbn)
+    except InvalidISBN as error:
+        return JsonResponse({'error': str(error)}, status=400)
+    book = resolve_isbns([isbn]).get(isbn)
+    if book is None:
+        return JsonResponse({'error': 'No book with ISBN %s' % isbn},
+                            status=404)
+    return JsonResponse({'isbn': isbn, 'book': book})
+
+
+def isbn_batch_lookup(request):
+    '''
+    View function resolving a whole cart of scanned ISBNs, given as
+    repeated "isbn" query parameters, with two queries
+    :param request:
+    :return: JSON results in the order of the scanned ISBNs
+    '''
+    scanned = request.GET.getlist('isbn')
+    if len(scanned) > ISBN_BATCH_SIZE:
+        return JsonResponse({'error': 'At most %d ISBNs per request'
+                                      % ISBN_BATCH_SIZE}, status=400)
+    results = []
+    for value in scanned:
+        try:
+            results.append({'query': value, 'isbn': normalize_isbn(value)})
+        except InvalidISBN as error:
+            results.append({'query': value, 'isbn': None,
+                            'error': str(error)})
+    books = resolve_isbns({result['isbn'] for result in results
+                           if result['isbn']})
+    for result in results:
+        if result['isbn']:
+            result['book'] = books.get(result['isbn'])
+            if result['book'] is None:
+                result['error'] = 'No book with ISBN %s' % result['isbn']
+    return JsonResponse({'results': results})
+
+
+def autocomplete_view(request, kind):
+    '''
+    Authors or books whose name starts with the "q" GET parameter, as JSON
+    (used by the AutocompleteSelect widget)
+    :param request:
+    :param kind: 'author' or 'book'
+    :return:
+    '''
+    prefix = request.GET.get('q', '').strip()
+    try:
+        limit = int(request.GET.get('limit', autocomplete.MAX_RESULTS))
+    except ValueError:
+        limit = autocomplete.MAX_RESULTS
+    results = autocomplete.search(kind, prefix, max(limit, 1)) \
+        if prefix else []
+    return JsonResponse({'results': [{'id': pk, 'text': label}
+                                     for pk, label in results]})
+
+
 class AuthorModelManipulator(PermissionRequiredMixin):
     model = Author
     permission_required = 'catalog.can_mark_returned'
@@ -156,11 +365,12 @@ class BookModelView(PermissionRequiredMixin):
 
 
 class BookCreate(BookModelView, CreateView):
-    fields = '__all__'
+    form_class = BookForm
 
 
 class BookUpdate(BookModelView, UpdateView):
-    fields = ['title', 'author', 'summary', 'genre', 'publication_language']
+    form_class = modelform_factory(Book, form=BookForm, fields=[
+        'title', 'author', 'summary', 'genre', 'publication_language'])
 
 
 class BookDelete(BookModelView, DeleteView):
@@ -0,0 +1,115 @@
+'''
+Worker warm-up: pays the one-off costs of a fresh process before the
+first request does.
+
+Run by gunicorn's post_worker_init hook (gunicorn.conf.py). warm_up()
+compiles the URL patterns and imports every view they point to, loads the
+hot templates (kept compiled by the cached template loader when DEBUG is
+off) and checks the databases. Each step is timed, so
+"manage.py profile_startup" can report what the warm-up moved out of the
+first request.
+
+Django connections belong to the thread that opened them, and the request
+threads of a gthread worker open their own, so the database step does not
+save them a connection. It imports the database driver and logs an
+unreachable database at boot, then closes its connection rather than keep
+it idle for the life of the worker. A failing step does not stop the
+worker from booting (gunicorn would shut the whole server down): its
+requests connect again on their own.
+'''
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.template.loader import get_template
+from django.urls import get_resolver
+
+# templates rendered by the most requested pages
+WARMUP_TEMPLATES = getattr(settings, 'WARMUP_TEMPLATES', (
+    'base_generic.html',
+    'index.html',
+    'catalog/book_list.html',
+    'catalog/book_detail.html',
+    'catalog/author_list.html',
+    'catalog/author_detail.html',
+    'catalog/bookinstance_list_borrowed_user.html',
+    'registration/login.html',
+))
+# aliases of the databases to connect to, all of them by default
+WARMUP_DATABASES = getattr(settings, 'WARMUP_DATABASES', None)
+
+
+def compile_urls():
+    '''
+    Populates the root URL resolver and its included resolvers, which
+    compiles every pattern and imports every view
+    :return: number of URL patterns
+    '''
+    def populate(resolver):
+        count = 0
+        # reverse_dict populates the resolver, compiling the patterns
+        resolver.reverse_dict
+        for pattern in resolver.url_patterns:
+            pattern.regex
+            if hasattr(pattern, 'url_patterns'):
+                count += populate(pattern)
+            else:
+                count += 1
+        return count
+    return populate(get_resolver())
+
+
+def load_templates(names=None):
+    '''
+    :param names: template names, defaults to WARMUP_TEMPLATES
+    :return: number of templates loaded
+    '''
+    names = WARMUP_TEMPLATES if names is None else names
+    for name in names:
+        get_template(name)
+    return len(names)
+
+
+def check_databases(aliases=None):
+    '''
+    Connects to each database and closes the connection again
+    :param aliases: defaults to WARMUP_DATABASES, or every database
+    :return: number of databases checked
+    '''
+    aliases = aliases or WARMUP_DATABASES or list(connections)
+    for alias in aliases:
+        connections[alias].ensure_connection()
+        connections[alias].close()
+    return len(aliases)
+
+
+STEPS = (
+    ('urls', compile_urls),
+    ('templates', load_templates),
+    ('databases', check_databases),
+)
+
+
+def warm_up(steps=None, on_error=None):
+    '''
+    Runs the warm-up steps
+    :param steps: names of the steps to run, defaults to all of STEPS
+    :param on_error: optional callable taking the name of a step and the
+    exception it raised, called from the except block; the remaining steps
+    still run. Without it the exception propagates.
+    :return: list of (step, count, seconds) of the steps that succeeded
+    '''
+    timings = []
+    for name, step in STEPS:
+        if steps is not None and name not in steps:
+            continue
+        start = time.perf_counter()
+        try:
+            count = step()
+        except Exception as error:
+            if on_error is None:
+                raise
+            on_error(name, error)
+            continue
+        timings.append((name, count, time.perf_counter() - start))
+    return timings
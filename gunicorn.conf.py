@@ -0,0 +1,33 @@
+'''
+Gunicorn configuration, used as: gunicorn locallibrary.wsgi -c gunicorn.conf.py
+'''
+import os
+
+# Heroku sets WEB_CONCURRENCY according to the dyno size
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+
+# threaded workers: a slow request (waiting on the database, the network,
+# etc.) only holds one thread instead of a whole worker process
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+# pay for URL compilation and template loading at worker boot rather than
+# on the first request, and check that the database is reachable (see
+# catalog/warmup.py); GUNICORN_WARM_UP=0 turns it off
+warm_up = os.environ.get('GUNICORN_WARM_UP', '1') != '0'
+
+
+def post_worker_init(worker):
+    if not warm_up:
+        return
+    from catalog.warmup import warm_up as run_warm_up
+
+    def failed(step, error):
+        # an exception raised here is a worker boot error, which makes
+        # gunicorn shut down every worker: log it and let the requests
+        # try again
+        worker.log.exception('Warm-up: %s failed', step)
+
+    for step, count, seconds in run_warm_up(on_error=failed):
+        worker.log.info('Warm-up: %s (%d) in %.1f ms', step, count,
+                        seconds * 1000)
@@ -50,6 +50,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware', #Associates users with requests using sessions
+    'catalog.branches.BranchMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -85,6 +86,62 @@ DATABASES = {
     }
 }
 
+# SQLite performance profile applied to every new SQLite connection (see
+# catalog/sqlite.py). Set DJANGO_SQLITE_TUNING=0 to use the SQLite defaults.
+SQLITE_TUNING = os.environ.get('DJANGO_SQLITE_TUNING', '1') != '0'
+SQLITE_PRAGMAS = {
+    # readers no longer block behind a writer (and vice versa)
+    'journal_mode': 'WAL',
+    # safe with WAL: fsync on checkpoint instead of on every commit
+    'synchronous': 'NORMAL',
+    # 256 MiB memory-mapped I/O for reads
+    'mmap_size': 268435456,
+    # negative values are in KiB, i.e. a 64 MiB page cache per connection
+    'cache_size': -65536,
+    # wait up to 5s for a lock instead of raising "database is locked"
+    'busy_timeout': 5000,
+    'temp_store': 'MEMORY',
+}
+
+# BookInstance primary keys are time-ordered UUIDs (see
+# catalog.models.new_copy_id). Set DJANGO_TIME_ORDERED_COPY_IDS=0 for random
+# (version 4) UUIDs.
+TIME_ORDERED_COPY_IDS = os.environ.get(
+    'DJANGO_TIME_ORDERED_COPY_IDS', '1') != '0'
+
+# Library branches (see catalog/branches.py): the code of the branch of
+# requests that did not choose one
+DEFAULT_BRANCH = os.environ.get('DJANGO_DEFAULT_BRANCH') or None
+
+
+# Caching
+# https://docs.djangoproject.com/en/1.11/topics/cache/
+# a shared cache (e.g. memcached) keeps cached data consistent across
+# gunicorn workers and the run_tasks process
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get(
+            'DJANGO_CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('DJANGO_CACHE_LOCATION', ''),
+    }
+}
+
+# whether every process uses the same cache: the local memory and dummy
+# caches are per process, so the caches below stay off with them
+SHARED_CACHE = CACHES['default']['BACKEND'] not in (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache')
+
+if SHARED_CACHE:
+    # sessions are read from the cache, falling back to (and written
+    # through to) the database
+    SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+    # permission sets and loan lists are cached per user (see
+    # catalog/usercache.py)
+    AUTHENTICATION_BACKENDS = ['catalog.backends.CachedPermissionsBackend']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/1.11/ref/settings/#auth-password-validators
@@ -132,7 +189,12 @@ STATIC_URL = '/static/'
 # /accounts/profile/)
 LOGIN_REDIRECT_URL = '/'
 
-EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+# email is queued as a background task (see catalog/taskqueue.py) and
+# delivered by "manage.py run_tasks" through TASKS_EMAIL_BACKEND
+EMAIL_BACKEND = 'catalog.mail.QueuedEmailBackend'
+TASKS_EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+# seconds an SMTP connection may block a send_email task
+EMAIL_TIMEOUT = 30
 
 # Heroku: update DB configuration from $DATABASE_URL
 import dj_database_url
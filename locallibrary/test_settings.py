@@ -0,0 +1,36 @@
+"""
+Django settings for running the test suite: "manage.py test" uses them by
+default (see manage.py).
+
+In-memory SQLite, whatever $DATABASE_URL says, so the suite can also run in
+parallel ("manage.py test --parallel", each worker forks its own copy of the
+test database), a fast password hasher and plain static files storage, so
+templates render without running collectstatic first.
+"""
+from .settings import *  # noqa: F401,F403
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': ':memory:',
+    }
+}
+
+# a per-process cache, so parallel workers never see each other's entries,
+# with the settings settings.py picks for one whatever
+# $DJANGO_CACHE_BACKEND says; the tests of the per-user caches run with a
+# cache of their own, in both modes (CacheIsolationMixin in
+# catalog/tests/factories.py)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+SHARED_CACHE = False
+SESSION_ENGINE = 'django.contrib.sessions.backends.db'
+AUTHENTICATION_BACKENDS = ['django.contrib.auth.backends.ModelBackend']
+
+# PBKDF2 is slow on purpose; every create_user() and login() pays for it
+PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+STATICFILES_STORAGE = 'django.contrib.staticfiles.storage.StaticFilesStorage'
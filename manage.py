@@ -3,6 +3,9 @@ import os
 import sys
 
 if __name__ == "__main__":
+    if sys.argv[1:2] == ["test"]:
+        os.environ.setdefault("DJANGO_SETTINGS_MODULE",
+                              "locallibrary.test_settings")
     os.environ.setdefault("DJANGO_SETTINGS_MODULE", "locallibrary.settings")
     try:
         from django.core.management import execute_from_command_line